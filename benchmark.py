@@ -0,0 +1,360 @@
+# benchmarks parsing, building and serializing the archives of tests/data, and compares the results to a baseline.
+# runs offline: the archives are read from the fixtures, and strings are decoded with a generated charmap
+import sys
+import os
+import gc
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import argparse
+
+import text_script_dumper as dumper
+import definitions
+
+FIXTURES_DIR = os.path.join(definitions.ROOT_DIR, 'tests', 'data')
+BASELINE_PATH = os.path.join(definitions.ROOT_DIR, 'tests', 'benchmark_baseline.json')
+
+# bumped whenever the cases or the metrics change, so that results aren't compared to an incompatible baseline
+VERSION = 1
+
+# fixtures scaled up by repeating their scripts, up to the largest archive relative pointers can address
+SYNTHETIC_FIXTURES = ('TextScriptChipDescriptions0_86eb8b8.bin', 'TextScriptWhoAmI.bin')
+SYNTHETIC_SIZE = 0x10000
+
+# metric -> whether a higher value is better
+METRICS = {
+    'parse_mb_s': True,
+    'build_mb_s': True,
+    'serialize_mb_s': True,
+    'peak_memory_kb': False,
+    'import_ms': False,
+    'startup_ms': False,
+    'ini_compile_ms': False,
+    'ini_load_ms': False,
+}
+
+# relative change of a metric past which it is a regression, by default
+THRESHOLD = 0.25
+
+# label the archives are built with, so that building doesn't depend on ModuleState.address
+LABEL = 'TextScriptBenchmark'
+
+
+class BenchmarkException(Exception): pass
+
+
+class BenchmarkCase:
+    """
+    an archive to benchmark, at an offset into its data
+    """
+    __slots__ = ('name', 'data', 'pos', 'size')
+
+    def __init__(self, name: str, data: bytes, pos: int=0, size: int=None):
+        """
+        :param name: name of the case in the results
+        :param data: the bytes the archive is parsed from
+        :param pos: offset of the archive in :data:
+        :param size: size of the archive, if it must be specified
+        """
+        self.name = name
+        self.data = data
+        self.pos = pos
+        self.size = size
+
+    def read(self, command_context: dumper.CommandContext) -> dumper.TextScriptArchive:
+        return dumper.TextScriptArchive.read_script(command_context, self.pos, self.data, self.size)
+
+    @staticmethod
+    def load_fixtures(fixtures_dir: str=FIXTURES_DIR) -> list:
+        """
+        :return: a case for every archive in :fixtures_dir:. decomp* archives were decompressed with their LZ77 header,
+            which is skipped like when dumping compressed archives
+        """
+        cases = []
+        for name in sorted(os.listdir(fixtures_dir)):
+            if not name.endswith('.bin'):
+                continue
+            with open(os.path.join(fixtures_dir, name), 'rb') as bin_file:
+                data = bin_file.read()
+            if name.startswith('decomp'):
+                cases.append(BenchmarkCase(name, data, 4, len(data) - 4))
+            else:
+                cases.append(BenchmarkCase(name, data))
+        return cases
+
+    @staticmethod
+    def scale(case: 'BenchmarkCase', command_context: dumper.CommandContext,
+              max_size: int=SYNTHETIC_SIZE) -> 'BenchmarkCase':
+        """
+        builds a larger archive out of :case: by repeating all of its scripts as many times as fit in :max_size:
+        :return: the case of the scaled up archive
+        """
+        archive = case.read(command_context)
+        data = bytes(archive.serialize())
+        table_size = 2 * len(archive.rel_pointers)
+        body = data[table_size:]
+        copies = max_size // len(data)
+        if copies < 2:
+            raise BenchmarkException('{0} is too large to scale up'.format(case.name))
+
+        rel_pointers = []
+        for copy in range(copies):
+            rel_pointers += [ptr - table_size + copies * table_size + copy * len(body) for ptr in archive.rel_pointers]
+        scaled = b''.join(ptr.to_bytes(2, 'little') for ptr in rel_pointers) + body * copies
+
+        scaled_case = BenchmarkCase('{0} x{1}'.format(case.name, copies), scaled, 0, len(scaled))
+        if bytes(scaled_case.read(command_context).serialize()) != scaled:
+            raise BenchmarkException('{0} does not serialize back to itself'.format(scaled_case.name))
+        return scaled_case
+
+    @staticmethod
+    def load(fixtures_dir: str=FIXTURES_DIR) -> list:
+        """
+        :return: the cases of the fixtures, then their synthetic scaled up archives
+        """
+        cases = BenchmarkCase.load_fixtures(fixtures_dir)
+        command_context = dumper.CommandContext()
+        cases += [BenchmarkCase.scale(case, command_context) for case in cases if case.name in SYNTHETIC_FIXTURES]
+        return cases
+
+
+def write_charmap(path: str):
+    """
+    writes a charmap with a printable character for every byte, standing in for the charmap of the bn6f repository
+    """
+    chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    with open(path, 'w', encoding='utf-8') as f:
+        for byte in range(0xE5):
+            f.write('{0:02X}={1}\n'.format(byte, chars[byte % len(chars)]))
+        for byte in range(0x100):
+            f.write('E4{0:02X}={1}{2}\n'.format(byte, chars[byte // len(chars)], chars[byte % len(chars)]))
+
+
+def time_per_item(func, prepare, repeat: int, min_time: float=0.05) -> float:
+    """
+    times :func: over inputs from :prepare:, prepared beforehand since results like decoded strings are kept around
+    :param func: the function to time, called with a prepared input
+    :param prepare: returns a new input for :func:
+    :param repeat: number of timings, the best of which is kept
+    :param min_time: the number of calls of a timing grows until it takes at least this many seconds
+    :return: the best time of a call, in seconds
+    """
+    def time_items(number):
+        items = [prepare() for _ in range(number)]
+        # like timeit, collections triggered by earlier allocations aren't timed
+        gc.collect()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start_time = time.perf_counter()
+            for item in items:
+                func(item)
+            return time.perf_counter() - start_time
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    number = 1
+    elapsed = time_items(number)
+    while elapsed < min_time:
+        number *= 2
+        elapsed = time_items(number)
+    return min([elapsed] + [time_items(number) for _ in range(repeat - 1)]) / number
+
+
+def benchmark_case(case: BenchmarkCase, repeat: int) -> dict:
+    """
+    :return: the throughput of parsing, building and serializing the archive of :case:, and the peak memory used to
+        do all three
+    """
+    command_context = dumper.CommandContext()
+    archive = case.read(command_context)
+    size = archive.size
+    # loads the charmap and the like before they are timed or traced
+    archive.build(LABEL)
+    megabytes = size / (1024 * 1024)
+
+    parse_time = time_per_item(lambda _: case.read(command_context), lambda: None, repeat)
+    build_time = time_per_item(lambda archive: archive.build(LABEL), lambda: case.read(command_context), repeat)
+    serialize_time = time_per_item(lambda archive: archive.serialize(), lambda: case.read(command_context), repeat)
+
+    # starts from the same garbage collector state whatever ran before
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.read(command_context).build(LABEL)
+        case.read(command_context).serialize()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'size': size,
+        'parse_mb_s': megabytes / parse_time,
+        'build_mb_s': megabytes / build_time,
+        'serialize_mb_s': megabytes / serialize_time,
+        'peak_memory_kb': peak_memory / 1024,
+    }
+
+
+def benchmark_startup(repeat: int) -> dict:
+    """
+    :return: the time to import the dumper, with and without starting the interpreter, and to compile and load the
+        command database
+    """
+    code = 'import time; start_time = time.perf_counter(); import text_script_dumper; ' \
+           'print(time.perf_counter() - start_time)'
+    import_times = []
+    startup_times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=definitions.ROOT_DIR, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        startup_times.append(time.perf_counter() - start_time)
+        import_times.append(float(output))
+
+    ini_dir = dumper.ModuleState.INI_DIR
+    compile_times = []
+    load_times = []
+    for _ in range(repeat):
+        # a new cache folder has no artifact, so the database is compiled from its ini files
+        with tempfile.TemporaryDirectory() as cache_dir:
+            start_time = time.perf_counter()
+            dumper.CommandDatabase.load(ini_dir, cache_dir)
+            compiled_time = time.perf_counter()
+            dumper.CommandDatabase.load(ini_dir, cache_dir)
+            compile_times.append(compiled_time - start_time)
+            load_times.append(time.perf_counter() - compiled_time)
+
+    return {
+        'import_ms': 1000 * min(import_times),
+        'startup_ms': 1000 * min(startup_times),
+        'ini_compile_ms': 1000 * min(compile_times),
+        'ini_load_ms': 1000 * min(load_times),
+    }
+
+
+def run(cases: list=None, repeat: int=5, startup: bool=True, verbose: bool=False) -> dict:
+    """
+    benchmarks every case, and optionally the startup
+    :param cases: defaults to BenchmarkCase.load
+    :param repeat: number of timings of each metric, the best of which is kept
+    :param startup: whether to benchmark the import of the dumper and the loading of the command database
+    :param verbose: prints the results of every case as they complete
+    :return: the results, see save
+    """
+    with tempfile.TemporaryDirectory() as charmap_dir:
+        charmap_path = os.path.join(charmap_dir, 'charmap.tbl')
+        write_charmap(charmap_path)
+        tbl_path = definitions.GAME_STRING_TBL_PATH
+        definitions.GAME_STRING_TBL_PATH = charmap_path
+        try:
+            if cases is None:
+                cases = BenchmarkCase.load()
+            results = {}
+            for case in cases:
+                results[case.name] = benchmark_case(case, repeat)
+                if verbose:
+                    print(format_metrics(case.name, results[case.name]))
+            if startup:
+                results['startup'] = benchmark_startup(repeat)
+                if verbose:
+                    print(format_metrics('startup', results['startup']))
+        finally:
+            definitions.GAME_STRING_TBL_PATH = tbl_path
+
+    return {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cases': results,
+    }
+
+
+def format_metrics(name: str, metrics: dict) -> str:
+    return '{0}: {1}'.format(name, ', '.join('{0}={1:.2f}'.format(metric, value) for metric, value in metrics.items()
+                                             if metric in METRICS))
+
+
+def save(results: dict, path: str=BASELINE_PATH):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path: str=BASELINE_PATH) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, current: dict, threshold: float=THRESHOLD) -> list:
+    """
+    compares every metric of every case in both results
+    :param threshold: relative change of a metric, in its worse direction, past which it is a regression
+    :return: (case, metric, baseline value, current value, relative change, whether it regressed) of each metric
+    """
+    if baseline.get('version') != current.get('version'):
+        raise BenchmarkException('the baseline is of version {0}, expected {1}'.format(baseline.get('version'),
+                                                                                      current.get('version')))
+    comparisons = []
+    for name, metrics in sorted(current['cases'].items()):
+        baseline_metrics = baseline['cases'].get(name, {})
+        for metric, value in metrics.items():
+            if metric not in METRICS or not baseline_metrics.get(metric):
+                continue
+            baseline_value = baseline_metrics[metric]
+            change = (value - baseline_value) / baseline_value
+            regressed = -change > threshold if METRICS[metric] else change > threshold
+            comparisons.append((name, metric, baseline_value, value, change, regressed))
+    return comparisons
+
+
+def format_comparisons(comparisons: list) -> str:
+    lines = ['{0:<48} {1:<16} {2:>10} {3:>10} {4:>8}'.format('case', 'metric', 'baseline', 'current', 'change')]
+    for name, metric, baseline_value, value, change, regressed in comparisons:
+        lines.append('{0:<48} {1:<16} {2:>10.2f} {3:>10.2f} {4:>+7.1f}%{5}'.format(
+            name, metric, baseline_value, value, 100 * change, ' REGRESSED' if regressed else ''))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks the archives of tests/data, and compares the results '
+                                                 'to a baseline. Runs without the bn6f repository.')
+    parser.add_argument('command', choices=['run', 'compare'],
+                        help='run: prints the results, compare: fails if a metric regressed from the baseline')
+    parser.add_argument('-b', '--baseline', default=BASELINE_PATH, help='baseline JSON file')
+    parser.add_argument('-o', '--output', help='also writes the results to this JSON file')
+    parser.add_argument('--save', action='store_true', default=False, help='run: replaces the baseline with the results')
+    parser.add_argument('--results', help='compare: compares the results of this JSON file instead of running again')
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD,
+                        help='compare: relative change past which a metric regressed, 0.25 by default')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timings of each metric, the best is kept')
+    parser.add_argument('--no-startup', action='store_true', default=False,
+                        help='does not benchmark the import of the dumper and the loading of the command database')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'compare' and args.results:
+        results = load(args.results)
+    else:
+        results = run(repeat=args.repeat, startup=not args.no_startup, verbose=True)
+    if args.output:
+        save(results, args.output)
+    if args.command == 'run':
+        if args.save:
+            save(results, args.baseline)
+        return 0
+
+    comparisons = compare(load(args.baseline), results, args.threshold)
+    print(format_comparisons(comparisons))
+    regressions = [comparison for comparison in comparisons if comparison[-1]]
+    if regressions:
+        print('{0} metrics regressed past {1:.0%}'.format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,161 @@
+# content-addressed cache of expensive results, such as the source units of the repository or the compression of archives
+import hashlib
+import os
+import pickle
+import threading
+
+import definitions
+
+# bumped whenever the results of the cached computations change for the same inputs, invalidating every entry
+TOOL_VERSION = 1
+
+# entries are kept in their own folder, so that eviction doesn't touch the other artifacts of CACHE_DIR
+RESULTS_DIR = os.path.join(definitions.CACHE_DIR, 'results')
+
+# total size of the entries before the least recently used ones are evicted
+MAX_SIZE = 256 * 1024 * 1024
+
+# extensions of the files that make up the source of the repository
+SOURCE_EXTENSIONS = ('.s', '.inc', '.asm', '.h')
+
+# content hashes of the files hashed in this process, by path, with the version of the file they were computed for
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def hash_file(path: str) -> str:
+    """
+    hashes the content of a file, such as the ROM or the archive list. The hash is only computed again if the file
+    changed on disk since it was last hashed by this process
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    version = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if path in _file_hashes and _file_hashes[path][0] == version:
+            return _file_hashes[path][1]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[path] = (version, digest)
+    return digest
+
+
+def hash_tree(root_dir: str, extensions=SOURCE_EXTENSIONS, exclude_dirs=()) -> str:
+    """
+    fingerprints the files under :root_dir: by their path, size and modification time, like make does.
+    Hashing the content of the whole repository would cost about as much as parsing it.
+    :param extensions: only files ending with one of those are considered
+    :param exclude_dirs: folders skipped, relative to :root_dir:, like the ones the dumps are written to
+    """
+    exclude_dirs = {os.path.normpath(os.path.join(root_dir, path)) for path in exclude_dirs}
+    entries = []
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        # skips .git and the like
+        dir_names[:] = [name for name in dir_names if not name.startswith('.')
+                        and os.path.normpath(os.path.join(dir_path, name)) not in exclude_dirs]
+        for name in file_names:
+            if name.endswith(extensions):
+                path = os.path.join(dir_path, name)
+                stat = os.stat(path)
+                entries.append('{0}:{1}:{2}'.format(os.path.relpath(path, root_dir), stat.st_size, stat.st_mtime_ns))
+    entries.sort()
+    return hashlib.sha1('\n'.join(entries).encode()).hexdigest()
+
+
+def get_key(name: str, inputs) -> str:
+    """
+    :param name: name of the cached computation
+    :param inputs: hashes of the files it depends on, and any other arguments that affect its result. must have a
+        stable repr, like tuples of strings and ints
+    :return: key of the result of :name: for :inputs:
+    """
+    return hashlib.sha1(repr((TOOL_VERSION, name, inputs)).encode()).hexdigest()
+
+
+def get_path(name: str, key: str, results_dir: str=RESULTS_DIR) -> str:
+    return os.path.join(results_dir, '{0}.{1}.pickle'.format(name, key))
+
+
+def cached(func, name: str, inputs, *args, recache=False, results_dir: str=RESULTS_DIR, max_size: int=MAX_SIZE,
+           **kwargs):
+    """
+    returns the result of :func: for :inputs:, computing and storing it only if it's not cached yet.
+    A change to any of the inputs gives a new key, so stale results are never loaded; they are evicted eventually.
+    :param func: function with expensive computation
+    :param name: name of the computation, part of the key and of the entry filename
+    :param inputs: see get_key. everything :func: depends on that may change between runs
+    :param args: args to :func:
+    :param recache: computes the result again even if it is cached, and replaces it
+    :param results_dir: folder of the entries
+    :param max_size: size the entries are evicted down to after storing a new one
+    :param kwargs: kwargs to :func:
+    :return: result of :func:
+    """
+    path = get_path(name, get_key(name, inputs), results_dir)
+    if not recache:
+        try:
+            with open(path, 'rb') as f:
+                res = pickle.load(f)
+            # marks the entry as recently used for eviction
+            os.utime(path)
+            return res
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # unpickling a truncated or stale entry can raise about anything. it is removed and computed again
+            remove(path)
+
+    res = func(*args, **kwargs)
+    store(path, res)
+    evict(results_dir, max_size)
+    return res
+
+
+def store(path: str, res):
+    """
+    writes :res: to :path: atomically, so that concurrent processes never load a partial entry.
+    Failing to write it is not an error, the result will just be computed again
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def remove(path: str):
+    """
+    removes the entry at :path:, if it is still there
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def evict(results_dir: str=RESULTS_DIR, max_size: int=MAX_SIZE):
+    """
+    removes the least recently used entries until the total size of :results_dir: is within :max_size:
+    """
+    try:
+        entries = []
+        with os.scandir(results_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.pickle'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        remove(path)
+        total_size -= size
@@ -1,4 +1,52 @@
 # includes helper functions useful to the project
+import mmap
+import os
+import threading
+
+
 def info(flag, *args, **kwargs):
     if flag:
-        print(*args, **kwargs)
\ No newline at end of file
+        print(*args, **kwargs)
+
+
+# read-only maps of the files mapped in this process, by path
+_mapped_files = {}
+_mapped_files_lock = threading.Lock()
+
+
+def map_file(path: str) -> memoryview:
+    """
+    maps a file (like the ROM) read-only into memory, once per process. Consumers slice the returned buffer
+    instead of seeking and reading, which doesn't copy, so a pass over the whole ROM only pages in what it accesses.
+    a file that changed on disk since it was mapped is mapped again.
+    :param path: path of the file to map
+    :return: memoryview over the entire content of the file
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    version = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _mapped_files_lock:
+        if path not in _mapped_files or _mapped_files[path][0] != version:
+            with open(path, 'rb') as f:
+                # empty files cannot be mapped
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+            _mapped_files[path] = (version, memoryview(data))
+        return _mapped_files[path][1]
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    writes :content: to the text file at :path:, unless it already has that content. This keeps the modification
+    time of unchanged files, so that make doesn't rebuild what depends on them
+    :return: whether the file was written
+    """
+    try:
+        with open(path, 'r', newline='') as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    # written as is, like it is read, so that newlines aren't translated and the next comparison matches
+    with open(path, 'w', newline='') as f:
+        f.write(content)
+    return True
@@ -0,0 +1,182 @@
+# GBA BIOS LZ77 (type 0x10) compression, as used by the compressed text archives of the ROM
+
+# first byte of the header of LZ77 compressed data
+LZ77_TYPE = 0x10
+
+
+class LZ77Exception(Exception): pass
+
+
+def get_decompressed_size(buf, offset: int=0) -> int:
+    """
+    :return: the decompressed size in the header of the compressed data at :offset:
+    """
+    return int.from_bytes(buf[offset + 1:offset + 4], 'little')
+
+
+def decompress(buf, offset: int=0) -> (bytes, int):
+    """
+    decompresses LZ77 data the same way gbagfx does, but in memory and without needing to know where the data ends
+    :param buf: bytes-like object with the compressed data, such as the ROM buffer from common.map_file
+    :param offset: offset of the header of the compressed data in :buf:
+    :return: the decompressed data, and the number of compressed bytes consumed, including the header
+    :raises LZ77Exception: if there is no valid LZ77 data at :offset:
+    """
+    src = memoryview(buf)
+    src_end = len(src)
+    if offset + 4 > src_end or src[offset] != LZ77_TYPE:
+        raise LZ77Exception('no LZ77 header at 0x%X' % offset)
+    size = get_decompressed_size(src, offset)
+    dest = bytearray(size)
+
+    src_pos = offset + 4
+    pos = 0
+    while True:
+        if src_pos >= src_end:
+            raise LZ77Exception('LZ77 data at 0x%X is truncated' % offset)
+        flags = src[src_pos]
+        src_pos += 1
+
+        # the flags tell which of the next 8 blocks are copied from earlier output, MSB first
+        for i in range(8):
+            if flags & 0x80:
+                if src_pos + 1 >= src_end:
+                    raise LZ77Exception('LZ77 data at 0x%X is truncated' % offset)
+                length = (src[src_pos] >> 4) + 3
+                distance = ((src[src_pos] & 0xF) << 8 | src[src_pos + 1]) + 1
+                src_pos += 2
+                start = pos - distance
+                if start < 0:
+                    raise LZ77Exception('LZ77 data at 0x%X refers to before its start' % offset)
+                # gbagfx truncates a block past the decompressed size
+                length = min(length, size - pos)
+                if distance >= length:
+                    dest[pos:pos + length] = dest[start:start + length]
+                else:
+                    # the block overlaps itself, repeating the last :distance: bytes
+                    dest[pos:pos + length] = (dest[start:pos] * (length // distance + 1))[:length]
+                pos += length
+            else:
+                if src_pos >= src_end or pos >= size:
+                    raise LZ77Exception('LZ77 data at 0x%X is truncated' % offset)
+                dest[pos] = src[src_pos]
+                src_pos += 1
+                pos += 1
+
+            if pos == size:
+                return bytes(dest), src_pos - offset
+            flags <<= 1
+
+
+def get_compressed_size(buf, offset: int=0) -> (int, int) or None:
+    """
+    walks the blocks of the LZ77 data at :offset: without decompressing them, to tell whether it is compressed data
+    and how much of :buf: it spans. Unlike decompress, the flags of the blocks after the end of the data must be 0,
+    which is always the case in practice but makes it less likely to accept data that isn't compressed.
+    :param buf: bytes-like object with the compressed data, such as the ROM buffer from common.map_file
+    :param offset: offset of the header of the compressed data in :buf:
+    :return: the compressed size, including the header, and the decompressed size. None if it's not LZ77 data
+    """
+    src = memoryview(buf)
+    src_end = len(src)
+    if offset + 4 > src_end or src[offset] != LZ77_TYPE:
+        return None
+    size = get_decompressed_size(src, offset)
+    if size == 0:
+        return None
+
+    src_pos = offset + 4
+    pos = 0
+    while True:
+        if src_pos >= src_end:
+            return None
+        flags = src[src_pos]
+        src_pos += 1
+
+        # 8 literal blocks that don't reach the end
+        if flags == 0 and pos + 8 < size:
+            src_pos += 8
+            pos += 8
+            continue
+
+        for i in range(8):
+            if flags & 0x80:
+                if src_pos + 1 >= src_end:
+                    return None
+                # only the first 4KB of output can be referred to before its start
+                if pos < 0x1000 and ((src[src_pos] & 0xF) << 8 | src[src_pos + 1]) >= pos:
+                    return None
+                pos += (src[src_pos] >> 4) + 3
+                src_pos += 2
+            else:
+                pos += 1
+                src_pos += 1
+            flags = (flags << 1) & 0xFF
+
+            if pos >= size:
+                if flags != 0 or src_pos > src_end:
+                    return None
+                return src_pos - offset, size
+
+
+def compress(data, min_distance: int=2) -> bytes:
+    """
+    compresses data into LZ77 exactly like gbagfx does, so unmodified archives compress to the same bytes as in the ROM.
+    Like gbagfx, every block takes the longest match with the closest distance, and the output is padded to 4 bytes.
+    Matches are looked up through chains of the earlier positions starting with the same 3 bytes, closest first,
+    instead of comparing against every distance of the window.
+    :param data: bytes-like object to compress
+    :param min_distance: smallest distance to copy from. gbagfx defaults to 2, for LZ77UnCompVram
+    :return: the compressed data, with its header
+    """
+    data = bytes(data)
+    size = len(data)
+    if size == 0 or size >= 1 << 24:
+        raise LZ77Exception('cannot compress 0x%X bytes' % size)
+    out = bytearray((LZ77_TYPE, size & 0xFF, (size >> 8) & 0xFF, size >> 16))
+
+    # earlier positions by their first 3 bytes, in increasing order
+    chains = {}
+    chained = 0
+    pos = 0
+    while True:
+        flags_pos = len(out)
+        out.append(0)
+        for i in range(8):
+            while chained < pos:
+                chains.setdefault(data[chained:chained + 3], []).append(chained)
+                chained += 1
+
+            best_length = 0
+            best_distance = 0
+            candidates = chains.get(data[pos:pos + 3]) if pos + 3 <= size else None
+            if candidates:
+                max_length = min(18, size - pos)
+                window_start = pos - 0x1000
+                for j in range(len(candidates) - 1, -1, -1):
+                    start = candidates[j]
+                    if start < window_start:
+                        break
+                    if pos - start < min_distance:
+                        continue
+                    length = 3
+                    while length < max_length and data[start + length] == data[pos + length]:
+                        length += 1
+                    if length > best_length:
+                        best_length = length
+                        best_distance = pos - start
+                        if length == max_length:
+                            break
+
+            if best_length >= 3:
+                out[flags_pos] |= 0x80 >> i
+                out.append((best_length - 3) << 4 | (best_distance - 1) >> 8)
+                out.append((best_distance - 1) & 0xFF)
+                pos += best_length
+            else:
+                out.append(data[pos])
+                pos += 1
+
+            if pos == size:
+                out += bytes(-len(out) % 4)
+                return bytes(out)
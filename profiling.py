@@ -0,0 +1,197 @@
+# lightweight spans and counters telling where the time of a dump goes, see --profile of both CLIs.
+# profiling is disabled by default, and then a span costs about a function call
+import json
+import threading
+import time
+
+_enabled = False
+_lock = threading.Lock()
+# phase -> [number of spans, seconds, bytes processed]
+_spans = {}
+# counter -> value
+_counters = {}
+# stream the per-archive records are written to, see record
+_records_file = None
+
+
+class Span:
+    """
+    times one occurrence of a phase, see span
+    """
+    __slots__ = ('name', 'size', 'start_time')
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        # bytes processed, which can be set before the span ends if it's only known then
+        self.size = size
+        self.start_time = 0
+
+    def __enter__(self) -> 'Span':
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start_time
+        with _lock:
+            entry = _spans.get(self.name)
+            if entry is None:
+                entry = _spans[self.name] = [0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += self.size
+
+
+class _NullSpan:
+    """
+    span returned while profiling is disabled, which does nothing
+    """
+    __slots__ = ('size',)
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, size: int=0) -> Span:
+    """
+    times a phase, like parsing or building, used as a context manager:
+        with profiling.span('parse') as s:
+            ...
+            s.size = parsed_size
+    :param name: the phase, which the spans are aggregated by
+    :param size: bytes processed by the phase
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, size)
+
+
+def count(name: str, value: int=1):
+    """
+    adds :value: to the counter :name:, like the number of interpreter retries
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record(**fields):
+    """
+    writes a record of one archive, like its wall time, bytes processed and retry counts, as a line of JSON.
+    only if the records are written, see enable
+    """
+    if _records_file is None:
+        return
+    line = json.dumps(fields)
+    with _lock:
+        _records_file.write(line + '\n')
+
+
+def enable(records_path: str=None):
+    """
+    starts profiling from no spans and counters
+    :param records_path: file to write the per-archive records to, as JSON lines
+    """
+    global _enabled, _records_file
+    reset()
+    if records_path is not None:
+        _records_file = open(records_path, 'w')
+    _enabled = True
+
+
+def disable():
+    global _enabled, _records_file
+    _enabled = False
+    if _records_file is not None:
+        _records_file.close()
+        _records_file = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def collect() -> (dict, dict):
+    """
+    takes the spans and counters so far, to send them from a job process to the main one, see merge
+    :return: the spans and counters, which are reset
+    """
+    with _lock:
+        stats = (dict(_spans), dict(_counters))
+        _spans.clear()
+        _counters.clear()
+    return stats
+
+
+def merge(stats: (dict, dict)):
+    """
+    adds the spans and counters of collect, like from a job process
+    """
+    spans, counters = stats
+    with _lock:
+        for name, (calls, seconds, size) in spans.items():
+            entry = _spans.get(name)
+            if entry is None:
+                entry = _spans[name] = [0, 0.0, 0]
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += size
+        for name, value in counters.items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def format_table() -> str:
+    """
+    :return: the aggregate of every phase, slowest first, and the counters
+    """
+    with _lock:
+        spans = sorted(_spans.items(), key=lambda item: -item[1][1])
+        counters = sorted(_counters.items())
+    lines = ['{0:<16} {1:>8} {2:>10} {3:>10} {4:>12}'.format('phase', 'count', 'total ms', 'mean ms', 'bytes')]
+    for name, (calls, seconds, size) in spans:
+        lines.append('{0:<16} {1:>8} {2:>10.2f} {3:>10.3f} {4:>12}'.format(name, calls, 1000 * seconds,
+                                                                           1000 * seconds / calls, size))
+    for name, value in counters:
+        lines.append('{0:<16} {1:>8}'.format(name, value))
+    return '\n'.join(lines)
+
+
+def add_arguments(parser):
+    """
+    adds --profile and --profile-records to an argparse parser, see start
+    """
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='prints how long each phase took, such as parsing and building')
+    parser.add_argument('--profile-records', metavar='PATH',
+                        help='with --profile, writes a JSON line per archive with its wall time, size and retries')
+
+
+def start(args):
+    """
+    enables profiling if requested by the arguments of add_arguments
+    """
+    if args.profile:
+        enable(args.profile_records)
+
+
+def finish(stream=None):
+    """
+    prints the table of the phases if profiling, and stops profiling
+    :param stream: text stream to print to, defaults to stdout
+    """
+    if not _enabled:
+        return
+    print(format_table(), file=stream)
+    disable()
@@ -1,10 +1,18 @@
 import unittest
 import os
 import io
+import json
+import subprocess
+import sys
 from text_script_dumper import *
 import text_script_dumper as uut_dumper
 import text_script_scanner
 import definitions
+import lz77
+import cache
+import text_script_server
+import profiling
+import benchmark
 
 class RegressionTests(unittest.TestCase):
     def setUp(self):
@@ -168,6 +176,117 @@ class CommandIdentificationTess(unittest.TestCase):
         pass
 
 
+class CommandDispatchTests(unittest.TestCase):
+    def setUp(self):
+        self.command_context = CommandContext()
+
+    def testDispatchMatchesSections(self):
+        # the compiled dispatch must identify the same sections as scanning the database
+        cmds = [bytes([b]) for b in range(0xE5, 0x100)]
+        cmds += [b'\xe8\x05', b'\xec\x01', b'\xef\x1e', b'\xf0\x00', b'\xf0\x01', b'\xf0\x03', b'\xf0\xff',
+                 b'\xfa\x01', b'\xfa\x01\x04', b'\xfa\x04', b'\xfa\x00\x00\x06', b'\xfa\x00\x1f\xf1']
+        for sects, dispatch in [(self.command_context.sects, self.command_context.dispatch),
+                                (self.command_context.sects_s, self.command_context.dispatch_s)]:
+            for cmd in cmds:
+                try:
+                    expected = TextScriptCommand.find_param_count(cmd, sects)
+                except TypeError:
+                    # unsupported multiple bitfield parameters
+                    self.assertRaises(NotImplementedError, dispatch.find_param_count, cmd)
+                    continue
+                num_params, spec = dispatch.find_param_count(cmd)
+                self.assertEqual(expected, (num_params, spec.sect if spec else None), 'dispatch mismatch for %s' % cmd)
+
+    def testCompiledParameters(self):
+        spec = self.command_context.dispatch.find_command_spec(b'\xfa\x00\x00\x01', b'\x01\xff')
+        self.assertEqual(spec.name, 'printChip1')
+        self.assertTrue(spec.is_bitfield)
+        self.assertEqual([(p.byte_offset, p.bit_offset, p.bits) for p in spec.params], [(2, 0, 8), (3, 4, 4)])
+        command_bytes = TextScriptCommand.to_bytes(b'\xfa\x00\x00\x01', b'\x01\xff', False)
+        self.assertEqual([TextScriptCommand._compute_parameter_value(p, command_bytes) for p in spec.params], [0x01, 0xF])
+
+
+class CommandDatabaseTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import shutil
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ini_dir = os.path.join(self.tmp_dir.name, 'ini')
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        os.mkdir(self.ini_dir)
+        for ini_name in CommandDatabase.INI_NAMES:
+            shutil.copy(os.path.join(ModuleState.INI_DIR, ini_name), self.ini_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def testArtifactReused(self):
+        database = CommandDatabase.load(self.ini_dir, self.cache_dir)
+        artifact_path = CommandDatabase.get_artifact_path(self.ini_dir, self.cache_dir)
+        self.assertTrue(os.path.exists(artifact_path))
+        cached_database = CommandDatabase.load(self.ini_dir, self.cache_dir)
+        self.assertEqual([spec.name for spec in database.specs], [spec.name for spec in cached_database.specs])
+        self.assertEqual(cached_database.dispatch.find_param_count(b'\xe7')[1].name, 'keyWait')
+
+    def testArtifactRebuiltOnChange(self):
+        CommandDatabase.load(self.ini_dir, self.cache_dir)
+        old_artifact_path = CommandDatabase.get_artifact_path(self.ini_dir, self.cache_dir)
+        with open(os.path.join(self.ini_dir, 'mmbn6s.ini'), 'a') as ini_file:
+            ini_file.write('\n[Command]\nname = testCommand\nmask = FF FF\nbase = FE FE\n')
+        database = CommandDatabase.load(self.ini_dir, self.cache_dir)
+        self.assertNotEqual(old_artifact_path, CommandDatabase.get_artifact_path(self.ini_dir, self.cache_dir))
+        self.assertEqual(database.dispatch_s.find_param_count(b'\xfe\xfe')[1].name, 'testCommand')
+
+    def testCorruptArtifact(self):
+        os.mkdir(self.cache_dir)
+        with open(CommandDatabase.get_artifact_path(self.ini_dir, self.cache_dir), 'wb') as artifact_file:
+            artifact_file.write(b'\x00')
+        database = CommandDatabase.load(self.ini_dir, self.cache_dir)
+        self.assertEqual(database.dispatch.find_param_count(b'\xe7')[1].name, 'keyWait')
+
+    def testMemoNotPickled(self):
+        import pickle
+        database = CommandDatabase.load(self.ini_dir, self.cache_dir)
+        params = bytes(database.dispatch.find_param_count(b'\xe7')[0])
+        self.assertEqual(database.dispatch.find_command_spec(b'\xe7', params).name, 'keyWait')
+        self.assertTrue(database.dispatch.command_specs)
+        # the artifact never depends on what was parsed before it was written
+        dispatch = pickle.loads(pickle.dumps(database.dispatch))
+        self.assertEqual(dispatch.command_specs, {})
+        self.assertEqual(dispatch.find_command_spec(b'\xe7', params).name, 'keyWait')
+
+
+class ImportTests(unittest.TestCase):
+    # generous bound, importing should only take a few milliseconds now that nothing is loaded
+    MAX_IMPORT_TIME = 0.2
+
+    def run_import(self, module_name):
+        code = (
+            'import sys, time, json\n'
+            'opened = []\n'
+            'sys.addaudithook(lambda event, args: opened.append(str(args[0])) if event == "open" else None)\n'
+            'start = time.perf_counter()\n'
+            'import {module_name}\n'
+            'elapsed = time.perf_counter() - start\n'
+            'print(json.dumps([elapsed, [p for p in opened if not p.endswith((".py", ".pyc"))]]))\n'
+        ).format(**vars())
+        env = dict(os.environ, PYTHONPATH=definitions.ROOT_DIR)
+        out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, check=True, text=True)
+        return json.loads(out.stdout.splitlines()[-1])
+
+    def test_import_does_no_file_io(self):
+        elapsed, opened = self.run_import('text_script_dumper')
+        self.assertEqual([p for p in opened if p.endswith(('.ini', '.tbl', '.pickle'))], [],
+                         'databases must be loaded on first use, not at import')
+        self.assertLess(elapsed, self.MAX_IMPORT_TIME, 'import took {elapsed:.3f}s'.format(**vars()))
+
+    def test_context_loads_on_first_use(self):
+        command_context = CommandContext()
+        self.assertIsNone(command_context._database)
+        self.assertEqual(command_context.dispatch.find_param_count(b'\xe6')[1].name, 'end')
+        self.assertIs(command_context.database, CommandContext().database, 'database must be shared')
+
+
 class CommandParsingTests(unittest.TestCase):
     def setUp(self):
         self.command_context = CommandContext()
@@ -287,6 +406,714 @@ class CommandParsingTests(unittest.TestCase):
         self.runTestData(bytes, cmds)
 
 
+class BufferParsingTests(unittest.TestCase):
+    def setUp(self):
+        self.test_data_dir = 'data/'
+        self.command_context = CommandContext()
+
+    def testBufferMatchesFile(self):
+        # parsing from a buffer at an offset is the same as parsing the file it was read from
+        for name in sorted(os.listdir(self.test_data_dir)):
+            if not name.startswith('TextScript') or not name.endswith('.bin'):
+                continue
+            with open(self.test_data_dir + name, 'rb') as bin_file:
+                data = bin_file.read()
+                from_file = TextScriptArchive.read_script(self.command_context, 0, bin_file)
+            from_buffer = TextScriptArchive.read_script(self.command_context, 3, b'\xff\xff\xff' + data)
+            self.assertEqual(from_file.serialize(), from_buffer.serialize(), name)
+            self.assertEqual(from_file.size, from_buffer.size, name)
+            self.assertEqual([[type(unit) for unit in script.units] for script in from_file.text_scripts],
+                             [[type(unit) for unit in script.units] for script in from_buffer.text_scripts], name)
+
+    def testStringRuns(self):
+        # strings are split at every E9, end at commands, and include the end_script that terminates them
+        archive = TextScriptArchive.read_script(self.command_context, 0, b'\x02\x00\x01\x02\xe9\x03\xe7\x00\x04\xe6\x05')
+        self.assertEqual([unit.data if type(unit) is GameString else unit.cmd + unit.params
+                          for unit in archive.text_scripts[0].units],
+                         [b'\x01\x02\xe9', b'\x03', b'\xe7\x00', b'\x04\xe6'])
+        # with a known size, E6 does not end the string, the size does
+        archive = TextScriptArchive.read_script(self.command_context, 0, b'\x02\x00\x01\xe9\xe6\x02\xe9\x03', 6)
+        self.assertEqual([unit.data for unit in archive.text_scripts[0].units], [b'\x01\xe9', b'\xe6\x02'])
+
+    def testCommandFromBuffer(self):
+        dispatch = self.command_context.dispatch
+        buf = memoryview(b'\xe5\xf0\x00\x41\x42\x43')
+        self.assertEqual(TextScriptCommand.read_cmd_from_buffer(buf, 2, b'\xf0', dispatch), ((b'\xf0\x00', b'\x41'), 4))
+        # unknown commands leave the offset unchanged
+        self.assertEqual(TextScriptCommand.read_cmd_from_buffer(buf, 1, b'\xe4', dispatch), (None, 1))
+
+    def testParseAccounting(self):
+        # script 0 only parses with the secondary interpreter, after failing with the first
+        data = b'\x04\x00\x0a\x00\x01\x02\xef\x1e\x00\xe6\xe6\xe6\xe6\xe6\xe6\xe6'
+        accounting = ParseAccounting()
+        archive = TextScriptArchive.read_script(CommandContext(), 0, data, accounting=accounting)
+        self.assertEqual(archive.build(), TextScriptArchive.read_script(CommandContext(), 0, data).build())
+        totals = accounting.get_totals()
+        self.assertEqual(totals['rewinds'], archive.retry_count)
+        self.assertEqual(totals['reparsed_size'], archive.reparsed_size)
+        self.assertEqual(totals['rewound_scripts'], 1)
+        script = accounting.get_backtracking_scripts()[0]
+        self.assertEqual((script['script'], script['offset'], script['rewinds']), (0, 4, 1))
+        self.assertGreater(script['rewind_size'], 0)
+        self.assertGreater(script['memo_hits'], 0)
+        self.assertIsNotNone(script['failure'])
+
+    def testRetryReusesMemo(self):
+        # the first interpreter overruns script 0 with checkNaviCustProgram, so the archive is reparsed with
+        # the secondary one. only the units that follow the failing command are decoded again
+        data = b'\x04\x00\x0a\x00\x01\x02\xef\x1e\x00\xe6\xe6\xe6\xe6\xe6\xe6\xe6'
+        archive = TextScriptArchive.read_script(self.command_context, 0, data)
+        units = archive.text_scripts[0].units
+        self.assertEqual(units[0].data, b'\x01\x02')
+        self.assertEqual((units[1].cmd, units[1].params, units[1].use_interpreter_s), (b'\xef', b'\x1e\x00', True))
+        self.assertEqual(archive.serialize(), data[:archive.size])
+        self.assertGreater(archive.reparsed_size, 0)
+        self.assertLess(archive.reparsed_size, archive.size)
+        # archives that parse the first time are not reparsed at all
+        archive = TextScriptArchive.read_script(self.command_context, 0, b'\x02\x00\x01\x02\xe9\x03\xe7\x00\x04\xe6\x05')
+        self.assertEqual(archive.reparsed_size, 0)
+
+
+class InterpreterHintsTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.command_context = CommandContext()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.hints_path = InterpreterHints.get_path(self.command_context, self.cache_dir.name)
+        # script 0 only parses with the secondary interpreter
+        self.data = b'\x04\x00\x0a\x00\x01\x02\xef\x1e\x00\xe6\xe6\xe6\xe6\xe6\xe6\xe6'
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def testHintsPersist(self):
+        hints = InterpreterHints.load(self.hints_path)
+        expected = TextScriptArchive.read_script(self.command_context, 0, self.data, None, hints)
+        self.assertGreater(expected.reparsed_size, 0)
+        hints.save()
+
+        hints = InterpreterHints.load(self.hints_path)
+        self.assertEqual(hints.get(0)[1], [False, False])
+        archive = TextScriptArchive.read_script(self.command_context, 0, self.data, None, hints)
+        self.assertEqual(archive.reparsed_size, 0)
+        self.assertEqual(archive.serialize(), expected.serialize())
+        self.assertFalse(hints.modified)
+
+    def testStaleHints(self):
+        # hints recorded for different archive bytes are not used, and are refreshed
+        hints = InterpreterHints(self.hints_path)
+        hints.update(0, 0, [True, True])
+        expected = TextScriptArchive.read_script(self.command_context, 0, self.data)
+        archive = TextScriptArchive.read_script(self.command_context, 0, self.data, None, hints)
+        self.assertEqual(archive.serialize(), expected.serialize())
+        self.assertEqual(hints.get(0)[1], [False, False])
+        self.assertNotEqual(hints.get(0)[0], 0)
+        self.assertTrue(hints.modified)
+
+
+class BuildTests(unittest.TestCase):
+    def setUp(self):
+        self.command_context = CommandContext()
+        # a jump to the second script, which is empty
+        self.archive = TextScriptArchive.read_script(self.command_context, 0, b'\x04\x00\x08\x00\xf0\x00\x01\xe6\xe6')
+
+    def testLabel(self):
+        lines = self.archive.build('TextScriptTest').split('\n')
+        self.assertIn('\tdef_text_script TextScriptTest_unk0', lines)
+        self.assertIn('\tts_jump target=TextScriptTest_unk1_id', lines)
+        self.assertIn('\tdef_text_script TextScript0_unk1', self.archive.build().split('\n'))
+
+    def testBuildToStream(self):
+        stream = io.StringIO()
+        self.archive.build_to(stream, 'TextScriptTest')
+        self.assertEqual(stream.getvalue(), self.archive.build('TextScriptTest'))
+        self.assertEqual(''.join(self.archive.iter_build()), self.archive.build())
+        self.assertTrue(self.archive.build().endswith('\t.balign 4, 0'))
+        self.assertFalse(self.archive.build(align=False).endswith('\t.balign 4, 0'))
+        # nothing is left of the alignment, not even its indentation
+        self.assertTrue(self.archive.build(align=False).endswith('\n'))
+
+
+class AddressListTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.list_path = os.path.join(self.tmp_dir.name, 'archives.tpl')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def readList(self, content):
+        with open(self.list_path, 'w') as list_file:
+            list_file.write(content)
+        return uut_dumper.read_address_list(self.list_path)
+
+    def testTplList(self):
+        self.assertEqual(self.readList('@archive 6C580C\n@size 34C\n@archive 21D88\n'), [(0x6C580C, 0x34C), (0x21D88, None)])
+        with self.assertRaises(TextScriptException):
+            self.readList('@size 34C\n')
+
+    def testAddressList(self):
+        self.assertEqual(self.readList('# archives\n0x6C580C 0x34C\n\n0x21D88  # no size\n8\n'),
+                         [(0x6C580C, 0x34C), (0x21D88, None), (8, None)])
+
+
+class DumpSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.test_data_dir = 'data/'
+        self.archives = []
+        for name in sorted(os.listdir(self.test_data_dir)):
+            if name.startswith('TextScript') and name.endswith('.bin'):
+                with open(self.test_data_dir + name, 'rb') as bin_file:
+                    self.archives.append(bin_file.read())
+
+    @staticmethod
+    def dump(address: int, data: bytes) -> (str, list):
+        session = DumpSession(address)
+        archive = TextScriptArchive.read_script(session, 0, data)
+        return archive.build(), session.errors
+
+    def testSessionLabel(self):
+        archive = TextScriptArchive.read_script(DumpSession(0x86C580C), 0, b'\x04\x00\x08\x00\xf0\x00\x01\xe6\xe6')
+        lines = archive.build().split('\n')
+        self.assertIn('\tdef_text_script TextScript86C580C_unk0', lines)
+        # jump targets have the same hexadecimal address as the labels of the scripts
+        self.assertIn('\tts_jump target=TextScript86C580C_unk1_id', lines)
+
+    def testSessionErrors(self):
+        session = DumpSession()
+        session.error(InvalidTextScriptCommandException, 'not critical', critical=False)
+        self.assertEqual(session.errors, ['not critical'])
+        self.assertEqual(uut_dumper.error.list, [])
+        with self.assertRaises(InvalidTextScriptCommandException):
+            DumpSession(raise_all=True).error(InvalidTextScriptCommandException, 'not critical', critical=False)
+
+    def testContextState(self):
+        # plain contexts carry their own errors and address too, and fall back on ModuleState.address
+        context = CommandContext(address=0x86C580C)
+        other = CommandContext()
+        context.error(InvalidTextScriptCommandException, 'not critical', critical=False)
+        self.assertEqual(context.errors, ['not critical'])
+        self.assertEqual(other.errors, [])
+        self.assertEqual(uut_dumper.error.list, [])
+        other.clear_errors()
+        self.assertEqual(context.errors, ['not critical'])
+        self.assertEqual(context.get_label(), 'TextScript86C580C')
+        self.assertEqual(other.get_label(), TextScript.get_label(ModuleState.address))
+        with self.assertRaises(InvalidTextScriptCommandException):
+            CommandContext(raise_all=True).error(InvalidTextScriptCommandException, 'not critical', critical=False)
+
+    def testParallelDumps(self):
+        # dumping in threads, each archive with its own session, gives the same output as one after another
+        from concurrent.futures import ThreadPoolExecutor
+        jobs = [(address, data) for address in range(0x10) for data in self.archives]
+        expected = [self.dump(address, data) for address, data in jobs]
+        with ThreadPoolExecutor(8) as executor:
+            actual = list(executor.map(lambda job: self.dump(*job), jobs))
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(set(output for output, errors in expected)), len(jobs))
+
+
+class SerializeTests(unittest.TestCase):
+    def setUp(self):
+        self.command_context = CommandContext()
+        self.data = b'\x04\x00\x08\x00\xf0\x00\x01\xe6\xe6'
+        self.archive = TextScriptArchive.read_script(self.command_context, 0, self.data)
+
+    def testSerializeIntoBuffer(self):
+        self.assertEqual(self.archive.serialize(), self.data)
+        self.assertEqual(self.archive.get_serialized_size(), len(self.data))
+        buffer = bytearray(len(self.data) + 2)
+        self.assertIs(self.archive.serialize(buffer, 2), buffer)
+        self.assertEqual(buffer[2:], self.data)
+        self.assertRaises(ValueError, self.archive.serialize, bytearray(len(self.data)), 1)
+
+    def testVerify(self):
+        self.assertIsNone(self.archive.verify_against(self.data))
+        # ts_jump target mismatch
+        mismatch = self.archive.verify_against(self.data[:6] + b'\x02' + self.data[7:])
+        self.assertEqual((mismatch.offset, mismatch.script_idx, mismatch.unit.cmd), (6, 0, b'\xf0\x00'))
+        # relative pointers mismatch
+        mismatch = self.archive.verify_against(b'\x04\x00\x09' + self.data[3:])
+        self.assertEqual((mismatch.offset, mismatch.script_idx, mismatch.unit), (2, None, None))
+        # the source is shorter or longer than the archive
+        self.assertEqual(self.archive.verify_against(self.data[:-1]).offset, len(self.data) - 1)
+        self.assertEqual(self.archive.verify_against(self.data + b'\x00').offset, len(self.data))
+
+
+class CharmapTests(unittest.TestCase):
+    def setUp(self):
+        self.tbl = {b: chr(0x100 + b) for b in range(0xE4)}
+        self.tbl.update({0xE42C: 'ー', 0xE4E4: '…', 0x22: '"', 0xE6: '@', 0xE9: '\\n'})
+        self.charmap = Charmap(self.tbl)
+
+    def testDecodeMatchesTbl(self):
+        for data in [b'', b'\x00\x01\xe9', b'\x22\x05\xe6', b'\xe4\x2c', b'\x01\xe4\x2c\x02\xe4\xe4\x03\x22\xe9']:
+            self.assertEqual(self.charmap.decode(data), GameString.bn6f_str(data, self.tbl), data)
+
+    def testInvalidCharacters(self):
+        self.assertRaises(KeyError, self.charmap.decode, b'\x01\xe5')
+        self.assertRaises(KeyError, self.charmap.decode, b'\xe4\x00')
+        self.assertRaises(IndexError, self.charmap.decode, b'\x01\xe4')
+
+    def testDecodedOnAccess(self):
+        game_string = GameString(b'\x01\x02')
+        self.assertIsNone(game_string._text)
+        self.assertEqual(game_string.data, b'\x01\x02')
+
+
+class MappedFileTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'rom.gba')
+        with open(self.path, 'wb') as f:
+            f.write(b'\x10\x08\x00\x00' + bytes(range(16)))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def testMapShared(self):
+        import common
+        rom = common.map_file(self.path)
+        self.assertIs(rom, common.map_file(self.path))
+        self.assertEqual(rom[4:8], bytes(range(4)))
+
+    def testMapChangedFile(self):
+        import common
+        common.map_file(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'\xff')
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual(common.map_file(self.path)[-1], 0xff)
+
+
+class LZ77Tests(unittest.TestCase):
+    def testLiterals(self):
+        data = b'\xff\x10\x08\x00\x00\x00' + bytes(range(8)) + b'\xff'
+        self.assertEqual(lz77.decompress(data, 1), (bytes(range(8)), 4 + 1 + 8))
+
+    def testBlocks(self):
+        # 3 literals, then 6 bytes copied from 3 bytes back, which overlap the block itself
+        data = b'\x10\x0b\x00\x00\x12abc\x30\x02de'
+        self.assertEqual(lz77.decompress(data), (b'abcabcabcde', len(data)))
+        # a block past the decompressed size is truncated
+        self.assertEqual(lz77.decompress(b'\x10\x05\x00\x00\x10abc\x30\x02'), (b'abcab', 10))
+
+    def testInvalidData(self):
+        with self.assertRaises(lz77.LZ77Exception):
+            lz77.decompress(b'\x11\x08\x00\x00\x00' + bytes(8))
+        with self.assertRaises(lz77.LZ77Exception):
+            # refers to before the start of the output
+            lz77.decompress(b'\x10\x08\x00\x00\x40a\x30\x02')
+        with self.assertRaises(lz77.LZ77Exception):
+            lz77.decompress(b'\x10\x08\x00\x00\x00abc')
+
+    def testCompressedSize(self):
+        data = b'\xff\x10\x0b\x00\x00\x10abc\x30\x02de\xff\xff'
+        self.assertEqual(lz77.get_compressed_size(data, 1), (len(data) - 3, 11))
+        self.assertEqual(lz77.get_compressed_size(data, 1)[0], lz77.decompress(data, 1)[1])
+        # not compressed, refers to before the start of the output, truncated, or blocks flagged after the end
+        self.assertIsNone(lz77.get_compressed_size(data, 0))
+        self.assertIsNone(lz77.get_compressed_size(b'\x10\x08\x00\x00\x40a\x30\x02'))
+        self.assertIsNone(lz77.get_compressed_size(data[1:-3]))
+        self.assertIsNone(lz77.get_compressed_size(b'\x10\x03\x00\x00\x01abc'))
+
+    def testCompress(self):
+        # the longest match, closest first, padded to 4 bytes like gbagfx
+        self.assertEqual(lz77.compress(b'abcabcabcde'), b'\x10\x0b\x00\x00\x10abc\x30\x02de')
+        self.assertEqual(lz77.compress(b'aaaa'), b'\x10\x04\x00\x00\x00aaaa\x00\x00\x00')
+        self.assertEqual(lz77.compress(b'aaaa', min_distance=1), b'\x10\x04\x00\x00\x40a\x00\x00')
+        with open('data/TextScriptWhoAmI.bin', 'rb') as bin_file:
+            data = bin_file.read()
+        compressed = lz77.compress(data)
+        self.assertEqual(lz77.decompress(compressed)[0], data)
+        self.assertEqual(lz77.get_compressed_size(compressed)[0], lz77.decompress(compressed)[1])
+
+    def testCompressArchives(self):
+        import tempfile
+        import shutil
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bin_path = os.path.join(tmp_dir, 'CompTextWhoAmI.s.bin')
+            shutil.copy('data/TextScriptWhoAmI.bin', bin_path)
+            with open(bin_path, 'rb') as bin_file:
+                data = bin_file.read()
+            text_script_scanner.Commands.compress_archives(None, None, [bin_path])
+            with open(os.path.join(tmp_dir, 'CompTextWhoAmI.s.lz'), 'rb') as lz_file:
+                self.assertEqual(lz_file.read(), lz77.compress(data))
+            # an archive that didn't change since it was compressed isn't written again
+            self.assertFalse(text_script_scanner.compress_file(bin_path, os.path.join(tmp_dir, 'CompTextWhoAmI.s.lz')))
+            self.assertRaises(text_script_scanner.TextScriptScannerException,
+                              text_script_scanner.Commands.compress_archives, None, None, [bin_path[:-4]])
+        with self.assertRaises(lz77.LZ77Exception):
+            lz77.compress(b'')
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.results_dir = tempfile.TemporaryDirectory()
+        self.calls = []
+
+    def tearDown(self):
+        self.results_dir.cleanup()
+
+    def compute(self, value):
+        self.calls.append(value)
+        return {'value': value, 'archives': [(0x1000, 4)]}
+
+    def cached(self, inputs, value, **kwargs):
+        return cache.cached(self.compute, 'compute', inputs, value, results_dir=self.results_dir.name, **kwargs)
+
+    def testCached(self):
+        self.assertEqual(self.cached(('a',), 1), {'value': 1, 'archives': [(0x1000, 4)]})
+        self.assertEqual(self.cached(('a',), 1), {'value': 1, 'archives': [(0x1000, 4)]})
+        self.assertEqual(self.calls, [1])
+        # other inputs are another entry
+        self.assertEqual(self.cached(('b',), 2)['value'], 2)
+        self.assertEqual(self.cached(('a',), 1)['value'], 1)
+        self.assertEqual(self.calls, [1, 2])
+
+    def testRecache(self):
+        self.cached(('a',), 1)
+        self.assertEqual(self.cached(('a',), 2, recache=True)['value'], 2)
+        self.assertEqual(self.cached(('a',), 3)['value'], 2)
+        self.assertEqual(self.calls, [1, 2])
+        # recaching something that was never cached works too
+        self.assertEqual(self.cached(('c',), 4, recache=True)['value'], 4)
+
+    def testCorruptedEntry(self):
+        self.cached(('a',), 1)
+        with open(cache.get_path('compute', cache.get_key('compute', ('a',)), self.results_dir.name), 'wb') as f:
+            f.write(b'\x80')
+        self.assertEqual(self.cached(('a',), 2)['value'], 2)
+
+    def testStaleEntry(self):
+        import pickle
+
+        class Stale:
+            def __reduce__(self):
+                # like an entry of a class whose arguments changed since
+                return int, ('stale',)
+
+        path = cache.get_path('compute', cache.get_key('compute', ('a',)), self.results_dir.name)
+        with open(path, 'wb') as f:
+            pickle.dump(Stale(), f)
+        self.assertEqual(self.cached(('a',), 1)['value'], 1)
+        self.assertEqual(self.cached(('a',), 2)['value'], 1)
+        self.assertEqual(self.calls, [1])
+
+    def testEviction(self):
+        import time
+        for i in range(3):
+            self.cached((i,), i)
+            time.sleep(0.01)
+        # using the oldest entry makes the second one the least recently used
+        self.cached((0,), 0)
+        entry_size = os.path.getsize(cache.get_path('compute', cache.get_key('compute', (0,)), self.results_dir.name))
+        cache.evict(self.results_dir.name, 2 * entry_size)
+        self.assertEqual(len(os.listdir(self.results_dir.name)), 2)
+        self.cached((0,), 0)
+        self.cached((2,), 2)
+        self.cached((1,), 1)
+        self.assertEqual(self.calls, [0, 1, 2, 1])
+
+    def testHashFile(self):
+        path = os.path.join(self.results_dir.name, 'rom.gba')
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 8)
+        digest = cache.hash_file(path)
+        self.assertEqual(cache.hash_file(path), digest)
+        with open(path, 'wb') as f:
+            f.write(b'\x01' * 9)
+        self.assertNotEqual(cache.hash_file(path), digest)
+
+    def testHashTree(self):
+        root_dir = self.results_dir.name
+        os.makedirs(os.path.join(root_dir, 'asm'))
+        os.makedirs(os.path.join(root_dir, 'data', 'textscript'))
+        with open(os.path.join(root_dir, 'asm', 'asm00.s'), 'w') as f:
+            f.write('nop\n')
+        digest = cache.hash_tree(root_dir, exclude_dirs=(os.path.join('data', 'textscript'),))
+        # dumping into an excluded folder keeps the fingerprint
+        with open(os.path.join(root_dir, 'data', 'textscript', 'TextScript0.s'), 'w') as f:
+            f.write('TextScript0::\n')
+        self.assertEqual(cache.hash_tree(root_dir, exclude_dirs=(os.path.join('data', 'textscript'),)), digest)
+        self.assertNotEqual(cache.hash_tree(root_dir), digest)
+        with open(os.path.join(root_dir, 'asm', 'asm01.s'), 'w') as f:
+            f.write('nop\n')
+        self.assertNotEqual(cache.hash_tree(root_dir, exclude_dirs=(os.path.join('data', 'textscript'),)), digest)
+
+
+class SourceUnitIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.units = [
+            {'ea': 0x8000200, 'name': 'b'},
+            {'ea': 0x8000100, 'name': 'a'},
+            {'ea': None, 'name': 'nolabel'},
+            {'name': 'noaddress'},
+            {'ea': 0x8000300, 'name': 'c'},
+            {'ea': 0x8000200, 'name': 'b2'},
+        ]
+        self.index = text_script_scanner.SourceUnitIndex(self.units)
+
+    def testLookups(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.unit_at(0x200)['name'], 'b')
+        self.assertEqual(self.index.unit_at(0x8000100)['name'], 'a')
+        self.assertIsNone(self.index.unit_at(0x180))
+        self.assertEqual(self.index.unit_containing(0x180)['name'], 'a')
+        self.assertEqual(self.index.unit_containing(0x2FF)['name'], 'b')
+        # at the start of a unit, before the first unit, or past the last one, of unknown size
+        self.assertIsNone(self.index.unit_containing(0x200))
+        self.assertIsNone(self.index.unit_containing(0x80))
+        self.assertIsNone(self.index.unit_containing(0x380))
+        self.assertEqual(self.index.next_unit_address(0x100), 0x8000200)
+        self.assertEqual(self.index.next_unit_address(0x80), 0x8000100)
+        self.assertIsNone(self.index.next_unit_address(0x300))
+        self.assertEqual(self.index.next_unit_after(0x250)['name'], 'c')
+
+    def testUnitsByAddress(self):
+        index = text_script_scanner.SourceUnitIndex(text_script_scanner.join_source_units_by_address(self.units))
+        self.assertEqual([unit['name'] for unit in index.unit_at(0x200)], ['b', 'b2'])
+        self.assertEqual(index.starts, self.index.starts)
+        self.assertEqual(text_script_scanner.find_archive_in_unit(index, 0x101)['name'], 'a')
+
+
+class DumpManifestTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.tmp_dir.name, 'TextScriptWhoAmI.s')
+        self.manifest_path = text_script_scanner.DumpManifest.get_path(self.tmp_dir.name)
+        tbl_path = os.path.join(self.tmp_dir.name, 'charmap.tbl')
+        with open(tbl_path, 'w') as tbl_file:
+            tbl_file.write('00= \n')
+        self.environment = text_script_scanner.DumpManifest.get_environment(ModuleState.INI_DIR, tbl_path)
+        self.inputs = text_script_scanner.DumpManifest.compute_inputs(self.environment, b'\x02\x00\xe6', 'TextScriptWhoAmI')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def testUpToDate(self):
+        import common
+        manifest = text_script_scanner.DumpManifest.load(self.manifest_path)
+        self.assertFalse(manifest.is_up_to_date(self.output_path, self.inputs))
+        self.assertTrue(common.write_if_changed(self.output_path, 'text_script 0\n'))
+        manifest.update(self.output_path, self.inputs)
+        manifest.save()
+
+        manifest = text_script_scanner.DumpManifest.load(self.manifest_path)
+        self.assertTrue(manifest.is_up_to_date(self.output_path, self.inputs))
+        # same content, so the output isn't written and stays up to date
+        self.assertFalse(common.write_if_changed(self.output_path, 'text_script 0\n'))
+        self.assertTrue(manifest.is_up_to_date(self.output_path, self.inputs))
+        # newlines are written as is on every platform, so the content compares equal on the next run
+        self.assertTrue(common.write_if_changed(self.output_path, 'text_script 0\r\ntext_script 1\n'))
+        with open(self.output_path, 'rb') as output_file:
+            self.assertEqual(output_file.read(), b'text_script 0\r\ntext_script 1\n')
+        self.assertFalse(common.write_if_changed(self.output_path, 'text_script 0\r\ntext_script 1\n'))
+        self.assertTrue(common.write_if_changed(self.output_path, 'text_script 0\n'))
+        # other source bytes, label, or command database
+        self.assertFalse(manifest.is_up_to_date(self.output_path, text_script_scanner.DumpManifest.compute_inputs(self.environment, b'\x02\x00\xe5', 'TextScriptWhoAmI')))
+        self.assertFalse(manifest.is_up_to_date(self.output_path, text_script_scanner.DumpManifest.compute_inputs(self.environment, b'\x02\x00\xe6', 'TextScript0')))
+        self.assertFalse(manifest.is_up_to_date(self.output_path, text_script_scanner.DumpManifest.compute_inputs('', b'\x02\x00\xe6', 'TextScriptWhoAmI')))
+
+    def testModifiedOutput(self):
+        manifest = text_script_scanner.DumpManifest.load(self.manifest_path)
+        with open(self.output_path, 'w') as output_file:
+            output_file.write('text_script 0\n')
+        manifest.update(self.output_path, self.inputs)
+        with open(self.output_path, 'a') as output_file:
+            output_file.write('\tend\n')
+        self.assertFalse(manifest.is_up_to_date(self.output_path, self.inputs))
+        os.remove(self.output_path)
+        self.assertFalse(manifest.is_up_to_date(self.output_path, self.inputs))
+
+
+class TextScriptServerTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.server = text_script_server.TextScriptServer('data/TextScriptWhoAmI.bin', cache_dir=self.cache_dir.name)
+        with open('data/TextScriptWhoAmI.bin', 'rb') as bin_file:
+            self.data = bin_file.read()
+            self.expected = TextScriptArchive.read_script(CommandContext(), 0, bin_file)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def testDump(self):
+        response = self.server.handle({'id': 'a', 'cmd': 'dump', 'address': '0x0', 'label': 'TextScriptWhoAmI'})
+        self.assertTrue(response['ok'], response)
+        self.assertEqual(response['id'], 'a')
+        self.assertEqual(response['text'], self.expected.build('TextScriptWhoAmI'))
+        self.assertEqual(response['end'], self.expected.size)
+        response = self.server.handle({'cmd': 'dump', 'data': self.data.hex(), 'label': 'TextScriptWhoAmI'})
+        self.assertEqual(response['text'], self.expected.build('TextScriptWhoAmI'))
+
+    def testErrors(self):
+        self.assertFalse(self.server.handle({'id': 1, 'cmd': 'dump'})['ok'])
+        self.assertFalse(self.server.handle({'id': 2, 'cmd': 'unknown'})['ok'])
+        self.assertFalse(json.loads(self.server.handle_line('{'))['ok'])
+        # .s files can't be serialized back, and archives are only read from the ROM of the server
+        self.assertFalse(self.server.handle({'id': 3, 'cmd': 'serialize', 'data': self.data.hex()})['ok'])
+        response = self.server.handle({'id': 4, 'cmd': 'dump', 'address': 0, 'file': 'data/TextScriptDialog87E30A0.bin'})
+        self.assertEqual(response['text'], self.expected.build())
+
+    def testSocketPath(self):
+        import socket
+        socket_path = os.path.join(self.cache_dir.name, 'server.sock')
+        # files other than sockets are never removed
+        with open(socket_path, 'w') as f:
+            f.write('not a socket')
+        self.assertRaises(text_script_server.TextScriptServerException,
+                          text_script_server.TextScriptServer.remove_stale_socket, socket_path)
+        self.assertTrue(os.path.exists(socket_path))
+        os.remove(socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server_socket:
+            server_socket.bind(socket_path)
+            server_socket.listen()
+            # a server listens on it
+            self.assertRaises(text_script_server.TextScriptServerException,
+                              text_script_server.TextScriptServer.remove_stale_socket, socket_path)
+        # left behind by a server that is gone
+        text_script_server.TextScriptServer.remove_stale_socket(socket_path)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def testConcurrentRequests(self):
+        requests = ''.join(json.dumps({'id': i, 'cmd': 'dump', 'address': 0}) + '\n' for i in range(16))
+        output = io.StringIO()
+        self.server.serve_stream(io.StringIO(requests), output, num_threads=4)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(response['id'] for response in responses), list(range(16)))
+        for response in responses:
+            self.assertEqual(response['text'], self.expected.build())
+
+    def testIniReload(self):
+        import tempfile
+        import shutil
+        with tempfile.TemporaryDirectory() as ini_dir:
+            for ini_name in CommandDatabase.INI_NAMES:
+                shutil.copy(os.path.join(ModuleState.INI_DIR, ini_name), ini_dir)
+            database = CommandDatabase.get(ini_dir)
+            self.assertIs(CommandDatabase.get(ini_dir), database)
+            with open(os.path.join(ini_dir, 'mmbn6.ini'), 'a') as ini_file:
+                ini_file.write('\n')
+            self.assertIsNot(CommandDatabase.get(ini_dir), database)
+
+
+class ProfilingTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.records_path = os.path.join(self.tmp_dir.name, 'records.jsonl')
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+        self.tmp_dir.cleanup()
+
+    def readArchive(self):
+        with open('data/TextScriptWhoAmI.bin', 'rb') as bin_file:
+            return TextScriptArchive.read_script(CommandContext(), 0, bin_file)
+
+    def testDisabled(self):
+        with profiling.span('parse', 4) as span:
+            span.size = 8
+        profiling.count('retries')
+        self.readArchive()
+        self.assertEqual(profiling.collect(), ({}, {}))
+
+    def testSpans(self):
+        profiling.enable(self.records_path)
+        archive = self.readArchive()
+        archive.build()
+        profiling.record(archive=0, size=archive.size)
+        spans, counters = profiling.collect()
+        self.assertEqual(spans['parse'][0], 1)
+        self.assertEqual(spans['parse'][2], archive.size)
+        self.assertEqual(spans['build'][0], 1)
+        self.assertEqual(counters['retries'], archive.retry_count)
+        # stats collected from jobs add up
+        profiling.merge((spans, counters))
+        profiling.merge((spans, counters))
+        self.assertIn('parse', profiling.format_table())
+        self.assertEqual(profiling.collect()[0]['parse'][0], 2)
+        profiling.disable()
+        with open(self.records_path, 'r') as records_file:
+            self.assertEqual([json.loads(line) for line in records_file], [{'archive': 0, 'size': archive.size}])
+
+
+class BenchmarkTests(unittest.TestCase):
+    def testScale(self):
+        case = next(case for case in benchmark.BenchmarkCase.load_fixtures() if case.name == 'TextScriptWhoAmI.bin')
+        command_context = CommandContext()
+        scaled = benchmark.BenchmarkCase.scale(case, command_context, 3 * len(case.data))
+        self.assertEqual(scaled.name, 'TextScriptWhoAmI.bin x3')
+        archive = case.read(command_context)
+        scaled_archive = scaled.read(command_context)
+        self.assertEqual(len(scaled_archive.rel_pointers), 3 * len(archive.rel_pointers))
+        self.assertEqual(scaled_archive.size, len(scaled.data))
+        # every copy of a script serializes the same as the original
+        self.assertEqual(scaled_archive.text_scripts[len(archive.text_scripts)].serialize(),
+                         archive.text_scripts[0].serialize())
+
+    def testRun(self):
+        cases = [case for case in benchmark.BenchmarkCase.load_fixtures() if case.name.startswith('decomp')]
+        results = benchmark.run(cases, repeat=1, startup=False)
+        metrics = results['cases']['decompTextScriptCredits86C4B58.bin']
+        self.assertEqual(metrics['size'], len(cases[0].data) - 4)
+        for metric in ('parse_mb_s', 'build_mb_s', 'serialize_mb_s', 'peak_memory_kb'):
+            self.assertGreater(metrics[metric], 0)
+        # the charmap of the bn6f repository is left as is
+        self.assertEqual(definitions.GAME_STRING_TBL_PATH,
+                         os.path.join(definitions.ROM_REPO_DIR, 'constants/bn6-charmap.tbl'))
+
+    def testCompare(self):
+        baseline = {'version': benchmark.VERSION, 'cases': {'a': {'size': 10, 'parse_mb_s': 2.0, 'peak_memory_kb': 100}}}
+        current = {'version': benchmark.VERSION, 'cases': {'a': {'size': 20, 'parse_mb_s': 1.0, 'peak_memory_kb': 110},
+                                                           'b': {'parse_mb_s': 1.0}}}
+        comparisons = benchmark.compare(baseline, current, 0.25)
+        # sizes aren't metrics, and cases missing from the baseline aren't compared
+        self.assertEqual([(name, metric, regressed) for name, metric, _, _, _, regressed in comparisons],
+                         [('a', 'parse_mb_s', True), ('a', 'peak_memory_kb', False)])
+        self.assertEqual(comparisons[0][4], -0.5)
+        # lower is better for memory
+        self.assertTrue(benchmark.compare(baseline, current, 0.05)[1][5])
+        current['version'] += 1
+        self.assertRaises(benchmark.BenchmarkException, benchmark.compare, baseline, current)
+
+    def testBaseline(self):
+        # the checked in baseline covers every case
+        baseline = benchmark.load()
+        self.assertEqual(baseline['version'], benchmark.VERSION)
+        names = [case.name for case in benchmark.BenchmarkCase.load_fixtures()]
+        names += ['{0} x'.format(name) for name in benchmark.SYNTHETIC_FIXTURES]
+        for name in names:
+            self.assertTrue(any(case.startswith(name) for case in baseline['cases']), name)
+        self.assertIn('startup', baseline['cases'])
+
+
+class ArchiveJobsTests(unittest.TestCase):
+    def setUp(self):
+        self.rom_path = 'data/TextScriptWhoAmI.bin'
+        self.jobs = [(0, None, 'TextScriptWhoAmI', None), (0, None, None, None), (1, None, None, None)]
+
+    def testResultsInOrder(self):
+        sequential = list(text_script_scanner.run_archive_jobs(text_script_scanner.read_archive_job, self.jobs, 1, self.rom_path))
+        parallel = list(text_script_scanner.run_archive_jobs(text_script_scanner.read_archive_job, self.jobs, 2, self.rom_path))
+        for results in (sequential, parallel):
+            self.assertEqual([result.key for result in results], [0, 0, 1])
+            with open('data/TextScriptWhoAmI.bin', 'rb') as bin_file:
+                self.assertEqual(results[0].text, TextScriptArchive.read_script(CommandContext(), 0, bin_file).build('TextScriptWhoAmI'))
+            self.assertIsNone(results[0].exception)
+            self.assertIsNone(results[1].text)
+            self.assertIsNotNone(results[0].hints)
+            # a job that fails does not stop the others
+            self.assertIsNotNone(results[2].exception)
+        self.assertEqual([result.text for result in sequential], [result.text for result in parallel])
+
+
 class ArchiveListTests(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -297,6 +1124,8 @@ class ArchiveListTests(unittest.TestCase):
         compressed_archives, regular_archives = text_script_scanner.cache_separate_archives_based_on_compression(self.archive_path, self.rom_path, archives)
         self.compressed_archives = compressed_archives
         self.noncompressed_archives = regular_archives
+        # number of processes to dump archives with, JOBS=<n> to run them in parallel
+        self.num_jobs = int(os.environ.get('JOBS', 1))
 
 
 
@@ -304,25 +1133,31 @@ class ArchiveListTests(unittest.TestCase):
     def test_noncompressed_textscripts(self):
         # asserts no crashes amongst all noncompressed archives in bn6f
         # and that they match original binary
-        for archive_ptr, archive_size in self.noncompressed_archives:
-            # some non-compressed scripts must have their size specified to know they ended...
-            # because their last scripts have been removed, but are still being pointed to.
-            if archive_ptr in definitions.SCRIPT_SIZES:
-                size = definitions.SCRIPT_SIZES[archive_ptr]
-            else:
-                size = None
-
-            with open(self.rom_path, 'rb') as rom_file:
-                textscript_archive = uut_dumper.TextScriptArchive.read_script(uut_dumper.CommandContext(), archive_ptr,
-                                                                      rom_file, size)
+        # some non-compressed scripts must have their size specified to know they ended...
+        # because their last scripts have been removed, but are still being pointed to.
+        jobs = [(archive_ptr, definitions.SCRIPT_SIZES.get(archive_ptr), None, None)
+                for archive_ptr, archive_size in self.noncompressed_archives]
+        results = text_script_scanner.run_archive_jobs(text_script_scanner.read_archive_job, jobs, self.num_jobs, self.rom_path)
+        for (archive_ptr, archive_size), result in zip(self.noncompressed_archives, results):
+            if result.exception is not None:
+                raise result.exception
 
     # @unittest.skip('skipped till passing in development')
     def test_compressed_textscripts(self):
         # asserts no crashes amongst all noncompressed archives in bn6f
         # and that they match original binary
+        jobs = [(archive_ptr, None) for archive_ptr, archive_size in self.compressed_archives]
+        results = text_script_scanner.run_archive_jobs(text_script_scanner.read_compressed_archive_job, jobs, self.num_jobs, self.rom_path)
+        for (archive_ptr, archive_size), result in zip(self.compressed_archives, results):
+            if result.exception is not None:
+                raise result.exception
+
+        # archives with a *.s.bin in the repository are also checked against their build
+        build_paths = self.get_build_paths()
         with open(self.rom_path, 'rb') as rom_file:
             for archive_ptr, archive_size in self.compressed_archives:
-                self.run_test_compressed_archive(rom_file, archive_ptr)
+                if any('{:07X}'.format(archive_ptr | 0x8000000) in path for path in build_paths):
+                    self.run_test_compressed_archive(rom_file, archive_ptr, build_paths)
 
     def test_comp_879DA74_ts_jump_random(self):
         with open(self.rom_path, 'rb') as rom_file:
@@ -421,36 +1256,40 @@ class ArchiveListTests(unittest.TestCase):
                     address += len(unit_data)
 
 
-    def run_test_compressed_archive(self, rom_file, archive_ptr):
-        decompress_path = 'TextScript%07X.lz.bin' % (archive_ptr)
-        text_script_scanner.gbagfx_decompress_at(rom_file, archive_ptr, decompress_path)
-        size = os.path.getsize(decompress_path) - 4  # must not account for the compression header!
-        with open(decompress_path, 'rb') as decompressed_file:
-            try:
-                textscript_archive = uut_dumper.TextScriptArchive.read_script(uut_dumper.CommandContext(), 4, decompressed_file, size)
-
-                decompressed_file.seek(4)
-                self.assert_archive_binary_matches(textscript_archive, decompressed_file)
-
-                # check for a *.bin in the repository that has the address on it
-                for root, dirs, files in os.walk(definitions.ROM_REPO_DIR):
-                    # filter out backup archives, they're guaranteed correct
-                    if 'backup_lz' in root:
-                        continue
-                    for filename in filter(lambda f: f.endswith('.s.bin'), iter(files)):
-                        path = os.path.join(root, filename)
-
-                        if '{:07X}'.format(archive_ptr | 0x8000000) in path:
-                            with open(path, 'rb') as build_file:
-                                print('{}: testing against build'.format(path))
-                                build_textscript_archive = uut_dumper.TextScriptArchive.read_script(uut_dumper.CommandContext(), 4, build_file, size)
-                                self.assert_text_script_archive_equals(textscript_archive, build_textscript_archive)
-                                self.assert_archive_binary_matches(textscript_archive, build_file)
-
-            # always make sure to delete the file, as we create it during the test
-            finally:
-                os.remove(decompress_path)
-
+    @staticmethod
+    def get_build_paths():
+        """
+        :return: the paths of the *.s.bin builds of archives in the repository
+        """
+        build_paths = []
+        for root, dirs, files in os.walk(definitions.ROM_REPO_DIR):
+            # filter out backup archives, they're guaranteed correct
+            if 'backup_lz' not in root:
+                build_paths += [os.path.join(root, filename) for filename in files if filename.endswith('.s.bin')]
+        return build_paths
+
+    def run_test_compressed_archive(self, rom_file, archive_ptr, build_paths=None):
+        """
+        :param build_paths: see get_build_paths, looked up if not given
+        """
+        data, compressed_size = lz77.decompress(uut_dumper.as_buffer(rom_file), archive_ptr)
+        size = len(data) - 4  # must not account for the compression header!
+        decompressed_file = io.BytesIO(data)
+        textscript_archive = uut_dumper.TextScriptArchive.read_script(uut_dumper.CommandContext(), 4, decompressed_file, size)
+
+        decompressed_file.seek(4)
+        self.assert_archive_binary_matches(textscript_archive, decompressed_file)
+
+        # check for a *.bin in the repository that has the address on it
+        if build_paths is None:
+            build_paths = self.get_build_paths()
+        for path in build_paths:
+            if '{:07X}'.format(archive_ptr | 0x8000000) in path:
+                with open(path, 'rb') as build_file:
+                    print('{}: testing against build'.format(path))
+                    build_textscript_archive = uut_dumper.TextScriptArchive.read_script(uut_dumper.CommandContext(), 4, build_file, size)
+                    self.assert_text_script_archive_equals(textscript_archive, build_textscript_archive)
+                    self.assert_archive_binary_matches(textscript_archive, build_file)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,13 @@
 import os
+import re
 import sys
-import configparser
+import mmap
+import threading
 import definitions
+import profiling
+
+# bumped whenever the same archive dumps to different text, so that dumps of older versions are redone
+DUMPER_VERSION = 1
 
 
 def read_custom_ini(ini_path: str) -> list:
@@ -29,7 +35,15 @@ class CommandSections:
         :param config_ini_path: the path to the command database ini in question
         :return: List of Lists of sections representing the groups belonging to a command each
         """
-        sects = read_custom_ini(config_ini_path)
+        return CommandSections.group_commands(read_custom_ini(config_ini_path))
+
+    @staticmethod
+    def group_commands(sects):
+        """
+        same as read_custom_ini_commands, over already read sections
+        :param sects: list of sections as read by read_custom_ini
+        :return: List of Lists of sections representing the groups belonging to a command each
+        """
         # TODO handle extension commands
         commands = []
         for sect in sects:
@@ -58,6 +72,15 @@ class CommandSections:
         else:
             return parameter_sect['name']
 
+    @staticmethod
+    def get_macro_name(name: str) -> str:
+        name = 'ts_' + name
+        # convert to snake case
+        for c in name:
+            if c.isupper():
+                name = name.replace(c, '_%c' % c.lower())
+        return name
+
     @staticmethod
     def get_ordered_parameters(command_sects):
         """
@@ -119,25 +142,379 @@ class ModuleState:
     # each family carries different masking
     BITFIELD_CMDS = [b'\xfa\x00', b'\xf2']
 
-class CommandContext:
-    sects = read_custom_ini(os.path.join(ModuleState.INI_DIR, 'mmbn6.ini'))
-    sects_s = read_custom_ini(os.path.join(ModuleState.INI_DIR, 'mmbn6s.ini'))
-    commands_sects = CommandSections.read_custom_ini_commands(os.path.join(ModuleState.INI_DIR, 'mmbn6.ini'))
-    commands_sects_s = CommandSections.read_custom_ini_commands(os.path.join(ModuleState.INI_DIR, 'mmbn6s.ini'))
+class ParameterSpec:
+    """
+    compiled representation of a Parameter or Length section
+    """
+    __slots__ = ('name', 'byte_offset', 'bit_offset', 'bits', 'num_bytes', 'value_mask', 'is_jump')
+
+    def __init__(self, param_sect: dict):
+        self.name = CommandSections.get_parameter_name(param_sect)
+        self.byte_offset, self.bit_offset = CommandSections.get_parameter_offset(param_sect)
+        self.bits = int(param_sect['bits'])
+        # number of bytes the value is read from, and the mask by the size: 4 bits would mask 0x0F
+        self.num_bytes = max(self.bits // 8, 1)
+        self.value_mask = 2 ** self.bits - 1
+        # jump commands go to a linked script
+        self.is_jump = 'jump' in self.name.lower() or self.name == 'target'
+
 
-    def __init__(self, ini_path=None):
-        if ini_path:
-            self.update_command_sects(ini_path)
+class CommandSpec:
+    """
+    compiled representation of a Command section and the sections belonging to it,
+    so that the mask, base and parameters aren't parsed again for every command decoded
+    """
+    __slots__ = ('order', 'sect', 'name', 'macro_name', 'mask', 'base', 'num_params',
+                 'is_bitfield', 'is_dynamic', 'is_priority', 'params')
+
+    def __init__(self, order: int, command_sects: list):
+        """
+        :param order: the position of the command in its database. earlier commands are matched first
+        :param command_sects: a command section and its related sections, as read by read_custom_ini_commands
+        """
+        sect = command_sects[0]
+        self.order = order
+        self.sect = sect
+        self.name = sect['name']
+        self.macro_name = CommandSections.get_macro_name(sect['name']).strip()
+        self.mask = tuple(int(b, 16) for b in sect['mask'].split(' '))
+        self.base = tuple(int(b, 16) for b in sect['base'].split(' '))
+        self.num_params = CommandSpec._count_params(sect, self.base)
+        self.is_bitfield = self.num_params == 1.5
+        self.is_dynamic = bytes(self.base) in ModuleState.DYNAMIC_CMDS
+        # priority commands can have more bytes than their base
+        self.is_priority = bytes(self.base[:1]) in ModuleState.PRIORITY_CMDS
+        self.params = tuple(ParameterSpec(s) for s in CommandSections.get_ordered_parameters(command_sects))
+
+    @staticmethod
+    def _count_params(sect: dict, base: tuple):
+        """
+        mostly, the number of parameters is simply the number of unmasked bytes.
+        see TextScriptCommand.find_param_count
+        :return: the number of parameters, 1.5 for bitfield parameters, or None if unsupported
+        """
+        nzeros = sect['mask'].count('0')
+        if nzeros % 2 == 0:
+            return nzeros // 2
+        elif len(base) > 2 and base[0:2] == (0xFA, 0x00) and nzeros == 3:
+            # weird bitfield case... only 3 zeros are supported
+            return 1.5
+        return None
+
+    def get_param_count(self):
+        """
+        :raises NotImplementedError: for multiple bitfield paramaters
+        """
+        if self.num_params is None:
+            raise NotImplementedError('multiple bitfield paramters are unsupported')
+        return self.num_params
+
+    def valid_params(self, cmd: bytes, params: bytes) -> bool:
+        # ensure parameters match, unless it's a command with dynamic parameters
+        if self.is_dynamic and len(cmd) == len(self.base):
+            return True
+        num_params = self.get_param_count()
+        return len(params) == num_params or num_params == 1.5
+
+    @staticmethod
+    def compile(commands_sects: list) -> list:
+        """
+        :param commands_sects: output of CommandSections.read_custom_ini_commands
+        :return: list of CommandSpec, in database order
+        """
+        return [CommandSpec(order, command_sects) for order, command_sects in enumerate(commands_sects)
+                if command_sects[0]['section'] in ['Command', 'Extension']]
+
+
+class CommandDispatch:
+    """
+    compiled lookup of the commands of one interpreter.
+    the first byte of a command indexes a 256-entry table, and every following byte walks down a trie built
+    from the mask/base of each command. Identifying a command costs one lookup per byte, instead of checking
+    every section of the database for every prefix length.
+    """
+    class Node:
+        __slots__ = ('children', 'specs', 'prefix_specs')
+
+        def __init__(self):
+            self.children = {}
+            # every command matching a command ending at this node, in database order
+            self.specs = []
+            # priority commands ending at this node or above it. they also match commands longer than their base
+            self.prefix_specs = []
+
+    def __init__(self, specs: list):
+        """
+        :param specs: list of CommandSpec of one interpreter
+        """
+        # nodes are shared between all paths that are matched by the same commands, so that masked bytes
+        # (like bitfield parameters) don't expand the trie 256 times over
+        nodes = {}
+
+        def matching_bytes(m, b):
+            if m == 0xFF:
+                return [b]
+            return [v for v in range(256) if v & m == b]
+
+        def build_children(candidates, depth: int, inherited: tuple) -> dict:
+            by_value = {}
+            for spec in filter(lambda spec: len(spec.base) > depth, candidates):
+                for v in matching_bytes(spec.mask[depth], spec.base[depth]):
+                    by_value.setdefault(v, []).append(spec)
+            return {v: get_node(tuple(matched), depth, inherited) for v, matched in by_value.items()}
+
+        def get_node(matched: tuple, depth: int, inherited: tuple) -> CommandDispatch.Node:
+            key = (matched, depth, inherited)
+            if key not in nodes:
+                node = CommandDispatch.Node()
+                ending = [spec for spec in matched if len(spec.base) == depth + 1]
+                node.specs = sorted(ending + list(inherited), key=lambda spec: spec.order)
+                # priority commands can have more bytes than their base
+                node.prefix_specs = sorted(list(inherited) + [spec for spec in ending if spec.is_priority],
+                                           key=lambda spec: spec.order)
+                node.children = build_children(matched, depth + 1, tuple(node.prefix_specs))
+                nodes[key] = node
+            return nodes[key]
+
+        root = build_children(specs, 0, ())
+        self.table = [root.get(v) for v in range(256)]
+        # memo of find_command_spec, filled as commands are identified. It is read without the lock, which only
+        # guards additions, since the dispatch is shared by every thread. not part of the pickled artifact
+        self.command_specs = {}
+        self.command_specs_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # the memo depends on what was parsed before the artifact was written, and the lock can't be pickled
+        state = dict(self.__dict__)
+        del state['command_specs']
+        del state['command_specs_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        state.pop('command_specs', None)
+        self.__dict__.update(state)
+        self.command_specs = {}
+        self.command_specs_lock = threading.Lock()
+
+    def find_specs(self, cmd: bytes) -> list:
+        """
+        :return: every CommandSpec whose base matches cmd, in database order
+        """
+        if not cmd:
+            return []
+        node = self.table[cmd[0]]
+        for i in range(1, len(cmd)):
+            if node is None:
+                return []
+            child = node.children.get(cmd[i])
+            if child is None:
+                # only priority commands match past the end of their base
+                return node.prefix_specs
+            node = child
+        return node.specs if node is not None else []
+
+    def find_param_count(self, cmd: bytes) -> (int, CommandSpec):
+        """
+        same as TextScriptCommand.find_param_count, over the compiled commands
+        :raises NotImplementedError: for multiple bitfield paramaters
+        """
+        specs = self.find_specs(cmd)
+        if not specs:
+            return -1, None
+        return specs[0].get_param_count(), specs[0]
+
+    def find_command_spec(self, cmd: bytes, params: bytes) -> CommandSpec or None:
+        """
+        same as TextScriptCommand.find_command_section, over the compiled commands
+        """
+        # only the length of params matters, so identical commands are resolved once
+        key = (cmd, len(params))
+        try:
+            return self.command_specs[key]
+        except KeyError:
+            pass
+        for spec in self.find_specs(cmd):
+            if spec.valid_params(cmd, params):
+                break
+        else:
+            spec = None
+        with self.command_specs_lock:
+            return self.command_specs.setdefault(key, spec)
+
+
+class CommandDatabase:
+    """
+    the command databases of both interpreters, read from the ini files and compiled.
+    Compiling is cached to disk, keyed by the content of the ini files, see CommandDatabase.load
+    """
+    # bump whenever the compiled representation changes, to invalidate artifacts from older versions
+    VERSION = 2
+    INI_NAMES = ['mmbn6.ini', 'mmbn6s.ini']
+
+    # databases loaded in this process, by ini directory
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, ini_dir: str):
+        """
+        :param ini_dir: directory containing mmbn6.ini and mmbn6s.ini
+        """
+        self.sects = read_custom_ini(os.path.join(ini_dir, 'mmbn6.ini'))
+        self.sects_s = read_custom_ini(os.path.join(ini_dir, 'mmbn6s.ini'))
+        self.commands_sects = CommandSections.group_commands(self.sects)
+        self.commands_sects_s = CommandSections.group_commands(self.sects_s)
+        self.specs = CommandSpec.compile(self.commands_sects)
+        self.specs_s = CommandSpec.compile(self.commands_sects_s)
+        self.dispatch = CommandDispatch(self.specs)
+        self.dispatch_s = CommandDispatch(self.specs_s)
+
+    @staticmethod
+    def compute_hash(ini_dir: str) -> str:
+        import hashlib
+        h = hashlib.sha1(str(CommandDatabase.VERSION).encode())
+        for ini_name in CommandDatabase.INI_NAMES:
+            with open(os.path.join(ini_dir, ini_name), 'rb') as ini_file:
+                h.update(ini_file.read())
+        return h.hexdigest()
+
+    @staticmethod
+    def get_artifact_path(ini_dir: str, cache_dir: str) -> str:
+        return os.path.join(cache_dir, 'command_db.{0}.pickle'.format(CommandDatabase.compute_hash(ini_dir)))
+
+    @staticmethod
+    def load(ini_dir: str, cache_dir: str=definitions.CACHE_DIR) -> 'CommandDatabase':
+        """
+        loads the compiled command database from its artifact in :cache_dir:. If the artifact is missing
+        or was produced from different ini files, the database is compiled again and the artifact is rewritten.
+        :param ini_dir: directory containing mmbn6.ini and mmbn6s.ini
+        :param cache_dir: directory to store the compiled artifact in
+        """
+        import pickle
+        artifact_path = CommandDatabase.get_artifact_path(ini_dir, cache_dir)
+        if os.path.exists(artifact_path):
+            try:
+                with open(artifact_path, 'rb') as artifact_file:
+                    return pickle.load(artifact_file)
+            except Exception:
+                # corrupt or incompatible artifact, compile it again
+                pass
+
+        database = CommandDatabase(ini_dir)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write atomically, so that concurrent processes never load a partial artifact
+            tmp_path = '{0}.{1}.tmp'.format(artifact_path, os.getpid())
+            with open(tmp_path, 'wb') as artifact_file:
+                pickle.dump(database, artifact_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, artifact_path)
+        except OSError:
+            # caching is only an optimization
+            pass
+        return database
+
+    @staticmethod
+    def get_version(ini_dir: str) -> tuple:
+        """
+        :return: the size and modification time of the ini files, which change whenever they are edited
+        """
+        version = []
+        for ini_name in CommandDatabase.INI_NAMES:
+            stat = os.stat(os.path.join(ini_dir, ini_name))
+            version += [stat.st_size, stat.st_mtime_ns]
+        return tuple(version)
+
+    @staticmethod
+    def get(ini_dir: str) -> 'CommandDatabase':
+        """
+        same as CommandDatabase.load, but only loads once per process for each ini directory.
+        ini files that changed on disk since they were loaded are loaded again, for long running processes
+        """
+        key = os.path.abspath(ini_dir)
+        version = CommandDatabase.get_version(ini_dir)
+        with CommandDatabase._loaded_lock:
+            if key not in CommandDatabase._loaded or CommandDatabase._loaded[key][0] != version:
+                with profiling.span('ini'):
+                    CommandDatabase._loaded[key] = (version, CommandDatabase.load(ini_dir))
+            return CommandDatabase._loaded[key][1]
+
+
+class CommandContext:
+    """
+    required knowledge to be able to identify and parse commands. The command database is only loaded on first use,
+    and shared between all contexts using the same ini directory.
+    A context carries the address and the diagnostics of what it reads and builds, so archives can be read and built
+    concurrently, with a context each.
+    """
+    def __init__(self, ini_path=None, address: int=None, raise_all: bool=None):
+        """
+        :param ini_path: directory of the command database ini files to use. defaults to ModuleState.INI_DIR
+        :param address: the address of the archive, which its default labels are based on. see TextScript.get_label.
+            defaults to ModuleState.address, for callers that still set it
+        :param raise_all: if True, non critical errors are raised too. defaults to ModuleState.RAISE_ALL
+        """
+        self.ini_path = ini_path
+        self._database = None
+        self.address = address
+        self.raise_all = raise_all
+        # messages of the non critical errors since clear_errors
+        self.errors = []
 
     def update_command_sects(self, ini_path):
         """
-        :param sects: list of command dictionaries using the regular interpreter
-        :param sects_s: list of command dictionaries using the secondary interpreter
+        :param ini_path: directory of the command database ini files to use
+        """
+        self.ini_path = ini_path
+        self._database = None
+
+    @property
+    def database(self) -> CommandDatabase:
+        if self._database is None:
+            self._database = CommandDatabase.get(self.ini_path if self.ini_path else ModuleState.INI_DIR)
+        return self._database
+
+    # list of command dictionaries using the regular and secondary interpreter
+    sects = property(lambda self: self.database.sects)
+    sects_s = property(lambda self: self.database.sects_s)
+    commands_sects = property(lambda self: self.database.commands_sects)
+    commands_sects_s = property(lambda self: self.database.commands_sects_s)
+    # compiled once per interpreter, used to identify and build commands
+    specs = property(lambda self: self.database.specs)
+    specs_s = property(lambda self: self.database.specs_s)
+    dispatch = property(lambda self: self.database.dispatch)
+    dispatch_s = property(lambda self: self.database.dispatch_s)
+
+    def get_label(self) -> str:
+        """
+        :return: the default prefix of the labels of the scripts being built, from the address of the context
         """
-        self.sects = read_custom_ini(os.path.join(ini_path, 'mmbn6.ini'))
-        self.sects_s = read_custom_ini(os.path.join(ini_path, 'mmbn6s.ini'))
-        self.commands_sects = CommandSections.read_custom_ini_commands(os.path.join(ini_path, 'mmbn6.ini'))
-        self.commands_sects_s = CommandSections.read_custom_ini_commands(os.path.join(ini_path, 'mmbn6s.ini'))
+        return TextScript.get_label(self.address)
+
+    def error(self, exception, msg, critical=True):
+        """
+        reports an error while reading or building. Critical errors are raised, others are collected in errors.
+        unlike the module level error, error.list is left alone, which is only kept for the callers of error
+        """
+        raise_all = ModuleState.RAISE_ALL if self.raise_all is None else self.raise_all
+        if critical or raise_all:
+            raise exception(msg)
+        self.errors.append(msg)
+
+    def clear_errors(self):
+        self.errors = []
+
+
+class DumpSession(CommandContext):
+    """
+    a command context for dumping one archive, which never falls back on ModuleState for its address or
+    whether to raise non critical errors
+    """
+    def __init__(self, address: int=0, ini_path=None, raise_all: bool=None):
+        """
+        :param address: see CommandContext
+        :param ini_path: see CommandContext
+        :param raise_all: see CommandContext. defaults to ModuleState.RAISE_ALL when the session is created
+        """
+        super().__init__(ini_path, address, ModuleState.RAISE_ALL if raise_all is None else raise_all)
 
 
 def printlocals(locals, halt=False):
@@ -164,6 +541,8 @@ def error(exception, msg, critical=True):
     for debugging purposes, sometimes it's useful to see the faulty output than to
     completely halt execution. Also doubles as a logging means for those errors in that case.
     specify critical to False for an exception not to be raised.
+    kept for backwards compatibility: error.list is shared by the whole process, contexts collect their own errors
+    instead, see CommandContext.error
     """
     if 'list' not in error.__dict__:
         error.list = []
@@ -175,6 +554,333 @@ def error(exception, msg, critical=True):
 error.list = []
 
 
+class SerializationMismatch:
+    """
+    the first difference between a serialized archive and the binary it should match,
+    see TextScriptArchive.verify_against
+    """
+    __slots__ = ('offset', 'script_idx', 'unit')
+
+    def __init__(self, offset: int, script_idx: int or None, unit):
+        """
+        :param offset: offset of the first mismatching byte, relative to the archive
+        :param script_idx: index of the script owning the mismatching unit. None for the relative pointers, or
+            for data past the end of the archive
+        :param unit: the mismatching unit, if any
+        """
+        self.offset = offset
+        self.script_idx = script_idx
+        self.unit = unit
+
+    @staticmethod
+    def find(source: memoryview, offset: int, data: bytes, script_idx: int or None, unit) -> 'SerializationMismatch':
+        """
+        :param offset: offset of :data: in :source:, which are known to mismatch
+        :return: the mismatch at the first byte of :data: that is not in :source:
+        """
+        chunk = source[offset:offset + len(data)]
+        for i in range(len(data)):
+            if i >= len(chunk) or chunk[i] != data[i]:
+                return SerializationMismatch(offset + i, script_idx, unit)
+        return SerializationMismatch(offset + len(data), script_idx, unit)
+
+    def __str__(self):
+        if self.unit is None:
+            return 'mismatch at 0x{0:X}'.format(self.offset)
+        return 'mismatch at 0x{0:X} in script {1}: {2}'.format(self.offset, self.script_idx, self.unit)
+
+
+def copy_to_buffer(data: bytes, buffer=None, offset: int=0):
+    """
+    :param data: serialized data
+    :param buffer: preallocated writable buffer to copy :data: into at :offset:. if None, a new bytearray is used
+    :return: the buffer copied into
+    """
+    if buffer is None:
+        return bytearray(data)
+    if offset + len(data) > len(buffer):
+        raise ValueError('buffer of size 0x{0:X} is too small for 0x{1:X} bytes at 0x{2:X}'
+                         .format(len(buffer), len(data), offset))
+    buffer[offset:offset + len(data)] = data
+    return buffer
+
+
+def as_buffer(bin_file) -> memoryview:
+    """
+    the parser works on offsets into a buffer of the whole file, instead of reading it byte by byte.
+    files on disk opened for reading are memory mapped rather than read. to share one map of the ROM
+    between many reads, pass the buffer of common.map_file instead
+    :param bin_file: a bytes-like object, or a binary file stream
+    :return: memoryview over the entire content of :bin_file:. the position of a file stream is left unchanged
+    """
+    if isinstance(bin_file, (bytes, bytearray, memoryview, mmap.mmap)):
+        return memoryview(bin_file)
+    if getattr(bin_file, 'mode', None) == 'rb':
+        try:
+            # empty files cannot be mapped
+            if os.fstat(bin_file.fileno()).st_size:
+                return memoryview(mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            # not a regular file, like a pipe
+            pass
+    pos = bin_file.tell()
+    bin_file.seek(0)
+    data = bin_file.read()
+    bin_file.seek(pos)
+    return memoryview(data)
+
+
+# bytes that are processed as part of a string, rather than as a command
+GAME_STRING_CHARS = [b < 0xE5 or b == 0xE6 or b == 0xE9 for b in range(256)]
+
+# runs of string bytes, so that strings are found in bulk rather than byte by byte.
+# when scripts terminate at end_script, an E6 ends the run instead
+GAME_STRING_RUN = re.compile(b'[\\x00-\\xE4\\xE6\\xE9]*')
+GAME_STRING_RUN_TO_END = re.compile(b'[\\x00-\\xE4\\xE9]*')
+# lines of a string run, each ending with E9 except possibly the last
+GAME_STRING_LINE = re.compile(b'[^\\xE9]*\\xE9|[^\\xE9]+')
+
+
+class ParseMemo:
+    """
+    packrat memo of the units decoded while reading an archive, by offset. When a script fails to parse with one
+    interpreter and is read again with the other, the units that decode the same with both (strings, and commands
+    the secondary interpreter takes from the first) are reused rather than decoded again
+    """
+    def __init__(self):
+        # (offset, script_end, end_byte) -> output of TextScript.read_string_run
+        self.string_runs = {}
+        # (offset, use_first_interpreter) -> output of TextScriptCommand.read_buffer
+        self.commands = {}
+        # furthest offset decoded, and up to where the script being retried was decoded before
+        self.decoded_end = 0
+        self.retry_end = 0
+        # number of bytes that had to be decoded again when retrying scripts, and number of scripts retried
+        self.reparsed_size = 0
+        self.retry_count = 0
+
+    def begin_script(self, script_idx: int, pos: int):
+        """
+        marks that the script :script_idx: at :pos: starts being read. only used for accounting, see ParseAccounting
+        """
+        pass
+
+    def begin_retry(self, rewind_pos: int=None, exception: Exception=None):
+        """
+        marks that the script being read is read again, after failing with the other interpreter
+        :param rewind_pos: the offset the script is read again from
+        :param exception: what the other interpreter failed with
+        """
+        self.retry_end = self.decoded_end
+        self.retry_count += 1
+
+    def _decoded(self, start: int, end: int):
+        if start < self.retry_end:
+            self.reparsed_size += min(end, self.retry_end) - start
+        self.decoded_end = max(self.decoded_end, end)
+
+    def read_string_run(self, buf: memoryview, start: int, script_end: int, end_byte: int) -> (list, int or None, int):
+        """
+        same as TextScript.read_string_run, only decoding the strings at :start: once
+        """
+        key = (start, script_end, end_byte)
+        string_run = self.string_runs.get(key)
+        if string_run is None:
+            string_run = TextScript.read_string_run(buf, start, script_end, end_byte)
+            self.string_runs[key] = string_run
+            self._decoded(start, string_run[2])
+        return string_run
+
+    def get_command(self, pos: int, use_first_interpreter) -> ('TextScriptCommand', int) or None:
+        return self.commands.get((pos, use_first_interpreter))
+
+    def add_command(self, pos: int, use_first_interpreter, command: ('TextScriptCommand', int), decoded_from: int=None):
+        """
+        :param pos: the offset the command was read at, see TextScriptCommand.read_buffer
+        :param command: the command and the offset right after it
+        :param decoded_from: the offset the bytes of the command were decoded from, if they were
+        """
+        self.commands[(pos, use_first_interpreter)] = command
+        if decoded_from is not None:
+            self._decoded(decoded_from, command[1])
+
+
+class ParseAccounting:
+    """
+    account of how the parser went through the buffer of an archive, per script, to find the archives and commands
+    that make it backtrack. Pass one to TextScriptArchive.read_script to fill it in; parsing without one is not slowed.
+    every script has a record of:
+    - script: its index, offset: its offset in the archive, attempt: which parse of the archive it's from,
+      as stale interpreter hints make the archive parsed twice
+    - units: units decoded, decoded_size: bytes decoded, reparsed_size: bytes decoded again after a rewind
+    - memo_hits: units reused instead of being decoded again
+    - rewinds: times the script was read again with the other interpreter, rewind_size: bytes rewound
+    - failure: the error the other interpreter failed with, which tells the command that caused the rewind
+    """
+    __slots__ = ('scripts', 'attempts')
+
+    FIELDS = ('units', 'decoded_size', 'reparsed_size', 'memo_hits', 'rewinds', 'rewind_size')
+
+    def __init__(self):
+        self.scripts = []
+        self.attempts = 0
+
+    def create_memo(self, address: int) -> 'ParseMemo':
+        """
+        :param address: the offset of the archive in the buffer
+        :return: the memo to parse the archive with, which accounts for the parse into this
+        """
+        self.attempts += 1
+        return AccountingParseMemo(self, address)
+
+    def get_totals(self) -> dict:
+        """
+        :return: the sum of every field of the scripts, and the number of scripts that were rewound
+        """
+        totals = {field: sum(script[field] for script in self.scripts) for field in ParseAccounting.FIELDS}
+        totals['rewound_scripts'] = sum(1 for script in self.scripts if script['rewinds'])
+        return totals
+
+    def get_backtracking_scripts(self) -> list:
+        """
+        :return: the records of the scripts that were rewound or decoded again, most bytes decoded again first
+        """
+        scripts = [script for script in self.scripts if script['rewinds'] or script['reparsed_size']]
+        return sorted(scripts, key=lambda script: (-script['reparsed_size'], -script['rewind_size']))
+
+
+class AccountingParseMemo(ParseMemo):
+    """
+    ParseMemo that accounts for every unit decoded or reused into a ParseAccounting
+    """
+    def __init__(self, accounting: ParseAccounting, address: int):
+        super().__init__()
+        self.accounting = accounting
+        self.address = address
+        self.script = None
+
+    def begin_script(self, script_idx: int, pos: int):
+        self.script = {'script': script_idx, 'offset': pos - self.address, 'attempt': self.accounting.attempts,
+                       'units': 0, 'decoded_size': 0, 'reparsed_size': 0, 'memo_hits': 0, 'rewinds': 0,
+                       'rewind_size': 0, 'failure': None}
+        self.accounting.scripts.append(self.script)
+
+    def begin_retry(self, rewind_pos: int=None, exception: Exception=None):
+        if rewind_pos is not None:
+            self.script['rewind_size'] += self.decoded_end - rewind_pos
+        self.script['rewinds'] += 1
+        if exception is not None:
+            self.script['failure'] = str(exception)
+        super().begin_retry(rewind_pos, exception)
+
+    def _decoded(self, start: int, end: int):
+        reparsed_size = self.reparsed_size
+        super()._decoded(start, end)
+        self.script['units'] += 1
+        self.script['decoded_size'] += end - start
+        self.script['reparsed_size'] += self.reparsed_size - reparsed_size
+
+    def read_string_run(self, buf: memoryview, start: int, script_end: int, end_byte: int) -> (list, int or None, int):
+        if (start, script_end, end_byte) in self.string_runs:
+            self.script['memo_hits'] += 1
+        return super().read_string_run(buf, start, script_end, end_byte)
+
+    def get_command(self, pos: int, use_first_interpreter) -> ('TextScriptCommand', int) or None:
+        command = super().get_command(pos, use_first_interpreter)
+        if command is not None:
+            self.script['memo_hits'] += 1
+        return command
+
+
+class InterpreterHints:
+    """
+    persistent record of the interpreter each script of an archive was parsed with, keyed by archive address and
+    script index. TextScriptArchive.read_buffer tries the recorded interpreter first, so that scripts using
+    CONFLICT_CMDS are not parsed twice on every run. Hints are only trusted if the archive bytes did not change
+    """
+    VERSION = 1
+
+    def __init__(self, path: str=None):
+        """
+        :param path: file the hints are saved to, see InterpreterHints.get_path
+        """
+        self.path = path
+        # archive key -> {'crc': crc32 of the archive bytes, 'scripts': [use_first_interpreter or None per script]}
+        self.archives = {}
+        self.modified = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_path(command_context: CommandContext, cache_dir: str=definitions.CACHE_DIR) -> str:
+        """
+        hints depend on the command database, so every version of it has its own hint file
+        """
+        ini_dir = command_context.ini_path if command_context.ini_path else ModuleState.INI_DIR
+        return os.path.join(cache_dir, 'interpreter_hints.{0}.json'.format(CommandDatabase.compute_hash(ini_dir)))
+
+    @staticmethod
+    def load(path: str) -> 'InterpreterHints':
+        """
+        loads the hints saved to :path:. If they are missing or unreadable, starts with no hints
+        """
+        import json
+        hints = InterpreterHints(path)
+        try:
+            with open(path, 'r') as hints_file:
+                content = json.load(hints_file)
+            if content['version'] == InterpreterHints.VERSION:
+                hints.archives = content['archives']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return hints
+
+    def save(self):
+        """
+        writes the hints back to their file if they were changed. Failing to write them is not an error
+        """
+        import json
+        with self.lock:
+            if not self.modified or self.path is None:
+                return
+            content = json.dumps({'version': InterpreterHints.VERSION, 'archives': self.archives})
+            self.modified = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write atomically, so that concurrent processes never load partial hints
+            tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as hints_file:
+                hints_file.write(content)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def get_key(address) -> str:
+        return '%X' % address if isinstance(address, int) else str(address)
+
+    def get(self, address) -> (int, list) or None:
+        """
+        :param address: archive address, or any other name identifying the archive
+        :return: crc32 of the archive bytes and the interpreter hint of each script, if the archive is known
+        """
+        entry = self.archives.get(InterpreterHints.get_key(address))
+        if entry is None:
+            return None
+        return entry['crc'], entry['scripts']
+
+    def update(self, address, crc: int, scripts: list):
+        """
+        records the interpreter used by each script of the archive at :address:
+        :param crc: crc32 of the archive bytes
+        :param scripts: use_first_interpreter for each script, None for empty scripts
+        """
+        key = InterpreterHints.get_key(address)
+        entry = {'crc': crc, 'scripts': scripts}
+        with self.lock:
+            if self.archives.get(key) != entry:
+                self.archives[key] = entry
+                self.modified = True
+
 
 class TextScript:
     def __init__(self, command_context: CommandContext, units: list, archive_idx: int, addr: int, size: int):
@@ -202,94 +908,133 @@ class TextScript:
             size is provided.
         :return: TextScript object representation
         """
-        addr = bin_file.tell()
-
-        def in_script(bin_file, byte, size: int) -> bool:
-            """
-            checks if the script has ended by checking for the current presence of an end_script command, or
-            if the script size has been reached
-            in the absense of size, end_script is the only sign to termination. However, size overrides it.
-            it is possible for a command to come after end_script in a script.
-            :param bin_file: the file reading the bytecode from
-            :param byte: current byte in the bytecode
-            :param size: size of the textscript
-            :return: true if we haven't reached the end of this textscript
-            """
-            if not size: # zero or None
-                return byte != b'\xE6'
-            else:
-                return bin_file.tell() < addr + size
+        text_script, pos = TextScript.read_buffer(command_context, as_buffer(bin_file), bin_file.tell(), size,
+                                                  archive_idx, use_first_interpreter)
+        bin_file.seek(pos)
+        return text_script
 
-        def is_valid_game_string_char(byte) -> bool:
-            return byte != b'' and (ord(byte) < 0xE5 or ord(byte) == 0xE6 or ord(byte) == 0xE9)
+    @staticmethod
+    def read_buffer(command_context: CommandContext, buf: memoryview, pos: int, size: int, archive_idx: int,
+                    use_first_interpreter=True, memo: 'ParseMemo'=None) -> ('TextScript', int):
+        """
+        same as TextScript.read, but parses from an offset into a buffer
+        :param buf: the buffer to parse from, see as_buffer
+        :param pos: the offset of the textscript in :buf:
+        :param memo: units already decoded from :buf:, reused instead of being decoded again
+        :return: TextScript object representation, and the offset right after it
+        """
+        addr = pos
+        end = len(buf)
+        is_string_char = GAME_STRING_CHARS
+        read_command = TextScriptCommand.read_buffer
+        read_string_run = TextScript.read_string_run
+        # a script ends at end_script in the absence of size. However, size overrides it.
+        # it is possible for a command to come after end_script in a script.
+        if not size: # zero or None
+            script_end = end + 1
+            end_byte = 0xE6
+        else:
+            script_end = addr + size
+            end_byte = -1
 
         # process TextScript units (commands or strings)
-        byte = bin_file.read(1)
+        # :byte: is the current byte in the bytecode (None once the end of the buffer is reached),
+        # and :pos: is always the offset right after it
+        byte = None
+        if pos < end:
+            byte = buf[pos]
+            pos += 1
         units = []  # text script discrete string/cmd units
         while True:
-            def read_string_lines(bin_file, byte, size):
-                out = []
-                string = b''
-                # we need to force shut this down, due to the rare case of scripts ending mid-string...
-                while in_script(bin_file, byte, size) and is_valid_game_string_char(byte):
-                    # not a command, process string
-                    string = string + byte
-                    if ord(byte) == 0xE9:
-                        # separate strings by line
-                        out.append(GameString(string))
-                        string = b''
-                    byte = bin_file.read(1)
-
-                # a string may contain an end_script character, even though it terminates our search
-                if byte == b'\xE6':
-                    string = string + byte
-                elif is_valid_game_string_char(byte):
-                    # this means that the script has reached its end with a string character that is not E6
-                    # must be included in the string as well
-                    string = string + byte
-
-                if string != b'':
-                    out.append(GameString(string))
-
-                return out, byte
-
             # reached end of file, cannot process any more
-            if byte == b'':
+            if byte is None:
                 break
 
-            if is_valid_game_string_char(byte):
+            if is_string_char[byte]:
                 # read strings, which may be multiple line-separated units
-                strings, byte = read_string_lines(bin_file, byte, size)
-                if strings != []:
-                    units.extend(strings)
+                if memo is None:
+                    lines, byte, pos = read_string_run(buf, pos - 1, script_end, end_byte)
+                else:
+                    lines, byte, pos = memo.read_string_run(buf, pos - 1, script_end, end_byte)
+                units += lines
+                if lines:
                     # if a command comes right after the text in the same script, it needs to be parsed as well
-                    #   read_string_lines already advanced to the command byte, so it has to be interpreted too, next iteration.
-                    if byte > b'\xE6':
+                    #   the string scan already advanced to the command byte, so it has to be interpreted too, next iteration.
+                    if byte is not None and byte > 0xE6:
                         continue
             else:
                 # read current bytecode command
-                units.append(TextScriptCommand.read(command_context, bin_file, byte,
-                                                    use_first_interpreter))
+                unit, pos = read_command(command_context, buf, pos, bytes([byte]), use_first_interpreter, memo)
+                units.append(unit)
 
             # do while the script has not ended
-            if not in_script(bin_file, byte, size):
+            if byte == end_byte or pos >= script_end:
                 break
 
-            byte = bin_file.read(1)
+            if pos < end:
+                byte = buf[pos]
+                pos += 1
+            else:
+                byte = None
 
         # compute script size. ensure it matches with expected size if given
-        computed_size = bin_file.tell() - addr
+        computed_size = pos - addr
         if size is not None and size != computed_size:
             raise TextScriptException('computed script size {computed_size} does not match expected size of {size}'.format(**vars()))
 
         # FIXME: don't pass addr, it's not actually relative to the archive address, it's based purely on the location in bin_file
-        return TextScript(command_context, units, archive_idx, addr, computed_size)
+        return TextScript(command_context, units, archive_idx, addr, computed_size), pos
 
-    def build(self) -> str:
+    @staticmethod
+    def read_string_run(buf: memoryview, start: int, script_end: int, end_byte: int) -> (list, int or None, int):
+        """
+        reads the strings starting at :start:, up to the next command
+        :param script_end: the offset the script ends at, if its size is known
+        :param end_byte: E6 if the script ends at end_script, otherwise -1
+        :return: the strings, separated by line, the byte right after them (None if the end of the buffer
+            was reached), and the offset right after that byte
+        """
+        end = len(buf)
+        string_run = GAME_STRING_RUN if end_byte == -1 else GAME_STRING_RUN_TO_END
+        # the run stops at the first command byte (or end_script), and we need to force shut it down
+        # before the last byte of the script, due to the rare case of scripts ending mid-string...
+        run_end = min(script_end - 1, end)
+        if run_end > start:
+            run_end = string_run.match(buf, start, run_end).end()
+        else:
+            run_end = start
+        if run_end < end:
+            byte = buf[run_end]
+            pos = run_end + 1
+        else:
+            byte = None
+            pos = end
+
+        # a string may contain an end_script character, even though it terminates our search
+        # if the script has reached its end with a string character that is not E6, it must be included as well
+        if byte is not None and GAME_STRING_CHARS[byte]:
+            string_end = pos
+        else:
+            string_end = pos - 1 if byte is not None else pos
+
+        # separate strings by line
+        lines = [GameString(line) for line in GAME_STRING_LINE.findall(bytes(buf[start:string_end]))]
+        return lines, byte, pos
+
+    def build(self, label: str=None) -> str:
         """
         builds the TextScript into a text format
+        :param label: prefix of the labels of the scripts of the archive, see get_label
+        """
+        return ''.join(self.iter_build(label))
+
+    def iter_build(self, label: str=None):
+        """
+        same as build, but generates the text format line by line
         """
-        out = '\tdef_text_script TextScript{0}_unk{1}\n'.format('%X' % ModuleState.address, self.archive_idx)
+        if label is None:
+            label = self.command_context.get_label()
+        yield '\tdef_text_script {0}_unk{1}\n'.format(label, self.archive_idx)
 
         # build units
         for unit in self.units:
@@ -298,30 +1043,59 @@ class TextScript:
                     # for empty scripts, we just put the end script command instead of representing it as an empty string
                     s = TextScriptCommand.get_cmd_macro_name(self.command_context, unit.data, b'', False)
                 else:
-                    s = '.string "%s"' % unit.to_string()
+                    s = '.string "%s"' % unit.text
                 if s == '':
                     raise TextScriptException('invalid string output for %s' % unit)
-                out += '\t' + s + '\n'
+                yield '\t' + s + '\n'
             elif type(unit) is TextScriptCommand:
-                out += TextScriptCommand.build_cmd_macro(self.command_context, unit.cmd, unit.params, unit.use_interpreter_s)
+                yield TextScriptCommand.build_cmd_macro(self.command_context, unit.cmd, unit.params,
+                                                        unit.use_interpreter_s, label)
             else:
                 raise TextScriptException('invalid unit type')
 
-        return out
+    @staticmethod
+    def get_label(address: int=None) -> str:
+        """
+        :param address: the address of the archive. defaults to ModuleState.address
+        :return: the default prefix of the labels of the scripts of an archive, like TextScript0 for TextScript0_unk1
+        """
+        if address is None:
+            address = ModuleState.address
+        return 'TextScript%X' % address
+
+    def serialize(self, buffer=None, offset: int=0):
+        """
+        :param buffer: writable buffer to serialize into at :offset:, instead of a new bytearray
+        :return: the buffer serialized into
+        """
+        return copy_to_buffer(b''.join(self.serialize_units()), buffer, offset)
 
-    def serialize(self) -> bytes:
-        out = b''
-        # compile data
+    def serialize_units(self) -> list:
+        """
+        :return: the serialized bytes of every unit, in order
+        """
+        out = []
         for unit in self.units:
-            if type(unit) == GameString:
+            if type(unit) is GameString:
                 # game string
-                out += unit.data
-            elif type(unit) == TextScriptCommand:
-                out += unit.serialize()
+                out.append(unit.data)
+            elif type(unit) is TextScriptCommand:
+                out.append(unit.serialize())
             else:
                 raise TextScriptException('invalid unit type')
         return out
 
+    def get_serialized_size(self) -> int:
+        size = 0
+        for unit in self.units:
+            if type(unit) is GameString:
+                size += len(unit.data)
+            elif type(unit) is TextScriptCommand:
+                size += unit.size
+            else:
+                raise TextScriptException('invalid unit type')
+        return size
+
     def get_unit_at(self, base_idx, idx):
         cur_idx = base_idx
         prev_idx = cur_idx
@@ -350,40 +1124,102 @@ class TextScriptArchive:
         self.text_scripts = text_scripts
         self.addr = addr
         self.size = size
+        # number of bytes parsed more than once when reading the archive, to retry scripts with the other interpreter
+        self.reparsed_size = 0
+        # number of scripts read with both interpreters
+        self.retry_count = 0
 
 
-    def serialize(self) -> bytes:
-        out = b''
-        out += self.serialize_rel_pointers()
-        # serialize scripts
-        for text_script in self.text_scripts:
-            out += text_script.serialize()
-        return out
+    def serialize(self, buffer=None, offset: int=0):
+        """
+        :param buffer: writable buffer to serialize into at :offset:, instead of a new bytearray
+        :return: the buffer serialized into
+        """
+        with profiling.span('serialize') as span:
+            data = [self.serialize_rel_pointers()]
+            # serialize scripts
+            for text_script in self.text_scripts:
+                data += text_script.serialize_units()
+            data = b''.join(data)
+            span.size = len(data)
+        return copy_to_buffer(data, buffer, offset)
+
+    def serialize_rel_pointers(self, buffer=None, offset: int=0):
+        """
+        same as serialize, but only for the relative pointers
+        """
+        # rel. pointers are hwords
+        return copy_to_buffer(b''.join([b.to_bytes(2, 'little') for b in self.rel_pointers]), buffer, offset)
 
-    def serialize_rel_pointers(self) -> bytes:
-        out = b''
-        # since rel. pointers are hwords, a \x00 has to be appended if the pointer is < 0xFF
-        for b in self.rel_pointers:
-            if b > 0xFF:
-                out += bytes([b & 0xFF, b >> 8])
-            else:
-                out += bytes([b, 0x00])
-        return out
+    def get_serialized_size(self) -> int:
+        return 2 * len(self.rel_pointers) + sum(text_script.get_serialized_size() for text_script in self.text_scripts)
+
+    def verify_against(self, buffer) -> 'SerializationMismatch' or None:
+        """
+        checks that the archive serializes to :buffer:, script by script, without serializing all of it first.
+        the check stops at the first mismatching script, and locates the mismatching unit in it
+        :param buffer: bytes-like object of the binary the archive should serialize to, and nothing past it
+        :return: None if the archive matches, otherwise the first mismatch
+        """
+        with profiling.span('verify', len(buffer)):
+            return self._verify_against(memoryview(buffer))
+
+    def _verify_against(self, source: memoryview) -> 'SerializationMismatch' or None:
+        rel_pointers = self.serialize_rel_pointers()
+        if source[:len(rel_pointers)] != rel_pointers:
+            return SerializationMismatch.find(source, 0, rel_pointers, None, None)
+        offset = len(rel_pointers)
+        for text_script in self.text_scripts:
+            units_data = text_script.serialize_units()
+            end = offset + sum(map(len, units_data))
+            if source[offset:end] != b''.join(units_data):
+                # find the first mismatching unit of the script
+                for unit, data in zip(text_script.units, units_data):
+                    if source[offset:offset + len(data)] != data:
+                        return SerializationMismatch.find(source, offset, data, text_script.archive_idx, unit)
+                    offset += len(data)
+            offset = end
+        if offset != len(source):
+            # the source has more to it than the archive
+            return SerializationMismatch(offset, None, None)
+        return None
 
-    def build(self) -> str:
+    def build(self, label: str=None, align=True) -> str:
         """
+        :param label: prefix of the labels of the scripts, replacing the default TextScript<address>.
+            see TextScript.get_label
+        :param align: whether to end with the alignment of the archive. compressed archives are not aligned
         :return: the text script archive as a string
         """
-        out = '\ttext_archive_start\n\n'
+        with profiling.span('build'):
+            return ''.join(self.iter_build(label, align))
+
+    def build_to(self, stream, label: str=None, align=True):
+        """
+        same as build, but writes the text script archive to :stream: as it is built,
+        instead of holding all of it in memory
+        :param stream: text stream to write to
+        """
+        with profiling.span('build'):
+            for chunk in self.iter_build(label, align):
+                stream.write(chunk)
+
+    def iter_build(self, label: str=None, align=True):
+        """
+        same as build, but generates the text script archive in chunks
+        """
+        if label is None:
+            label = self.command_context.get_label()
+        yield '\ttext_archive_start\n\n'
 
         # build text scripts
         for text_script in self.text_scripts:
-            out += text_script.build() + '\n'
+            yield from text_script.iter_build(label)
+            yield '\n'
 
         # text scripts are always aligned by 4
-        out += '\t.balign 4, 0'
-
-        return out
+        if align:
+            yield '\t.balign 4, 0'
 
     def get_unit_at(self, idx):
         cur_idx = 2 * len(self.rel_pointers)
@@ -399,33 +1235,109 @@ class TextScriptArchive:
 
     @staticmethod
     def read_relative_pointers(bin_file, address: int) -> list:
-        def read_hword(bin_file) -> int:
-            bytes = bin_file.read(2)
-            return bytes[0] + (bytes[1] << 8)
+        rel_pointers, pos = TextScriptArchive.read_relative_pointers_buffer(as_buffer(bin_file), bin_file.tell(), address)
+        bin_file.seek(pos)
+        return rel_pointers
+
+    @staticmethod
+    def read_relative_pointers_buffer(buf: memoryview, pos: int, address: int) -> (list, int):
+        def read_hword(pos) -> (int, int):
+            hword = bytes(buf[pos:pos + 2])
+            return hword[0] + (hword[1] << 8), min(pos + 2, len(buf))
 
         # assuming first relative pointer is first script
-        size_rel_pointers = read_hword(bin_file)
+        size_rel_pointers, pos = read_hword(pos)
         rel_pointers = [size_rel_pointers]
-        while bin_file.tell() < address + size_rel_pointers:
-            rel_pointers.append(read_hword(bin_file))
-        return rel_pointers
+        while pos < address + size_rel_pointers:
+            rel_pointer, pos = read_hword(pos)
+            rel_pointers.append(rel_pointer)
+        return rel_pointers, pos
 
     @staticmethod
-    def read(command_context: CommandContext, bin_file, archive_size: int=None) -> 'TextScriptArchive':
+    def read(command_context: CommandContext, bin_file, archive_size: int=None,
+             hints: 'InterpreterHints'=None, hints_key=None, accounting: ParseAccounting=None) -> 'TextScriptArchive':
         """
         :param command_context: necessary data to parse commands
         :param bin_file: binary file stream to read the file from
         :param archive_size: if not None, the script archive will end at the specified size
+        :param hints: if not None, interpreters to try first for each script, updated with the ones that worked
+        :param hints_key: the address or name of the archive in :hints:, defaults to its offset in :bin_file:
+        :param accounting: if not None, filled in with how the archive was parsed
         :return: TextScriptArchive object representation
         """
-        address = bin_file.tell()
-        rel_pointers = TextScriptArchive.read_relative_pointers(bin_file, address)
+        archive, pos = TextScriptArchive.read_buffer(command_context, as_buffer(bin_file), bin_file.tell(), archive_size,
+                                                     hints, hints_key, accounting)
+        bin_file.seek(pos)
+        return archive
+
+    @staticmethod
+    def read_buffer(command_context: CommandContext, buf: memoryview, pos: int, archive_size: int=None,
+                    hints: 'InterpreterHints'=None, hints_key=None,
+                    accounting: ParseAccounting=None) -> ('TextScriptArchive', int):
+        """
+        same as TextScriptArchive.read, but parses from an offset into a buffer
+        :param buf: the buffer to parse from, see as_buffer
+        :param pos: the offset of the archive in :buf:
+        :return: TextScriptArchive object representation, and the offset right after it
+        """
+        with profiling.span('parse') as span:
+            archive, end = TextScriptArchive._read_buffer_hinted(command_context, buf, pos, archive_size, hints,
+                                                                 hints_key, accounting)
+            span.size = end - pos
+        return archive, end
+
+    @staticmethod
+    def _read_buffer_hinted(command_context: CommandContext, buf: memoryview, pos: int, archive_size: int=None,
+                            hints: 'InterpreterHints'=None, hints_key=None,
+                            accounting: ParseAccounting=None) -> ('TextScriptArchive', int):
+        if hints is None:
+            archive, pos, interpreters = TextScriptArchive._read_buffer(command_context, buf, pos, archive_size,
+                                                                        accounting=accounting)
+            return archive, pos
+
+        import zlib
+        address = pos
+        if hints_key is None:
+            hints_key = address
+        known_hints = hints.get(hints_key)
+        if known_hints is not None:
+            crc, script_hints = known_hints
+            try:
+                archive, pos, interpreters = TextScriptArchive._read_buffer(command_context, buf, address,
+                                                                             archive_size, script_hints, accounting)
+                # the hints only reproduce the same parse if the archive did not change since they were recorded
+                if zlib.crc32(buf[address:pos]) == crc:
+                    hints.update(hints_key, crc, interpreters)
+                    return archive, pos
+            except (InvalidTextScriptCommandException, TextScriptException):
+                pass
+            profiling.count('stale_hints')
+
+        # stale or no hints, parse as if there were none and record what worked
+        archive, pos, interpreters = TextScriptArchive._read_buffer(command_context, buf, address, archive_size,
+                                                                    accounting=accounting)
+        hints.update(hints_key, zlib.crc32(buf[address:pos]), interpreters)
+        return archive, pos
+
+    @staticmethod
+    def _read_buffer(command_context: CommandContext, buf: memoryview, pos: int, archive_size: int=None,
+                     script_hints: list=None, accounting: ParseAccounting=None) -> ('TextScriptArchive', int, list):
+        """
+        :param script_hints: interpreter to try first for each script, see InterpreterHints
+        :param accounting: see TextScriptArchive.read
+        :return: the archive, the offset right after it, and whether each script was read with the first interpreter
+        """
+        address = pos
+        rel_pointers, pos = TextScriptArchive.read_relative_pointers_buffer(buf, pos, address)
         last_script_pointer = max(rel_pointers)
         assume_first_interpreter = True # assumed unless something goes bad
+        # units decoded so far, shared between the attempts with either interpreter
+        memo = ParseMemo() if accounting is None else accounting.create_memo(address)
 
         # print('// numScripts: {0}, [{1}, {2}]'.format(len(rel_pointers), hex(rel_pointers[0]), hex(rel_pointers[-1])))
 
         scripts = []
+        interpreters = []
         for i, ptr in enumerate(rel_pointers):
             # determine size of script, if known
             if i < len(rel_pointers)-1:
@@ -440,47 +1352,78 @@ class TextScriptArchive:
                 script_size = min(script_size, archive_size)
 
             # make sure when reading each script that we reached its location
-            if bin_file.tell() - address == ptr:
+            if pos - address == ptr:
                 if script_size == 0:
                     scripts.append(TextScript(command_context, [], i, ptr, 0))
+                    interpreters.append(None)
                 else:
+                    # a recorded hint skips guessing which interpreter to use
+                    if script_hints is not None and i < len(script_hints) and script_hints[i] is not None:
+                        assume_first_interpreter = script_hints[i]
+
                     # try using both interpreters to see which one generates correct TextScript with the right size
-                    rewind_addr = bin_file.tell()
+                    rewind_addr = pos
+                    memo.begin_script(i, pos)
                     try:
-                        scripts.append(TextScript.read(command_context, bin_file, script_size, i, assume_first_interpreter))
+                        script, pos = TextScript.read_buffer(command_context, buf, rewind_addr, script_size, i,
+                                                             assume_first_interpreter, memo)
+                        scripts.append(script)
                     except (InvalidTextScriptCommandException, TextScriptException) as e:
-                        bin_file.seek(rewind_addr) # rewind,and try again
+                        # rewind,and try again. only what the other interpreter decodes differently is parsed again
+                        memo.begin_retry(rewind_addr, e)
                         try:
                             # flip assumptions for next time, since the trend may continue.
                             assume_first_interpreter = not assume_first_interpreter
-                            scripts.append(TextScript.read(command_context, bin_file, script_size, i, assume_first_interpreter))
+                            script, pos = TextScript.read_buffer(command_context, buf, rewind_addr, script_size, i,
+                                                                 assume_first_interpreter, memo)
+                            scripts.append(script)
                         except (InvalidTextScriptCommandException, TextScriptException) as e:
                             # failure on both assumptions -- might be unrelated to the interpreter used
                             raise
+                    interpreters.append(assume_first_interpreter)
             else:
                 # invalid state
                 # TODO refactor: to TextScriptError
                 raise TextScriptException('invalid state: reading a script in a different location from its pointer {0} != {1}'
-                                          .format(hex(bin_file.tell() - address), hex(ptr)))
+                                          .format(hex(pos - address), hex(ptr)))
 
-            if archive_size and bin_file.tell() - address >= archive_size:
+            if archive_size and pos - address >= archive_size:
                 # check for tail empty scripts, don't cut them out, just output them all
                 if len(scripts) > 0 and ptr + scripts[-1].size == archive_size:
                     continue
                 break
 
         # create Script object
-        return TextScriptArchive(command_context, rel_pointers, scripts, address, bin_file.tell() - address)
+        archive = TextScriptArchive(command_context, rel_pointers, scripts, address, pos - address)
+        archive.reparsed_size = memo.reparsed_size
+        archive.retry_count = memo.retry_count
+        profiling.count('retries', memo.retry_count)
+        profiling.count('reparsed_bytes', memo.reparsed_size)
+        return archive, pos, interpreters
 
 
     @staticmethod
-    def read_script(command_context: CommandContext, ea: int, bin_file, size: int=None) -> 'TextScriptArchive':
+    def read_script(command_context: CommandContext, ea: int, bin_file, size: int=None,
+                    hints: 'InterpreterHints'=None, hints_key=None,
+                    accounting: ParseAccounting=None) -> 'TextScriptArchive':
+        """
+        :param ea: address of the archive in :bin_file:
+        :param bin_file: binary file stream, or a bytes-like object of the whole file
+        :param size: if not None, the script archive will end at the specified size
+        :param hints: see TextScriptArchive.read
+        :param hints_key: the address or name of the archive in :hints:, defaults to :ea:
+        :param accounting: see TextScriptArchive.read
+        """
         # ensure ea is file relative
         ea &= ~0x8000000
-        bin_file.seek(ea)
 
-        error.list = []
-        return TextScriptArchive.read(command_context, bin_file, size)
+        command_context.clear_errors()
+        if isinstance(bin_file, (bytes, bytearray, memoryview)):
+            archive, pos = TextScriptArchive.read_buffer(command_context, as_buffer(bin_file), ea, size,
+                                                         hints, hints_key, accounting)
+            return archive
+        bin_file.seek(ea)
+        return TextScriptArchive.read(command_context, bin_file, size, hints, hints_key, accounting)
 
 
 class TextScriptCommand:
@@ -530,24 +1473,50 @@ class TextScriptCommand:
             However, the first interperter has most of the commands shared between the two, so it is fallen on if
             a command is not found in the second.
         """
-        select_sects = lambda select: [command_context.sects_s, command_context.sects][select]
-        out = TextScriptCommand.read_cmd_from_sects(bin_file, cmd, select_sects(use_first_interpreter))
-
-        # if a command was not found in the second interpreter, fall back and find it in the first.
-        # this is not true the other way around. The first interpreter should contain all of its commands.
-        if not out and not use_first_interpreter:
-            use_first_interpreter = not use_first_interpreter
-            out = TextScriptCommand.read_cmd_from_sects(bin_file, cmd, select_sects(use_first_interpreter))
-
-        if not out:
-            raise InvalidTextScriptCommandException(
-                  'invalid cmd %s detected at 0x%x' % (cmd, bin_file.tell()))
-
-        # FIXME refactor this boolean inconsistency with which interpreter to use...
-        use_second_interpreter = not use_first_interpreter
-        return TextScriptCommand(out[0], out[1], use_second_interpreter,
-                                 TextScriptCommand.get_cmd_macro_name(command_context, out[0], out[1], use_second_interpreter))
+        command, pos = TextScriptCommand.read_buffer(command_context, as_buffer(bin_file), bin_file.tell(), cmd,
+                                                     use_first_interpreter)
+        bin_file.seek(pos)
+        return command
 
+    @staticmethod
+    def read_buffer(command_context: CommandContext, buf: memoryview, pos: int, cmd: bytes,
+                    use_first_interpreter, memo: 'ParseMemo'=None) -> ('TextScriptCommand', int):
+        """
+        same as TextScriptCommand.read, but parses from an offset into a buffer
+        :param pos: the offset right after :cmd:
+        :param memo: commands already decoded from :buf:, reused instead of being decoded again
+        :return: the command, and the offset right after it
+        """
+        if memo is not None:
+            command = memo.get_command(pos, use_first_interpreter)
+            if command is not None:
+                return command
+
+        database = command_context.database
+        out = None
+        if not use_first_interpreter:
+            out, end = TextScriptCommand.read_cmd_from_buffer(buf, pos, cmd, database.dispatch_s)
+
+        if out:
+            command = TextScriptCommand(out[0], out[1], True,
+                                        TextScriptCommand.get_cmd_macro_name(command_context, out[0], out[1], True)), end
+        elif not use_first_interpreter:
+            # if a command was not found in the second interpreter, fall back and find it in the first.
+            # this is not true the other way around. The first interpreter should contain all of its commands.
+            # the first interpreter decodes it the same regardless, so it's shared with it
+            command = TextScriptCommand.read_buffer(command_context, buf, pos, cmd, True, memo)
+        else:
+            out, end = TextScriptCommand.read_cmd_from_buffer(buf, pos, cmd, database.dispatch)
+            if not out:
+                raise InvalidTextScriptCommandException(
+                      'invalid cmd %s detected at 0x%x' % (cmd, pos))
+            command = TextScriptCommand(out[0], out[1], False,
+                                        TextScriptCommand.get_cmd_macro_name(command_context, out[0], out[1], False)), end
+
+        if memo is not None:
+            # only count the bytes if they were decoded here, rather than by the first interpreter
+            memo.add_command(pos, use_first_interpreter, command, pos - len(cmd) if out else None)
+        return command
 
     @staticmethod
     def find_valid_cmd_base(cmd: bytes, sects) -> (bool, dict):
@@ -624,12 +1593,7 @@ class TextScriptCommand:
 
     @staticmethod
     def convert_cmd_name(name: str) -> str:
-        name = 'ts_' + name
-        # convert to snake case
-        for c in name:
-            if c.isupper():
-                name = name.replace(c, '_%c' % c.lower())
-        return name
+        return CommandSections.get_macro_name(name)
 
     @staticmethod
     def get_cmd_len(cmd: bytes, params: bytes, from_sect_s: bool) -> int:
@@ -647,20 +1611,21 @@ class TextScriptCommand:
         :param cmd: byte array that must contain at least
         :return: string representing the macro for the command
         """
-        select_sects = lambda select: [command_context.sects, command_context.sects_s][select]
-        sect = TextScriptCommand.find_command_section(cmd, params, select_sects(prioritize_s))
-        if not sect:
-            sect = TextScriptCommand.find_command_section(cmd, params, select_sects(not prioritize_s))
-        if not sect:
-            error(InvalidTextScriptCommandException,
-                  'could not find command %s %s' % (str(cmd), str(params)),
-                  critical=False)
-
-        name = TextScriptCommand.convert_cmd_name(sect['name']) # converts to snake case and add ts_
+        database = command_context.database
+        select_dispatch = lambda select: [database.dispatch, database.dispatch_s][select]
+        spec = select_dispatch(prioritize_s).find_command_spec(cmd, params)
+        if not spec:
+            spec = select_dispatch(not prioritize_s).find_command_spec(cmd, params)
+        if not spec:
+            command_context.error(InvalidTextScriptCommandException,
+                                  'could not find command %s %s' % (str(cmd), str(params)),
+                                  critical=False)
+
+        name = spec.macro_name # converted to snake case with ts_ added
         if not name:
-            error(InvalidTextScriptCommandException,
-                  'no name exists for the cmd ' + str(cmd) + ' ' + str(params),
-                  critical=False)
+            command_context.error(InvalidTextScriptCommandException,
+                                  'no name exists for the cmd ' + str(cmd) + ' ' + str(params),
+                                  critical=False)
             name = '.byte '
             for b in cmd:
                 name += hex(b) + ', '
@@ -671,179 +1636,150 @@ class TextScriptCommand:
         return name.strip()
 
     @staticmethod
-    def build_cmd_macro(command_context: CommandContext, cmd: bytes, params: bytes, use_secondary_interpreter: bool) -> str:
-        out = ''
-
+    def build_cmd_macro(command_context: CommandContext, cmd: bytes, params: bytes, use_secondary_interpreter: bool,
+                        label: str=None) -> str:
+        """
+        :param label: prefix of the labels of the scripts jumped to, see TextScript.get_label
+        :return: the line of the command macro
+        """
         # find the command section -- accounts for the fact that the secondary interpreter uses the first as default
-        select_sects = lambda select: [command_context.sects, command_context.sects_s][select]
-        sect = TextScriptCommand.find_command_section(cmd, params, select_sects(use_secondary_interpreter))
-        if not sect and use_secondary_interpreter:
-            sect = TextScriptCommand.find_command_section(cmd, params, select_sects(not use_secondary_interpreter))
-        if not sect:
+        select_dispatch = lambda select: [command_context.dispatch, command_context.dispatch_s][select]
+        spec = select_dispatch(use_secondary_interpreter).find_command_spec(cmd, params)
+        if not spec and use_secondary_interpreter:
+            spec = select_dispatch(not use_secondary_interpreter).find_command_spec(cmd, params)
+        if not spec:
             raise InvalidTextScriptCommandException('could not find command %s %s' % (str(cmd), str(params)))
 
-        # convert the name to use snake case and prepend with ts_
-        name = TextScriptCommand.convert_cmd_name(sect['name'])
+        # the name is converted to use snake case and prepended with ts_
+        name = spec.macro_name
         if not name:
             raise InvalidTextScriptCommandException('no name exists for the cmd ' + str(cmd) + ' ' + str(params))
-        name = name.strip()
-
-        # search for it to retrieve parameters
-        command_sect_and_params = None
-        if use_secondary_interpreter:
-            # search both since secondary interpreter uses commands from first
-            all_commands_sects = command_context.commands_sects.copy()
-            all_commands_sects.extend(command_context.commands_sects_s)
-            for command_sects in all_commands_sects:
-                if command_sects[0] == sect:
-                    command_sect_and_params = command_sects
-        else:
-            for command_sects in command_context.commands_sects:
-                if command_sects[0] == sect:
-                    command_sect_and_params = command_sects
-        if command_sect_and_params is None:
-            raise InvalidTextScriptCommandException('could not find command and param sections for {0}'.format(sect['name']))
-        command_sects = command_sect_and_params
-
-        # build parameters
-        command_bytes = TextScriptCommand.to_bytes(cmd, params, use_secondary_interpreter)
-        s = '%s ' % name
-
-        if cmd in ModuleState.DYNAMIC_CMDS:
+
+        if spec.is_dynamic:
             # TODO: just parse dynamic command as non-keyworded args for now
-            s = '%s ' % name
-            for i in range(len(params)):
-                # jump commands go to a linked script
-                # if 'jump' in name.lower() and i == 0:
-                #     s += '{}, '.format(TextScriptCommand._build_jump_id(params[i]))
-                # else:
-                s += '0x%X, ' % params[i]
-            if params: s = s[:-2]
-            s = s.rstrip()
-            if s == '':
-                raise TextScriptException('invalid string output for %s' % cmd)
-            out += '\t' + s + '\n'
+            # jump commands go to a linked script, but their dynamic parameters aren't resolved to labels yet
+            s = '%s %s' % (name, ', '.join(['0x%X' % param for param in params]))
         else:
             # using keyworded args
-            param_sects = CommandSections.get_ordered_parameters(command_sects)
-
-            # if more than one argument, start multiline arguments
-            if len(param_sects) > 1:
-                s += '[\n'
-
-            for param_sect in param_sects:
-                param_value = TextScriptCommand._compute_parameter_value(param_sect, command_bytes)
-                param_name = CommandSections.get_parameter_name(param_sect)
-                if len(param_sects) > 1:
-                    s += '\t\t{name}: '.format(name=param_name)
-                else:
-                    s += '{name}='.format(name=param_name)
-
+            command_bytes = TextScriptCommand.to_bytes(cmd, params, use_secondary_interpreter)
+            param_specs = spec.params
+            args = []
+            for param_spec in param_specs:
+                param_value = TextScriptCommand._compute_parameter_value(param_spec, command_bytes)
                 # jump commands go to a linked script
-                if 'jump' in param_name.lower() or param_name == 'target':
-                    s += '{},'.format(TextScriptCommand._build_jump_id(param_value))
+                if param_spec.is_jump:
+                    if label is None:
+                        label = command_context.get_label()
+                    args.append((param_spec.name, TextScriptCommand._build_jump_id(param_value, label)))
                 else:
-                    s += '0x%X,' % param_value
-
-                # if more than one argument, multi-line
-                if len(param_sects) > 1:
-                    s += '\n'
-
-            if s.endswith(','):
-                s = s[:-1]
+                    args.append((param_spec.name, '0x%X' % param_value))
 
-            if len(param_sects) > 1:
-                s += '\t]'
+            # if more than one argument, multi-line
+            if len(args) > 1:
+                s = '%s [\n%s\t]' % (name, ''.join(['\t\t%s: %s,\n' % arg for arg in args]))
+            elif args:
+                s = '%s %s=%s' % (name, args[0][0], args[0][1])
+            else:
+                s = name
 
-            s = s.rstrip()
-            if s == '':
-                raise TextScriptException('invalid string output for %s' % unit)
-            out += '\t' + s + '\n'
-        return out
+        s = s.rstrip()
+        if s == '':
+            raise TextScriptException('invalid string output for %s' % cmd)
+        return '\t' + s + '\n'
 
     @staticmethod
-    def _compute_parameter_value(param_sect: dict, command_bytes: bytes) -> int:
+    def _compute_parameter_value(param_spec: ParameterSpec, command_bytes: bytes) -> int:
         # compute parameter value based on its offset and size
 
-        byte_off, bit_off = CommandSections.get_parameter_offset(param_sect)
-        field_bit_size = int(param_sect['bits'])
-
         # obtain the relevant bytes for the value
-        val_bytes = command_bytes[byte_off:byte_off + max((field_bit_size // 8), 1)]
+        byte_off = param_spec.byte_offset
+        val_bytes = command_bytes[byte_off:byte_off + param_spec.num_bytes]
 
-        out = 0
         # combine bytes together
-        for digit, b in enumerate(val_bytes):
-            out |= (b << (8 * digit))
+        out = int.from_bytes(val_bytes, 'little')
 
         # mask value
-        out >>= bit_off
-        out &= 2 ** field_bit_size - 1  # mask by the size, 4 bits would mask 0x0F
+        out >>= param_spec.bit_offset
+        out &= param_spec.value_mask
 
         return out
 
     @staticmethod
-    def _build_jump_id(textscript_id):
+    def _build_jump_id(textscript_id, label: str=None):
         """
         in case of jumping to some textscript, this builds the format to refer to it
         0xFF is reserved for TS_CONTINUE, as it doesn't jump anywhere
         :param textscript_id: the textscript relative pointer id
+        :param label: prefix of the labels of the scripts, see TextScript.get_label
         """
         if textscript_id == 0xFF:
             return 'TS_CONTINUE'
-        return 'TextScript{addr}_unk{id}_id'.format(addr=ModuleState.address, id=textscript_id)
+        if label is None:
+            label = TextScript.get_label()
+        return '{label}_unk{id}_id'.format(label=label, id=textscript_id)
 
     @staticmethod
-    def read_cmd_from_sects(bin_file, cmd: bytes, sects: list) -> (bytes, bytes) or None:
+    def read_cmd_from_sects(bin_file, cmd: bytes, dispatch: CommandDispatch) -> (bytes, bytes) or None:
         """
         if this function fails to read a valid command, it rewinds the bin_file
         :param bin_file: bin file to read the command from
         :param cmd: first byte of the command
-        :param sects: sections to use to identify the command
+        :param dispatch: compiled sections of the interpreter to use to identify the command
         :return: cmd, params if found or None
         """
-        rewind_addr = bin_file.tell()
-        num_params = -1
+        out, pos = TextScriptCommand.read_cmd_from_buffer(as_buffer(bin_file), bin_file.tell(), cmd, dispatch)
+        bin_file.seek(pos)
+        return out
+
+    @staticmethod
+    def read_cmd_from_buffer(buf: memoryview, pos: int, cmd: bytes, dispatch: CommandDispatch) -> ((bytes, bytes) or None, int):
+        """
+        same as read_cmd_from_sects, but parses from an offset into a buffer
+        :param pos: the offset right after :cmd:
+        :return: (cmd, params) if found or None, and the offset right after the command
+            (or :pos: if no command was found)
+        """
+        rewind_addr = pos
+        end = len(buf)
 
         # some commands are prioritized by their input (really just jump_random)
         # so, automatically get the input to determine if it's really that command, or another one
         # (like jump)
-        if cmd in ModuleState.PRIORITY_CMDS:
-            cmd += bin_file.read(1)
+        if cmd in ModuleState.PRIORITY_CMDS and pos < end:
+            cmd += buf[pos:pos + 1]
+            pos += 1
 
         # read in bytes until the base is read and the parameters are determined
-        for i in range(4):  # max number of base bytes per command
-            num_params, sect = TextScriptCommand.find_param_count(cmd, sects)
-            if num_params >= 0:
+        specs = dispatch.find_specs(cmd)
+        for i in range(3):  # max number of base bytes per command is 4
+            if specs or pos >= end:
                 break
-            else:
-                byte = bin_file.read(1)
-                cmd = cmd + byte
-
+            cmd += buf[pos:pos + 1]
+            pos += 1
+            specs = dispatch.find_specs(cmd)
 
         # valid command found
-        if num_params >= 0:
+        if specs:
+            spec = specs[0]
+            num_params = spec.get_param_count()
             # no priority commands, go with default (jump_random)
-            if cmd[0:1] in ModuleState.PRIORITY_CMDS and cmd[1] >= 3:
+            if spec.is_priority and cmd[1] >= 3:
                 params = cmd[1:2]
                 cmd = cmd[:1]
             # bitfield commands, prints
-            elif num_params == 1.5:
+            elif spec.is_bitfield:
                 # params are already part of the command
                 # pattern: FF FF 00 0F
                 params = bytes([cmd[2], (cmd[3] >> 4)])  # XX YF
                 cmd = bytes([cmd[0], cmd[1], 0x00, cmd[3]&0xF])
             # parse cmd and params
-            elif num_params >= 0:
-                params = bin_file.read(num_params)
-            # command not detected
             else:
-                params = []
-                error(InvalidTextScriptCommandException, 'invalid num_parameters states detected at %s' % cmd)
+                params = bytes(buf[pos:pos + num_params])
+                pos = min(pos + num_params, end)
 
             # dynamic commands also take in data, not just parameters. Data can be 0xFF, or <0xE5
             # different dynamic commands have their own maximum number of dynamci arguments.
-            if cmd in ModuleState.DYNAMIC_CMDS:
+            if spec.is_dynamic:
                 def parse_dynamic_command_length(cmd, params):
                     # TODO: load command specific context from config sects
                     # parse the length, command-dependant
@@ -862,50 +1798,119 @@ class TextScriptCommand:
 
                 max_dynamic_args = parse_dynamic_command_length(cmd, params) - len(cmd) - len(params)
                 num_dynamic_args = 0
-                last_param = False
+                dynamic_args_start = pos
                 while True:
-                    byte = bin_file.read(1)
-                    if byte == b'\xff':
-                        last_param = True
+                    if pos < end:
+                        byte = buf[pos]
+                        pos += 1
+                    else:
+                        byte = None
 
-                    def dynamic_command_ended(cmd, params, byte, num_dynamic_args, max_dynamic_args):
-                        start_of_new_command = lambda byte: byte != b'\xff' and byte >= b'\xe5'
+                    def dynamic_command_ended(byte, num_dynamic_args, max_dynamic_args):
+                        start_of_new_command = lambda byte: byte is not None and byte != 0xFF and byte >= 0xE5
 
                         return start_of_new_command(byte) or num_dynamic_args >= max_dynamic_args
 
-                    if dynamic_command_ended(cmd, params, byte, num_dynamic_args, max_dynamic_args):
+                    if dynamic_command_ended(byte, num_dynamic_args, max_dynamic_args):
+                        params += bytes(buf[dynamic_args_start:pos - 1 if byte is not None else pos])
                         # rewind, doesn't belong to this dynamic command
-                        bin_file.seek(bin_file.tell() - 1)
+                        pos -= 1
                         break
-                    else:
-                        params += byte
                     num_dynamic_args += 1
 
 
-            return cmd, params
+            return (cmd, params), pos
         else:
             # no command found
-            bin_file.seek(rewind_addr)
-            return None
+            return None, rewind_addr
+
+
+class Charmap:
+    """
+    compiled charmap, so that decoding a string doesn't look up the tbl per character.
+    single-byte characters and E4 double-byte characters each index a 256-entry table. escaping is already
+    applied to the entries, and characters missing from the tbl are None
+    """
+    __slots__ = ('single', 'extended')
+
+    def __init__(self, tbl: dict):
+        """
+        :param tbl: the charmap as read by GameString.get_tbl
+        """
+        self.single = [tbl.get(b) for b in range(256)]
+        # double quotes would terminate the .string they're in
+        self.single = ['\\"' if c == '"' else c for c in self.single]
+        self.extended = [tbl.get(0xE400 | b) for b in range(256)]
+
+    def decode(self, byte_arr) -> str:
+        """
+        same as GameString.bn6f_str, over the compiled tables
+        :raises KeyError: for characters missing from the charmap
+        :raises IndexError: for an E4 missing its second byte
+        """
+        single = self.single
+        out = []
+        start = 0
+        ext_idx = byte_arr.find(0xE4)
+        while ext_idx != -1:
+            out.extend(map(single.__getitem__, byte_arr[start:ext_idx]))
+            out.append(self.extended[byte_arr[ext_idx + 1]])
+            start = ext_idx + 2
+            ext_idx = byte_arr.find(0xE4, start)
+        out.extend(map(single.__getitem__, byte_arr[start:]))
+        try:
+            return ''.join(out)
+        except TypeError:
+            raise KeyError('unmapped character in string %s' % bytes(byte_arr))
 
 
 class GameString:
-    def __init__(self, byte_data, tbl_path=definitions.GAME_STRING_TBL_PATH):
+    __slots__ = ('data', 'tbl_path', '_text')
+
+    # charmaps loaded in this process, by path. loaded on first use
+    _tbls = {}
+    _charmaps = {}
+
+    def __init__(self, byte_data, tbl_path=None):
+        """
+        :param byte_data: the string bytecode
+        :param tbl_path: the charmap to decode the string with. defaults to definitions.GAME_STRING_TBL_PATH
+        """
         self.data = byte_data
         self.tbl_path = tbl_path
-        self.text = self.to_string()
+        # decoded on first access, serializing doesn't need it
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.to_string()
+        return self._text
 
     def to_string(self):
-        return GameString.bn6f_str(self.data, GameString.get_tbl(self.tbl_path))
+        return GameString.get_charmap(self.tbl_path).decode(self.data)
 
     def __str__(self):
-        return self.to_string()
+        return self.text
+
+    @staticmethod
+    def get_charmap(path=None) -> Charmap:
+        """
+        same as get_tbl, but compiled. see Charmap
+        """
+        if path is None:
+            path = definitions.GAME_STRING_TBL_PATH
+        if path not in GameString._charmaps:
+            GameString._charmaps[path] = Charmap(GameString.get_tbl(path))
+        return GameString._charmaps[path]
 
     @staticmethod
-    def get_tbl(path):
+    def get_tbl(path=None):
         # TODO: refactor to read charmap.inc
-        if 'tbl' in GameString.get_tbl.__dict__.keys():
-            return GameString.get_tbl.tbl
+        if path is None:
+            path = definitions.GAME_STRING_TBL_PATH
+        if path in GameString._tbls:
+            return GameString._tbls[path]
         tbl = {}
         with open(path, 'r', encoding='utf-8') as f:
             for line in f.readlines():
@@ -919,7 +1924,7 @@ class GameString:
 
         tbl[0xE6] = '@' # for shortness, represent the end of script as a '$' in strings
         tbl[0xE9] = '\\n'
-        GameString.get_tbl.tbl = tbl
+        GameString._tbls[path] = tbl
 
         return tbl
 
@@ -1051,21 +2056,54 @@ def gen_macros(config_ini_path):
 
     return '\t' + macros.replace('\n', '\n\t')
 
+def read_address_list(list_path: str) -> list:
+    """
+    reads the archives to dump in one batch. The list is either in the .tpl format read by
+    text_script_scanner.process_archives, lines of "@archive <hex address>" each optionally followed by "@size <hex size>",
+    or lines of "<address> [<size>]" in any base int(x, 0) accepts, like 0x6C580C. Empty lines and # comments are ignored
+    :param list_path: path of the list
+    :return: list of (address, size or None)
+    """
+    out = []
+    with open(list_path, 'r') as list_file:
+        for line in list_file:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            tokens = line.split()
+            if tokens[0] == '@archive':
+                out.append((int(tokens[1], 16), None))
+            elif tokens[0] == '@size':
+                if not out:
+                    raise TextScriptException('@size before any @archive in {0}'.format(list_path))
+                out[-1] = (out[-1][0], int(tokens[1], 16))
+            else:
+                out.append((int(tokens[0], 0), int(tokens[1], 0) if len(tokens) > 1 else None))
+    return out
+
+
 if __name__ == '__main__':
     import codecs
     import argparse
+    import time
+    from common import map_file
 
     def auto_int(i):
         return int(i, 0)
 
     parser = argparse.ArgumentParser(description='TextScript dumper for Megaman Battle Network')
-    parser.add_argument('address', type=auto_int, help='address of text script archive in file')
+    parser.add_argument('address', type=auto_int, nargs='?', help='address of text script archive in file')
     parser.add_argument('-f', '--file', help='file to parse from, usually the ROM.')
     parser.add_argument('-i', '--ini_dir', help='directory of command database ini files to use')
     parser.add_argument('-o', '--output', help='output file to write to')
     parser.add_argument('-s', '--size', type=auto_int, help='the size of script, if known')
+    parser.add_argument('-l', '--list', help='dumps every archive of this list instead of one address, see read_address_list')
+    parser.add_argument('-d', '--output-dir', help='writes every archive to <label>.s in this directory, instead of one output')
     parser.add_argument('--generate-macros', action='store_true', help='auto generates macros for the commands then exits')
+    parser.add_argument('--parse-stats', action='store_true', help='reports how much each archive made the parser backtrack, see ParseAccounting')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
 
     # in case the default encoding doesn't support utf8
     sys.stdout = codecs.getwriter('utf8')(sys.stdout.buffer)
@@ -1074,23 +2112,12 @@ if __name__ == '__main__':
     if not args.file:
         args.file = ModuleState.ROM_PATH
 
-    # create the command context by reading from the command database ini
-    if not args.ini_dir:
-        command_context = CommandContext()
-    else:
-        if args.ini_dir and args.ini_dir[-1] != '/':
-            args.ini_dir = args.ini_dir + '/'
-        command_context = CommandContext(args.ini_dir)
-
-    # search for if address has a known size in config ini
-    if not args.size:
-        for address in definitions.SCRIPT_SIZES.keys():
-            size = definitions.SCRIPT_SIZES[address]
-            if address == args.address:
-                args.size = size
+    if args.ini_dir and args.ini_dir[-1] != '/':
+        args.ini_dir = args.ini_dir + '/'
 
-    # setting additional information
-    ModuleState.address = args.address
+    # the command context, reading from the command database ini, and the labels are based on the address.
+    # a batch shares it, and so the command database, by moving it to the address of each archive
+    command_context = DumpSession(args.address if args.address is not None else 0, args.ini_dir)
 
     # generate macros instead of dumping if command is present
     if args.generate_macros:
@@ -1100,17 +2127,83 @@ if __name__ == '__main__':
         print(gen_macros(os.path.join(definitions.ROOT_DIR, 'mmbn6s.ini')))
         exit(0)
 
-    with open(args.file, 'rb') as f:
-        text_script_archive: TextScriptArchive = TextScriptArchive.read_script(command_context, args.address, f, args.size)
-
-    if args.output:
-        with open(args.output, 'w') as output_file:
-            output_file.write(text_script_archive.build())
-            output_file.write(hex(text_script_archive.addr + text_script_archive.size))
+    if args.list:
+        archives = read_address_list(args.list)
+    elif args.address is not None:
+        archives = [(args.address, args.size)]
     else:
-        print(text_script_archive.build())
-        print(hex(text_script_archive.addr + text_script_archive.size))
+        parser.error('either an address or --list is required')
+
+    # interpreters that worked for the scripts of these archives in previous runs
+    hints = InterpreterHints.load(InterpreterHints.get_path(command_context))
+    rom = map_file(args.file)
+
+    output_file = None
+    if not args.output_dir:
+        output_file = open(args.output, 'w') if args.output else sys.stdout
+    failed_count = 0
+    for i, (address, size) in enumerate(archives):
+        # search for if address has a known size in config ini
+        if size is None:
+            size = definitions.SCRIPT_SIZES.get(address)
+
+        command_context.address = address
+        accounting = ParseAccounting() if args.parse_stats else None
+        start_time = time.perf_counter()
+        try:
+            text_script_archive: TextScriptArchive = TextScriptArchive.read_script(command_context, address, rom, size,
+                                                                                   hints, accounting=accounting)
+        except Exception as e:
+            profiling.record(archive=address, ok=False, time=time.perf_counter() - start_time)
+            # a batch goes on with the next archive
+            if not args.list:
+                raise
+            print('error: failed to dump 0x{0:X}: {1}'.format(address, e), file=sys.stderr)
+            failed_count += 1
+            continue
+
+        if args.output_dir:
+            with open(os.path.join(args.output_dir, command_context.get_label() + '.s'), 'w') as archive_file:
+                text_script_archive.build_to(archive_file)
+                archive_file.write(hex(text_script_archive.addr + text_script_archive.size))
+        elif output_file is sys.stdout:
+            if i != 0:
+                print()
+            text_script_archive.build_to(sys.stdout)
+            print()
+            print(hex(text_script_archive.addr + text_script_archive.size))
+        else:
+            if i != 0:
+                output_file.write('\n\n')
+            text_script_archive.build_to(output_file)
+            output_file.write(hex(text_script_archive.addr + text_script_archive.size))
 
-    # TODO fix: use a logger instead
-    for e in error.list:
-        print('error: ' + e)
+        profiling.record(archive=address, ok=True, time=time.perf_counter() - start_time, size=text_script_archive.size,
+                         retries=text_script_archive.retry_count, reparsed_size=text_script_archive.reparsed_size,
+                         parse_stats=accounting.get_totals() if accounting is not None else None)
+
+        if accounting is not None:
+            # to stderr, since the dump may be written to stdout
+            totals = accounting.get_totals()
+            print('parse stats 0x{0:X}: {1}'.format(address, ', '.join('%s=%d' % item for item in totals.items())),
+                  file=sys.stderr)
+            for script in accounting.get_backtracking_scripts():
+                print('  script {script} (+0x{offset:X}, attempt {attempt}): rewinds={rewinds} rewind_size={rewind_size} '
+                      'reparsed_size={reparsed_size} memo_hits={memo_hits} failure: {failure}'.format(**script),
+                      file=sys.stderr)
+
+        # TODO fix: use a logger instead
+        # to stderr, so that they don't end up in the dump when it's written to stdout
+        for e in command_context.errors:
+            if args.list:
+                print('error: 0x{0:X}: {1}'.format(address, e), file=sys.stderr)
+            else:
+                print('error: ' + e, file=sys.stderr)
+    hints.save()
+
+    if output_file is not None and output_file is not sys.stdout:
+        output_file.close()
+    # the table goes to stderr, since the dump may be written to stdout
+    profiling.finish(sys.stderr)
+    if failed_count:
+        exit(1)
@@ -1,15 +1,24 @@
 import sys
 import os
+import io
+import time
 from typing import List, Union, Tuple
 import argparse
+import bisect
 import text_script_dumper as dumper
 import definitions
-from common import info
+import lz77
+import cache
+import profiling
+from common import info, map_file, write_if_changed
 
 from edit_source import source_read
 
 class TextScriptScannerException(Exception): pass
 
+# folder of the repository the archives are dumped to, compressed ones in its compressed folder
+TEXTSCRIPT_DIR = os.path.join('data', 'textscript')
+
 def error(m):
     print('error: {m}'.format(**vars()))
     exit(1)
@@ -25,13 +34,23 @@ def main(argv):
     help += 'available commands:\n'
     for cmd in filter(lambda key: not key.startswith('_'), Commands.__dict__.keys()):
         help += "  {0}: {1}\n".format(cmd, getattr(Commands, cmd)(None, None, None, get_desc=True))
+    help += 'options of every command:\n'
+    help += '  --profile: prints how long each phase took\n'
+    help += '  --profile-records PATH: with --profile, writes a JSON line per archive with its wall time, size and retries\n'
     help += ' \n' # for some reason, I had to add that space for it to add an empty new line
     parser.usage = help[help.index(':')+1:]
 
     # when specifying argv, it mustn't contain the program name
     args = parser.parse_args(argv[1:4])
 
-    getattr(Commands, args.cmd)(args.rom_file, args.archive_list_file, argv[4:])
+    # profiling options are shared by all commands
+    profile_parser = argparse.ArgumentParser(add_help=False)
+    profiling.add_arguments(profile_parser)
+    profile_args, command_argv = profile_parser.parse_known_args(argv[4:])
+    profiling.start(profile_args)
+
+    getattr(Commands, args.cmd)(args.rom_file, args.archive_list_file, command_argv)
+    profiling.finish()
 
 class Commands:
     @staticmethod
@@ -62,23 +81,35 @@ class Commands:
 
         parser = argparse.ArgumentParser(description=desc)
         parser.prog = parser.prog + ' ' + Commands.get_compressed_archives.__name__
-        parser.add_argument('--recache', action='store_true', help='recomputes all units from the rom repository')
+        parser.add_argument('--recache', action='store_true', help='recomputes the cached results related to this command')
         parser.add_argument('--noskip', action='store_true', default=False, help='does not skip faulty scripts specified in Definitions.SKIP_SCRIPTS')
         parser.add_argument('--silent', action='store_true', default=False, help='removes info messages')
+        parser.add_argument('--jobs', type=int, default=1, help='number of processes to dump archives with')
+        parser.add_argument('--force', action='store_true', default=False, help='dumps archives even if their inputs did not change since the last dump')
         args = parser.parse_args(argv)
 
         archives = process_archives(archive_path)
 
         # find the compressed and non-compressed archives and cache the result to disk
-        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives)
+        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives, args.recache)
 
         # read repository and tokenize it into units for analysis
-        cache_path = '{root_dir}/.cache/repo_units_ea.cache'.format(root_dir=definitions.ROOT_DIR)
-        source_units = cache_load_addressable_source_units(cache_path, args.recache)
+        source_units = cache_load_addressable_source_units(args.recache)
+
+        # interpreters that worked for each script in previous dumps
+        hints = dumper.InterpreterHints.load(dumper.InterpreterHints.get_path(dumper.CommandContext()))
+
+        # inputs of the previous dumps, to only dump the archives that changed since
+        manifest = DumpManifest.load(DumpManifest.get_path())
+        environment = DumpManifest.get_environment()
+        up_to_date_count = 0
 
         error_messages = []
         def dump_compressed_textscripts():
-            compressed_archives_path = os.path.join(definitions.ROM_REPO_DIR, 'data', 'textscript', 'compressed')
+            nonlocal up_to_date_count
+            compressed_archives_path = os.path.join(definitions.ROM_REPO_DIR, TEXTSCRIPT_DIR, 'compressed')
+            jobs = []
+            jobs_inputs = []
             for filename in os.listdir(compressed_archives_path):
                 if not args.noskip and filename in definitions.SKIP_SCRIPTS:
                     info(not args.silent, 'skipping {filename} as specified in definitions.SKIP_SCRIPTS'.format(**vars()))
@@ -86,102 +117,89 @@ class Commands:
 
                 if filename.endswith('.s.lz'):
                     path = os.path.join(compressed_archives_path, filename)
-                    # decompress into a *.s.bin
-                    s_path = path[:path.rindex('.')]
-                    bin_path = s_path + '.bin'
-                    gbagfx_decompress(path, bin_path)
-
-                    # dump into a *.s
-                    bin_size = os.path.getsize(bin_path)
-                    with open(bin_path, 'rb') as bin_file:
-                        try:
-                            textscript_archive = dumper.TextScriptArchive.read_script(dumper.CommandContext(), 4,
-                                                                                      bin_file, bin_size - 4)
-                        except Exception:
-                            error_msg = 'error: failed to dump {filename}'.format(**vars())
-                            info(not args.silent, error_msg)
-                            error_messages.append(error_msg)
-                            continue
-
-                        # modify content for integration
-                        content = '\t.include "charmap.inc"\n'
-                        content += '\t.include "include/macros/enum.inc"\n'
-                        content += '\t.include "include/bytecode/text_script.inc"\n'
-                        label =  filename[:filename.rindex('.')]
-                        label = label[:label.rindex('.')]
-                        content += '\n\t.data\n\n'
-                        content += '{label}::\n'.format(**vars())
-
-                        # make sure it actually compiles to *.s.bin
-                        bin_file.seek(4)
-                        if textscript_archive.serialize() != bin_file.read():
-                            error_msg = 'error: text archive {label} does not compile to the same binary'.format(**vars())
-                            info(not args.silent, error_msg)
-                            error_messages.append(error_msg)
-                            continue
-                            # raise Exception('text archive {label} does not compile to the same binary'.format(**vars()))
-
-                    # write the compression header of 4 bytes
-                    def bytes_to_int(bytes):
-                        out = 0
-                        for i, b in enumerate(bytes):
-                            out += b << 8*i
-                        return out
-
-                    with open(bin_path, 'rb') as lz_file:
-                        compression_header = bytes_to_int(lz_file.read(4))
-                        content += '\t.word 0x{0:X}\n\n'.format(compression_header)
-
-                    # include dump, but without the byte alignment
-                    build = textscript_archive.build()
-                    build = build[:build.rindex('.balign')]
-
-                    # replace the dummy TextScript0 with the actual name of the file
-                    while 'TextScript0_' in build:
-                        build = build.replace('TextScript0_', label + '_')
-
-                    content += build
-
-                    # write *.s
+                    with open(path, 'rb') as lz_file:
+                        inputs = DumpManifest.compute_inputs(environment, lz_file.read())
+                    if not args.force and manifest.is_up_to_date(path[:path.rindex('.')], inputs):
+                        up_to_date_count += 1
+                        continue
+                    jobs.append((path, hints.get(filename)))
+                    jobs_inputs.append(inputs)
+
+            for (path, hints_entry), inputs, result in zip(jobs, jobs_inputs, run_archive_jobs(dump_compressed_textscript_job, jobs, args.jobs)):
+                filename = os.path.basename(path)
+                if result.hints is not None:
+                    hints.update(filename, *result.hints)
+                if result.exception is not None:
+                    if isinstance(result.exception, TextScriptScannerException):
+                        error_msg = 'error: {0}'.format(result.exception)
+                    else:
+                        error_msg = 'error: failed to dump {filename}'.format(**vars())
+                    info(not args.silent, error_msg)
+                    error_messages.append(error_msg)
+                    continue
+
+                # write *.s
+                s_path = path[:path.rindex('.')]
+                with profiling.span('write', len(result.text)):
+                    written = write_if_changed(s_path, result.text)
+                if written:
                     info(not args.silent, 'writing {s_path}'.format(**vars()))
-                    with open(s_path, 'w') as output_file:
-                        output_file.write(content)
+                manifest.update(s_path, inputs)
         dump_compressed_textscripts()
 
 
         # dump noncompressed textscripts
 
-        with open(definitions.BASEROM_PATH, 'rb') as baserom_file:
-            address_space = list(map(lambda k: int(k, 16), source_units.keys()))
-            for archive_ptr, archive_size_none in regular_archives:
-                archive_unit = source_units[hex(archive_ptr | 0x8000000)]
-                archive_path = archive_unit['unit']['file_path']
-
-                if not args.noskip and archive_ptr in definitions.SKIP_SCRIPTS:
-                    info(not args.silent, 'skipping {archive_path} as specified in definitions.SKIP_SCRIPTS'.format(**vars()))
-                    continue
-
-                # compute size based on the next unit in the source
-                next_unit_address = address_space[address_space.index(archive_ptr | 0x8000000)+1] & ~0x8000000
-                archive_size = next_unit_address - archive_ptr
-
-                try:
-                    archive_obj = dumper.TextScriptArchive.read_script(dumper.CommandContext(), archive_ptr, baserom_file, archive_size)
-                except Exception:
-                    error_msg = 'error: failed to dump {archive_path}'.format(**vars())
-                    info(not args.silent, error_msg)
-                    error_messages.append(error_msg)
-                    continue
-
-                # generate output to corresponding archive file
-                if not archive_path.startswith('data/textscript'):
-                    raise TextScriptScannerException('expected archive to be in data/textscript')
-                with open(os.path.join(definitions.ROM_REPO_DIR, archive_path), 'w') as archive_file:
-                    content = archive_unit['name'] + '::\n'
-                    content += archive_obj.build()
-                    content = content.replace('TextScript0', archive_unit['name']) + '\n'
-                    info(not args.silent, 'writing to {archive_path}'.format(**vars()))
-                    archive_file.write(content)
+        unit_index = SourceUnitIndex(source_units)
+        baserom = map_file(definitions.BASEROM_PATH)
+        jobs = []
+        jobs_inputs = []
+        for archive_ptr, archive_size_none in regular_archives:
+            archive_unit = unit_index.unit_at(archive_ptr)
+            if archive_unit is None:
+                raise TextScriptScannerException('could not find archive 0x{archive_ptr:07X} in the source'.format(**vars()))
+            archive_path = archive_unit['unit']['file_path']
+
+            if not args.noskip and archive_ptr in definitions.SKIP_SCRIPTS:
+                info(not args.silent, 'skipping {archive_path} as specified in definitions.SKIP_SCRIPTS'.format(**vars()))
+                continue
+
+            # compute size based on the next unit in the source
+            next_unit_address = unit_index.next_unit_address(archive_ptr)
+            if next_unit_address is None:
+                raise TextScriptScannerException('archive 0x{archive_ptr:07X} is in the last unit of the source'.format(**vars()))
+            archive_size = (next_unit_address & ~0x8000000) - archive_ptr
+            inputs = DumpManifest.compute_inputs(environment, baserom[archive_ptr:archive_ptr + archive_size],
+                                                 archive_unit['name'])
+            if not args.force and manifest.is_up_to_date(os.path.join(definitions.ROM_REPO_DIR, archive_path), inputs):
+                up_to_date_count += 1
+                continue
+            jobs.append((archive_ptr, archive_size, archive_unit['name'], hints.get(archive_ptr)))
+            jobs_inputs.append(inputs)
+
+        results = run_archive_jobs(read_archive_job, jobs, args.jobs, definitions.BASEROM_PATH)
+        for (archive_ptr, archive_size, label, hints_entry), inputs, result in zip(jobs, jobs_inputs, results):
+            archive_path = unit_index.unit_at(archive_ptr)['unit']['file_path']
+            if result.hints is not None:
+                hints.update(archive_ptr, *result.hints)
+            if result.exception is not None:
+                error_msg = 'error: failed to dump {archive_path}'.format(**vars())
+                info(not args.silent, error_msg)
+                error_messages.append(error_msg)
+                continue
+
+            # generate output to corresponding archive file
+            if not archive_path.startswith('data/textscript'):
+                raise TextScriptScannerException('expected archive to be in data/textscript')
+            abs_archive_path = os.path.join(definitions.ROM_REPO_DIR, archive_path)
+            with profiling.span('write', len(result.text)):
+                written = write_if_changed(abs_archive_path, label + '::\n' + result.text + '\n')
+            if written:
+                info(not args.silent, 'writing to {archive_path}'.format(**vars()))
+            manifest.update(abs_archive_path, inputs)
+        hints.save()
+        manifest.save()
+        info(not args.silent, 'skipped {up_to_date_count} archives that did not change since they were last dumped'.format(**vars()))
 
 
         if len(error_messages) != 0:
@@ -196,43 +214,36 @@ class Commands:
 
         parser = argparse.ArgumentParser(description=desc)
         parser.prog = parser.prog + ' ' + Commands.integrate_archives.__name__
-        parser.add_argument('--recache', action='store_true', help='deleted cached files related to this command')
+        parser.add_argument('--recache', action='store_true', help='recomputes the cached results related to this command')
         parser.add_argument('--noncompressed', action='store_true', default=False)
         args = parser.parse_args(argv)
 
         archives = process_archives(archive_path)
 
         # find the compressed and non-compressed archives and cache the result to disk
-        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives)
+        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives, args.recache)
 
         # read repository and tokenize it into units for analysis
-        root_dir = definitions.ROOT_DIR
-        cache_path = '{root_dir}/.cache/repo_units_ea.cache'.format(**vars())
-        source_units = cache_load_addressable_source_units(cache_path, args.recache)
+        source_units = cache_load_addressable_source_units(args.recache)
 
         # TODO: define options for these based on noncompressed flag
         # TODO: integrate incbin_compressed_archives into this command
 
         def integrate_regular_archives(source_units, regular_archives):
+            unit_index = SourceUnitIndex(source_units)
             embedded_units = {}
             for archive_ptr, archive_size_none in regular_archives:
                 archive_ptr |= 0x8000000
-                if hex(archive_ptr) in source_units.keys():
-                    archive_unit = source_units[hex(archive_ptr)]
+                archive_unit = unit_index.unit_at(archive_ptr)
+                if archive_unit is not None:
                     print(archive_unit['unit']['file_path'], archive_unit['name'])
                     if 'data/textscript/' not in archive_unit['unit']['file_path']:
                         pass
                 else:
-                    unit = None
-                    prev_address = None
-                    for i, address in enumerate(map(lambda k: int(k, 16), source_units.keys())):
-                        if archive_ptr < address:
-                            if i == 0:
-                                raise TextScriptScannerException('archive 0x{archive_ptr:07X} occurred before first unit'.format(**vars()))
-                            # pointer belons to previous unit
-                            unit = source_units[hex(prev_address)]
-                            break
-                        prev_address = address
+                    if len(unit_index) != 0 and archive_ptr < unit_index.starts[0]:
+                        raise TextScriptScannerException('archive 0x{archive_ptr:07X} occurred before first unit'.format(**vars()))
+                    # pointer belongs to previous unit
+                    unit = unit_index.unit_containing(archive_ptr)
 
                     if unit is not None:
                         print('{unit_file_path} found embedded archive 0x{archive_ptr:07X} in unit "{unit_name}"'.format(unit_name=unit['name'], unit_file_path=unit['unit']['file_path'], **vars()))
@@ -261,19 +272,21 @@ class Commands:
                 print(unit['name'], list(map(lambda e: (hex(e[0]), e[1]), segments.__iter__())))
 
                 content = DataUnit.filter_content_data_definitions(data_unit.content)
-                with open(definitions.BASEROM_PATH, 'rb') as baserom_file:
-                    baserom_file.seek(unit['ea'] & ~0x8000000)
-                    for i, segment in enumerate(compute_continuous_buffer_segments(unit['ea'], data_unit.size, segments)):
-                        seg_start, seg_end, is_orig_seg = segment
-                        if i == 0:
-                            content = DataUnit.build_content_data_byte_definitions(content, baserom_file.read(seg_end - seg_start)) + '\n'
+                baserom = map_file(definitions.BASEROM_PATH)
+                offset = unit['ea'] & ~0x8000000
+                for i, segment in enumerate(compute_continuous_buffer_segments(unit['ea'], data_unit.size, segments)):
+                    seg_start, seg_end, is_orig_seg = segment
+                    seg_data = baserom[offset:offset + seg_end - seg_start]
+                    offset += seg_end - seg_start
+                    if i == 0:
+                        content = DataUnit.build_content_data_byte_definitions(content, seg_data) + '\n'
+                    else:
+                        if is_orig_seg:
+                            content += DataUnit.build_content_data_byte_definitions('TextScript{0:07X}::'.format(seg_start),
+                                                                                    seg_data) + '\n'
                         else:
-                            if is_orig_seg:
-                                content += DataUnit.build_content_data_byte_definitions('TextScript{0:07X}::'.format(seg_start),
-                                                                                        baserom_file.read(seg_end - seg_start)) + '\n'
-                            else:
-                                content += DataUnit.build_content_data_byte_definitions('byte_{0:07X}::'.format(seg_start),
-                                                                                        baserom_file.read(seg_end - seg_start)) + '\n'
+                            content += DataUnit.build_content_data_byte_definitions('byte_{0:07X}::'.format(seg_start),
+                                                                                    seg_data) + '\n'
                 edit_source_file(get_source_unit_abs_path(unit), data_unit.content, content)
 
 
@@ -299,25 +312,24 @@ class Commands:
 
         parser = argparse.ArgumentParser(description=desc)
         parser.prog = parser.prog + ' ' + Commands.incbin_compressed_archives.__name__
-        parser.add_argument('--recache', action='store_true', help='deleted cached files related to this command')
+        parser.add_argument('--recache', action='store_true', help='recomputes the cached results related to this command')
         args = parser.parse_args(argv)
 
         archives = process_archives(archive_path)
 
         # find the compressed and non-compressed archives and cache the result to disk
-        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives)
+        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives, args.recache)
 
         # read repository and tokenize it into units for analysis
-        root_dir = definitions.ROOT_DIR
-        cache_path = '{root_dir}/.cache/repo_units.cache'.format(**vars())
-        source_units = cache_load_source_units(cache_path, args.recache)
+        source_units = cache_load_source_units(args.recache)
 
         count_found = 0
         size = 0
         clean_data_units = []
         data_units_to_process = []
+        compressed_archive_sizes = dict(compressed_archives)
         for source_unit in filter(lambda u: 'ea' in u, source_units):
-            archive = find_archive(compressed_archives, source_unit['ea'])
+            archive = find_archive(compressed_archive_sizes, source_unit['ea'])
             if archive is not None and '.incbin' not in source_unit['unit']['content']:
                 archive_ptr, archive_size = archive
                 data_unit = DataUnit(source_unit)
@@ -381,6 +393,7 @@ class Commands:
         parser.add_argument('--compressed', action='store_true')
         parser.add_argument('--noncompressed', action='store_true')
         parser.add_argument('--error', action='store_true')
+        parser.add_argument('--jobs', type=int, default=1, help='number of processes to dump archives with')
         args = parser.parse_args(argv)
 
         archives = process_archives(archive_path)
@@ -390,58 +403,138 @@ class Commands:
         error_count_comp = 0
         correct_count_reg = 0
         correct_count_comp = 0
-        with open(rom_path, 'rb') as rom_file:
-            if args.noncompressed:
-                for archive_ptr, archive_size in regular_archives:
-                        i = error_count_reg + correct_count_reg
-                        print('reg[{i}]: @archive 0x{archive_ptr:X} (size: {archive_size})'.format(**vars()))
-                        try:
-                            # some non-compressed scripts must have their size specified to know they ended...
-                            # because their last scripts have been removed, but are still being pointed to.
-                            if archive_ptr in definitions.SCRIPT_SIZES:
-                                size = definitions.SCRIPT_SIZES[archive_ptr]
-                            else:
-                                size = None
-
-                            textscript_archive = dumper.TextScriptArchive.read_script(dumper.CommandContext(), archive_ptr, rom_file, size)
-
-                            correct_count_reg += 1
-                        except Exception:
-                            error_count_reg += 1
-                            if args.error: raise
-
-                print('error_count_uncompressed: %d' % (error_count_reg))
-                print('correct_count_uncompressed: %d' % (correct_count_reg))
-
-            if args.compressed:
-                 for archive_ptr, archive_size in compressed_archives:
-                    decompress_path = 'TextScript%07X.lz.bin' % (archive_ptr)
-                    gbagfx_decompress_at(rom_file, archive_ptr, decompress_path)
-                    size = os.path.getsize(decompress_path) - 4 # must not account for the compression header!
-                    with open(decompress_path, 'rb') as decompressed_file:
-                        i = error_count_comp + correct_count_comp
-                        #print('comp[{i}]: @archive 0x{archive_ptr:X} (size: {archive_size})'.format(**vars()))
-                        try:
-                            textscript_archive = dumper.TextScriptArchive.read_script(dumper.CommandContext(), 4, decompressed_file, size)
-
-                            # test matching
-                            decompressed_file.seek(4)
-                            if textscript_archive.serialize() != decompressed_file.read():
-                                raise TextScriptScannerException('archive {archive_ptr:X} does not match binary input'.format(**vars()))
-
-                            correct_count_comp += 1
-                        except Exception:
-                            error_count_comp += 1
-                            if args.error: raise
-
-                    os.remove(decompress_path)
-
-                 print('error_count_compressed: %d' % (error_count_comp))
-                 print('correct_count_compressed: %d' % (correct_count_comp))
+        reparsed_size_reg = 0
+        reparsed_size_comp = 0
+        dump_time_reg = 0
+        dump_time_comp = 0
+        hints = dumper.InterpreterHints.load(dumper.InterpreterHints.get_path(dumper.CommandContext()))
+        if args.noncompressed:
+            # some non-compressed scripts must have their size specified to know they ended...
+            # because their last scripts have been removed, but are still being pointed to.
+            jobs = [(archive_ptr, definitions.SCRIPT_SIZES.get(archive_ptr), None, hints.get(archive_ptr))
+                    for archive_ptr, archive_size in regular_archives]
+            results = run_archive_jobs(read_archive_job, jobs, args.jobs, rom_path)
+            for i, ((archive_ptr, archive_size), result) in enumerate(zip(regular_archives, results)):
+                    print('reg[{i}]: @archive 0x{archive_ptr:X} (size: {archive_size})'.format(**vars()))
+                    if result.hints is not None:
+                        hints.update(archive_ptr, *result.hints)
+                    dump_time_reg += result.time
+                    if result.exception is None:
+                        reparsed_size_reg += result.reparsed_size
+                        correct_count_reg += 1
+                    else:
+                        error_count_reg += 1
+                        if args.error: raise result.exception
+
+            print('error_count_uncompressed: %d' % (error_count_reg))
+            print('correct_count_uncompressed: %d' % (correct_count_reg))
+            print('reparsed_bytes_uncompressed: %d' % (reparsed_size_reg))
+            print('dump_time_uncompressed: %.3fs' % (dump_time_reg))
+
+        if args.compressed:
+             jobs = [(archive_ptr, hints.get(archive_ptr)) for archive_ptr, archive_size in compressed_archives]
+             results = run_archive_jobs(read_compressed_archive_job, jobs, args.jobs, rom_path)
+             for i, ((archive_ptr, archive_size), result) in enumerate(zip(compressed_archives, results)):
+                #print('comp[{i}]: @archive 0x{archive_ptr:X} (size: {archive_size})'.format(**vars()))
+                if result.hints is not None:
+                    hints.update(archive_ptr, *result.hints)
+                dump_time_comp += result.time
+                if result.exception is None:
+                    reparsed_size_comp += result.reparsed_size
+                    correct_count_comp += 1
+                else:
+                    error_count_comp += 1
+                    if args.error: raise result.exception
 
+             print('error_count_compressed: %d' % (error_count_comp))
+             print('correct_count_compressed: %d' % (correct_count_comp))
+             print('reparsed_bytes_compressed: %d' % (reparsed_size_comp))
+             print('dump_time_compressed: %.3fs' % (dump_time_comp))
+
+        hints.save()
         print('compressed to noncompressed scanned')
         print(len(compressed_archives), len(regular_archives))
 
+    @staticmethod
+    def benchmark_compression(rom_path, archive_path, argv, get_desc=False):
+        desc = 'decompresses and compresses every compressed archive again in memory, and checks it matches the ROM'
+        if get_desc:
+            return desc
+
+        parser = argparse.ArgumentParser(description=desc)
+        parser.prog = parser.prog + ' ' + Commands.benchmark_compression.__name__
+        parser.add_argument('--verbose', action='store_true', help='prints the timing of every archive')
+        args = parser.parse_args(argv)
+
+        archives = process_archives(archive_path)
+        compressed_archives, regular_archives = cache_separate_archives_based_on_compression(archive_path, rom_path, archives)
+
+        rom = map_file(rom_path)
+        decompress_time = 0
+        compress_time = 0
+        slowest = (0, None)
+        mismatches = []
+        for archive_ptr, archive_size in compressed_archives:
+            address = archive_ptr & ~0x8000000
+            start_time = time.perf_counter()
+            with profiling.span('decompress') as span:
+                data, compressed_size = lz77.decompress(rom, address)
+                span.size = len(data)
+            decompressed_time = time.perf_counter()
+            with profiling.span('compress', len(data)):
+                compressed = lz77.compress(data)
+            compressed_time = time.perf_counter()
+
+            decompress_time += decompressed_time - start_time
+            compress_time += compressed_time - decompressed_time
+            slowest = max(slowest, (compressed_time - decompressed_time, archive_ptr))
+            if compressed != rom[address:address + len(compressed)]:
+                mismatches.append(archive_ptr)
+            info(args.verbose, '0x{archive_ptr:07X}: {0} -> {1} bytes, decompressed in {2:.2f}ms, compressed in {3:.2f}ms'
+                 .format(len(data), len(compressed), 1000 * (decompressed_time - start_time),
+                         1000 * (compressed_time - decompressed_time), **vars()))
+
+        print('archives: %d' % (len(compressed_archives)))
+        print('matching_count: %d' % (len(compressed_archives) - len(mismatches)))
+        print('mismatches: %s' % (', '.join('0x%07X' % archive_ptr for archive_ptr in mismatches)))
+        print('decompress_time: %.3fs' % (decompress_time))
+        print('compress_time: %.3fs' % (compress_time))
+        if slowest[1] is not None:
+            print('slowest_compress: 0x%07X (%.2fms)' % (slowest[1], 1000 * slowest[0]))
+
+    @staticmethod
+    def compress_archives(rom_path, archive_path, argv, get_desc=False):
+        desc = 'compresses the built *.s.bin of compressed archives into their *.s.lz, such as after editing their *.s'
+        if get_desc:
+            return desc
+
+        parser = argparse.ArgumentParser(description=desc)
+        parser.prog = parser.prog + ' ' + Commands.compress_archives.__name__
+        parser.add_argument('paths', nargs='*',
+                            help='*.s.bin files to compress. defaults to every one in data/textscript/compressed')
+        parser.add_argument('--verbose', action='store_true', help='prints every archive that is written')
+        args = parser.parse_args(argv)
+
+        paths = args.paths
+        if not paths:
+            compressed_archives_path = os.path.join(definitions.ROM_REPO_DIR, TEXTSCRIPT_DIR, 'compressed')
+            paths = [os.path.join(compressed_archives_path, filename)
+                     for filename in sorted(os.listdir(compressed_archives_path)) if filename.endswith('.s.bin')]
+
+        start_time = time.perf_counter()
+        written_count = 0
+        for path in paths:
+            if not path.endswith('.bin'):
+                raise TextScriptScannerException('expected a built archive ending with .bin: {path}'.format(**vars()))
+            lz_path = path[:-len('.bin')] + '.lz'
+            if compress_file(path, lz_path):
+                written_count += 1
+                info(args.verbose, 'writing {lz_path}'.format(**vars()))
+
+        print('archives: %d' % (len(paths)))
+        print('written_count: %d' % (written_count))
+        print('compress_time: %.3fs' % (time.perf_counter() - start_time))
+
     @staticmethod
     def _extract_embedded_compressed_archives(rom_path, data_nested_archives):
         def join_archives_by_unit(data_nested_archives):
@@ -491,40 +584,36 @@ class Commands:
 
             # build segments
             content = DataUnit.filter_content_data_definitions(data_unit.content)
-            with open(rom_path, 'rb') as rom_file:
-                for i, seg in enumerate(segments):
-                    seg_start, seg_end, is_compressed_archive = seg
-                    print('\t(0x{seg_start:X}, 0x{seg_end:X}, .incbin? {is_compressed_archive})'.format(**vars()))
-                    if i == 0:
-                        if is_compressed_archive:
-                            raise TextScriptScannerException('first segment should always be the original data unit')
-                        rom_file.seek(seg_start)
-
-                        # we're putting data in byte form, not word form, so update label
-                        # if 'dword_' in content and '::' in content:
-                        #     label = content[content.index('dword'):content.index('::')+2]
-                        #     new_label = label.replace('dword_', 'byte_')
-                        #     source_relabel(label[:-2], new_label[:-2])
-                        #     content = content.replace(label, new_label)
-
-                        content = DataUnit.build_content_data_byte_definitions(content, rom_file.read(
-                            seg_end - seg_start)) + '\n'
-                    else:
-                        if is_compressed_archive:
-                            lz_name = 'CompText{0:07X}'.format(seg_start | 0x8000000)
-                            lz_path = os.path.join('data', 'textscript', 'compressed', lz_name + '.s.lz')
-                            abs_lz_path = os.path.join(definitions.ROM_REPO_DIR, lz_path)
+            rom = map_file(rom_path)
+            for i, seg in enumerate(segments):
+                seg_start, seg_end, is_compressed_archive = seg
+                print('\t(0x{seg_start:X}, 0x{seg_end:X}, .incbin? {is_compressed_archive})'.format(**vars()))
+                if i == 0:
+                    if is_compressed_archive:
+                        raise TextScriptScannerException('first segment should always be the original data unit')
 
-                            # generate lz file
-                            write_subfile(rom_path, abs_lz_path, seg_start, seg_end - seg_start)
+                    # we're putting data in byte form, not word form, so update label
+                    # if 'dword_' in content and '::' in content:
+                    #     label = content[content.index('dword'):content.index('::')+2]
+                    #     new_label = label.replace('dword_', 'byte_')
+                    #     source_relabel(label[:-2], new_label[:-2])
+                    #     content = content.replace(label, new_label)
 
-                            # incbin lz file
-                            content += DataUnit.build_content_incbin('{lz_name}::'.format(**vars()), lz_path) + '\n'
-                        else:
-                            label = 'byte_{0:07X}'.format(seg_start | 0x8000000)
-                            rom_file.seek(seg_start)
-                            content += DataUnit.build_content_data_byte_definitions(label + '::', rom_file.read(
-                                seg_end - seg_start)) + '\n'
+                    content = DataUnit.build_content_data_byte_definitions(content, rom[seg_start:seg_end]) + '\n'
+                else:
+                    if is_compressed_archive:
+                        lz_name = 'CompText{0:07X}'.format(seg_start | 0x8000000)
+                        lz_path = os.path.join('data', 'textscript', 'compressed', lz_name + '.s.lz')
+                        abs_lz_path = os.path.join(definitions.ROM_REPO_DIR, lz_path)
+
+                        # generate lz file
+                        write_subfile(rom_path, abs_lz_path, seg_start, seg_end - seg_start)
+
+                        # incbin lz file
+                        content += DataUnit.build_content_incbin('{lz_name}::'.format(**vars()), lz_path) + '\n'
+                    else:
+                        label = 'byte_{0:07X}'.format(seg_start | 0x8000000)
+                        content += DataUnit.build_content_data_byte_definitions(label + '::', rom[seg_start:seg_end]) + '\n'
 
             # edit source
             edit_source_file(get_source_unit_abs_path(data_unit.source_unit), data_unit.content, content)
@@ -560,6 +649,293 @@ class Commands:
                 edit_source_file(get_source_unit_abs_path(archive_unit.source_unit), archive_unit.content, new_content)
 
 
+class ArchiveJobResult:
+    """
+    outcome of dumping one archive of a batch, see run_archive_jobs
+    """
+    __slots__ = ('key', 'text', 'exception', 'time', 'size', 'reparsed_size', 'retry_count', 'hints', 'profile')
+
+    def __init__(self, key):
+        """
+        :param key: the address or name of the archive
+        """
+        self.key = key
+        # output of the job, if it produces any
+        self.text = None
+        # the exception the job failed with, or None
+        self.exception = None
+        # time spent by the job, in seconds
+        self.time = 0
+        # size of the archive, and how much of it was parsed again by retrying scripts, see TextScriptArchive
+        self.size = 0
+        self.reparsed_size = 0
+        self.retry_count = 0
+        # the interpreter hints of the archive after the job, see InterpreterHints.get
+        self.hints = None
+        # spans and counters of the job when profiling, see profiling.collect
+        self.profile = None
+
+
+class DumpManifest:
+    """
+    record of the inputs each output file of dump_textscripts was dumped from, so that re-runs only dump the archives
+    whose inputs changed. An output file that was modified or removed since it was dumped is dumped again too
+    """
+    VERSION = 1
+
+    def __init__(self, path: str=None):
+        """
+        :param path: file the manifest is saved to, see DumpManifest.get_path
+        """
+        self.path = path
+        # absolute output path -> {'inputs': see compute_inputs, 'size': output size, 'mtime': output mtime in ns}
+        self.outputs = {}
+        self.modified = False
+
+    @staticmethod
+    def get_path(cache_dir: str=definitions.CACHE_DIR) -> str:
+        return os.path.join(cache_dir, 'dump_manifest.json')
+
+    @staticmethod
+    def load(path: str) -> 'DumpManifest':
+        """
+        loads the manifest saved to :path:. If it is missing or unreadable, every archive is dumped
+        """
+        import json
+        manifest = DumpManifest(path)
+        try:
+            with open(path, 'r') as manifest_file:
+                content = json.load(manifest_file)
+            if content['version'] == DumpManifest.VERSION:
+                manifest.outputs = content['outputs']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return manifest
+
+    def save(self):
+        """
+        writes the manifest back to its file if it was changed. Failing to write it is not an error
+        """
+        import json
+        if not self.modified or self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write atomically, so that an interrupted dump doesn't lose the whole manifest
+            tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as manifest_file:
+                json.dump({'version': DumpManifest.VERSION, 'outputs': self.outputs}, manifest_file)
+            os.replace(tmp_path, self.path)
+            self.modified = False
+        except OSError:
+            pass
+
+    @staticmethod
+    def get_environment(ini_dir: str=None, tbl_path: str=None) -> str:
+        """
+        :param ini_dir: directory of the command database. defaults to ModuleState.INI_DIR
+        :param tbl_path: the charmap. defaults to definitions.GAME_STRING_TBL_PATH
+        :return: hash of the inputs shared by all archives: the dumper version, the command database and the charmap
+        """
+        import hashlib
+        ini_dir = ini_dir if ini_dir is not None else dumper.ModuleState.INI_DIR
+        tbl_path = tbl_path if tbl_path is not None else definitions.GAME_STRING_TBL_PATH
+        environment = (dumper.DUMPER_VERSION, dumper.CommandDatabase.compute_hash(ini_dir), cache.hash_file(tbl_path))
+        return hashlib.sha1(repr(environment).encode()).hexdigest()
+
+    @staticmethod
+    def compute_inputs(environment: str, source, *args) -> str:
+        """
+        :param environment: see get_environment
+        :param source: bytes-like object the archive is dumped from
+        :param args: anything else the output depends on, like the label of the archive
+        :return: hash of all inputs of the dump of an archive
+        """
+        import hashlib
+        h = hashlib.sha1(repr((environment, args)).encode())
+        h.update(source)
+        return h.hexdigest()
+
+    @staticmethod
+    def get_key(output_path: str) -> str:
+        return os.path.abspath(output_path)
+
+    def is_up_to_date(self, output_path: str, inputs: str) -> bool:
+        """
+        :return: whether :output_path: was dumped from :inputs: and was not modified since
+        """
+        entry = self.outputs.get(DumpManifest.get_key(output_path))
+        if entry is None or entry['inputs'] != inputs:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns
+
+    def update(self, output_path: str, inputs: str):
+        """
+        records that :output_path: was just dumped from :inputs:
+        """
+        stat = os.stat(output_path)
+        self.outputs[DumpManifest.get_key(output_path)] = {'inputs': inputs, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        self.modified = True
+
+
+# buffer of the ROM in the current job process, see run_archive_jobs
+_job_rom = None
+
+
+def _init_job_process(rom_path: str=None, profile: bool=False):
+    global _job_rom
+    _job_rom = map_file(rom_path) if rom_path is not None else None
+    if profile and not profiling.is_enabled():
+        profiling.enable()
+    # load the compiled command database once per process, not once per archive
+    dumper.CommandContext().database
+
+
+def run_archive_jobs(job_func, jobs: list, num_jobs: int=1, rom_path: str=None):
+    """
+    runs :job_func: on every job. With more than one job process, the jobs are spread over a process pool.
+    Either way, the results are returned in the order of :jobs:, so that output is deterministic
+    :param job_func: module level function taking a job and returning an ArchiveJobResult, like read_archive_job
+    :param jobs: picklable arguments to :job_func:
+    :param num_jobs: number of processes to run the jobs with
+    :param rom_path: ROM that jobs read from, mapped once per process
+    :return: iterator over the ArchiveJobResult of each job
+    """
+    if num_jobs <= 1 or len(jobs) <= 1:
+        _init_job_process(rom_path)
+        yield from map(_profile_archive_job, map(job_func, jobs))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    # compile the command database before forking, so that job processes only load it
+    dumper.CommandContext().database
+    chunksize = max(1, len(jobs) // (4 * num_jobs))
+    with ProcessPoolExecutor(num_jobs, initializer=_init_job_process,
+                             initargs=(rom_path, profiling.is_enabled())) as executor:
+        yield from map(_profile_archive_job, executor.map(job_func, jobs, chunksize=chunksize))
+
+
+def _profile_archive_job(result: ArchiveJobResult) -> ArchiveJobResult:
+    """
+    adds the spans of a job to the profile of this process, and records the job
+    """
+    if result.profile is not None:
+        profiling.merge(result.profile)
+    profiling.record(archive=result.key, ok=result.exception is None, time=result.time, size=result.size,
+                     retries=result.retry_count, reparsed_size=result.reparsed_size)
+    return result
+
+
+def _run_archive_job(key, hints_entry, read_func, *args) -> ArchiveJobResult:
+    """
+    times :read_func: and collects its output, exception and interpreter hints into an ArchiveJobResult
+    :param key: the address or name of the archive in the interpreter hints
+    :param hints_entry: the interpreter hints of the archive, see InterpreterHints.get
+    :param read_func: takes the hints and :args:, and returns the archive and the output text
+    """
+    result = ArchiveJobResult(key)
+    hints = dumper.InterpreterHints()
+    if hints_entry is not None:
+        hints.update(key, *hints_entry)
+    start_time = time.perf_counter()
+    try:
+        archive, result.text = read_func(hints, *args)
+        result.size = archive.size
+        result.reparsed_size = archive.reparsed_size
+        result.retry_count = archive.retry_count
+    except Exception as e:
+        result.exception = e
+    result.time = time.perf_counter() - start_time
+    result.hints = hints.get(key)
+    if profiling.is_enabled():
+        result.profile = profiling.collect()
+    return result
+
+
+def read_archive_job(job) -> ArchiveJobResult:
+    """
+    reads a non-compressed archive from the ROM of the job process
+    :param job: (archive address, size or None, label to build the archive with or None, interpreter hints)
+    """
+    archive_ptr, size, label, hints_entry = job
+
+    def read(hints):
+        archive = dumper.TextScriptArchive.read_script(dumper.DumpSession(archive_ptr), archive_ptr, _job_rom, size,
+                                                       hints, archive_ptr)
+        return archive, archive.build(label) if label is not None else None
+    return _run_archive_job(archive_ptr, hints_entry, read)
+
+
+def read_compressed_archive_job(job) -> ArchiveJobResult:
+    """
+    decompresses an archive from the ROM of the job process, reads it and verifies it against its binary
+    :param job: (archive address, interpreter hints)
+    """
+    archive_ptr, hints_entry = job
+
+    def read(hints):
+        with profiling.span('decompress') as span:
+            data, compressed_size = lz77.decompress(_job_rom, archive_ptr)
+            span.size = len(data)
+        size = len(data) - 4 # must not account for the compression header!
+        archive = dumper.TextScriptArchive.read_script(dumper.DumpSession(archive_ptr), 4, data, size,
+                                                       hints, archive_ptr)
+
+        # test matching
+        mismatch = archive.verify_against(memoryview(data)[4:])
+        if mismatch is not None:
+            raise TextScriptScannerException('archive {archive_ptr:X} does not match binary input: {mismatch}'.format(**vars()))
+        return archive, None
+    return _run_archive_job(archive_ptr, hints_entry, read)
+
+
+def dump_compressed_textscript_job(job) -> ArchiveJobResult:
+    """
+    decompresses a *.s.lz archive of the repository in memory, and dumps it into the content of its *.s
+    :param job: (path to the *.s.lz, interpreter hints)
+    """
+    path, hints_entry = job
+    filename = os.path.basename(path)
+
+    def read(hints):
+        with open(path, 'rb') as lz_file:
+            with profiling.span('decompress') as span:
+                data, compressed_size = lz77.decompress(lz_file.read())
+                span.size = len(data)
+
+        # dump into a *.s
+        archive = dumper.TextScriptArchive.read_script(dumper.DumpSession(), 4, data, len(data) - 4,
+                                                       hints, filename)
+
+        # modify content for integration
+        content = io.StringIO()
+        content.write('\t.include "charmap.inc"\n')
+        content.write('\t.include "include/macros/enum.inc"\n')
+        content.write('\t.include "include/bytecode/text_script.inc"\n')
+        label = filename[:filename.rindex('.')]
+        label = label[:label.rindex('.')]
+        content.write('\n\t.data\n\n')
+        content.write('{label}::\n'.format(**vars()))
+
+        # make sure it actually compiles to the decompressed binary
+        mismatch = archive.verify_against(memoryview(data)[4:])
+        if mismatch is not None:
+            raise TextScriptScannerException('text archive {label} does not compile to the same binary: {mismatch}'.format(**vars()))
+
+        # write the compression header of 4 bytes
+        compression_header = int.from_bytes(data[:4], 'little')
+        content.write('\t.word 0x{0:X}\n\n'.format(compression_header))
+
+        # include dump, but without the byte alignment, labeled with the actual name of the file
+        archive.build_to(content, label, align=False)
+        return archive, content.getvalue()
+    return _run_archive_job(filename, hints_entry, read)
+
+
 def compute_continuous_buffer_segments(buffer_address: int, buffer_size: int, segments: List[Tuple[int, int]]) -> List[Tuple[int, int, bool]]:
     """
     given a buffer, and a list of segments with their base and size, this computes a list of tuples specifying the segment's
@@ -600,16 +976,17 @@ def compute_continuous_buffer_segments(buffer_address: int, buffer_size: int, se
 
 def _find_and_categorize_archive_units(source_units, compressed_archives):
     # find and filter out archives
+    unit_index = SourceUnitIndex(source_units)
     incbin_archives = []
     data_archives = []
     data_err_size_archives = []
     data_nested_archives = []
     other_archives = []
     for archive_ptr, archive_size in compressed_archives:
-        archive_unit = find_archive_unit(source_units, archive_ptr)
+        archive_unit = find_archive_unit(unit_index, archive_ptr)
         if archive_unit is None:
             # if the data hasn't been recovered yet from a big buffer
-            archive_in_unit = find_archive_in_unit(source_units, archive_ptr)
+            archive_in_unit = find_archive_in_unit(unit_index, archive_ptr)
             if archive_in_unit is not None:
                 data_nested_archives.append((DataUnit(archive_in_unit), archive_ptr, archive_size))
             else:
@@ -655,53 +1032,127 @@ def archive_get_incbin_path(archive_content):
 
 
 def find_archive(archives, ptr):
+    """
+    :param archives: list of (archive_ptr, size), or dict of the sizes by archive_ptr to look up in O(1)
+    :return: (archive_ptr, size) of the archive at :ptr:, or None
+    """
     if not ptr:
         return None
     ptr &= ~0x8000000
+    if isinstance(archives, dict):
+        if ptr in archives:
+            return ptr, archives[ptr]
+        return None
     for archive_ptr, size in archives:
         if ptr == archive_ptr:
             return archive_ptr, size
     return None
 
 
-# TODO: refactor those into their own appropriate module
-def find_archive_unit(source_units, archive_ptr):
-    archive_ptr |= 0x8000000
-    for source_unit in filter(lambda u: 'ea' in u and u['ea'] is not None, source_units):
-        if source_unit['ea'] == archive_ptr:
-            return source_unit
-    return None
-
-
-def find_archive_in_unit(source_units, archive_ptr):
-    archive_ptr |= 0x8000000
-    address_source_units = list(filter(lambda u: 'ea' in u and u['ea'] is not None, source_units))
-    for i, source_unit in enumerate(address_source_units):
-        if i != len(address_source_units) - 1:
-            if source_unit['ea'] < archive_ptr < address_source_units[i + 1]['ea']:
-                return source_unit
-    return None
+class SourceUnitIndex:
+    """
+    source units sorted by address, to look up the unit of an archive in O(log n) instead of going through all units.
+    a unit spans from its address up to the address of the next unit, so the last unit has no known end.
+    """
+    __slots__ = ('starts', 'units')
+
+    def __init__(self, source_units):
+        """
+        :param source_units: units as loaded by cache_load_source_units, or units by address as loaded by
+            cache_load_addressable_source_units. for units sharing an address, the first one is kept from a list
+            and the list of units is kept from a dict
+        """
+        if isinstance(source_units, dict):
+            units_by_address = {int(key, 16): unit for key, unit in source_units.items()}
+        else:
+            units_by_address = {}
+            for unit in filter(lambda u: 'ea' in u and u['ea'] is not None, source_units):
+                units_by_address.setdefault(unit['ea'], unit)
+        # addresses of the units in increasing order, with the 0x8000000 bit
+        self.starts = sorted(units_by_address.keys())
+        self.units = [units_by_address[address] for address in self.starts]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def unit_at(self, address: int):
+        """
+        :return: the unit starting at :address:, or None
+        """
+        address |= 0x8000000
+        i = bisect.bisect_left(self.starts, address)
+        if i != len(self.starts) and self.starts[i] == address:
+            return self.units[i]
+        return None
 
+    def unit_containing(self, address: int):
+        """
+        :return: the unit :address: is inside of, not at its start, or None.
+            None also past the start of the last unit, since its end is not known
+        """
+        address |= 0x8000000
+        i = bisect.bisect_left(self.starts, address)
+        if i == 0 or i == len(self.starts) or self.starts[i] == address:
+            return None
+        return self.units[i - 1]
+
+    def next_unit_address(self, address: int) -> int or None:
+        """
+        :return: the address of the first unit after :address:, with the 0x8000000 bit, or None
+        """
+        address |= 0x8000000
+        i = bisect.bisect_right(self.starts, address)
+        if i == len(self.starts):
+            return None
+        return self.starts[i]
+
+    def next_unit_after(self, address: int):
+        """
+        :return: the first unit after :address:, or None
+        """
+        i = bisect.bisect_right(self.starts, address | 0x8000000)
+        if i == len(self.starts):
+            return None
+        return self.units[i]
+
+
+def find_archive_unit(unit_index: SourceUnitIndex, archive_ptr):
+    return unit_index.unit_at(archive_ptr)
+
+
+def find_archive_in_unit(unit_index: SourceUnitIndex, archive_ptr):
+    return unit_index.unit_containing(archive_ptr)
+
+
+def hash_source_tree() -> str:
+    """
+    fingerprints the source of the repository for the cached source units, see cache.hash_tree.
+    the folder the archives are dumped to is left out, otherwise every dump would invalidate them
+    """
+    return cache.hash_tree(definitions.ROM_REPO_DIR, exclude_dirs=(TEXTSCRIPT_DIR,))
 
-def cache_load_source_units(cache_path, recache=False):
-    if recache:
-        os.remove(cache_path)
 
-    source_units = cache_to_file(_convert_unit_class_to_dict, cache_path)
+def cache_load_source_units(recache=False):
+    """
+    reads the units of the source repository, or loads them from the cache if the source didn't change
+    :param recache: reads the repository even if its units are cached
+    """
+    source_units = cache.cached(_convert_unit_class_to_dict, 'source_units', (hash_source_tree(),), recache=recache)
 
     print('source_units', len(source_units))
     return source_units
 
-def cache_load_addressable_source_units(cache_path, recache=False):
-    if recache:
-        os.remove(cache_path)
-
+def cache_load_addressable_source_units(recache=False):
+    """
+    like cache_load_source_units, but joins the units by their address
+    """
     def load_and_join_source_units_by_address():
         units = _convert_unit_class_to_dict()
         units = join_source_units_by_address(units)
         return units
 
-    return cache_to_file(load_and_join_source_units_by_address, cache_path)
+    return cache.cached(load_and_join_source_units_by_address, 'addressable_source_units', (hash_source_tree(),),
+                        recache=recache)
 
 
 def join_source_units_by_address(source_units):
@@ -737,48 +1188,28 @@ def _convert_unit_class_to_dict():
     return units
 
 
-def cache_to_file(func, cache_path, *args, **kwargs):
-    """
-    caches the result of :func: to a file so that it doesn't have to be computed more than once
-    :param func: function with expensive computation
-    :param cache_path: file to cache to`
-    :param args: args to :func:
-    :param kwargs: kwargs to :func:
-    :return: results of func as cached in :path_name:
-    """
-    import json
-    if os.path.exists(cache_path):
-        # return deserialized output
-        with open(cache_path, 'r') as f:
-            return json.load(f)
-    else:
-        # compute and serialize to cache
-        res = func(*args, **kwargs)
-        with open(cache_path, 'w') as f:
-            json.dump(res, f)
-        return res
-
-
 def separate_archives_based_on_compression(rom_path, archives):
     compressed_archives = []
     regular_archives = []
-    with open(rom_path, 'rb') as rom_file:
-        for archive_ptr, archive_size in archives:
-            # size = getLZ77CompressedSize(rom_file, archive_ptr)
-            size = gbagfx_get_compressed_size_at(rom_file, archive_ptr & ~0x8000000)
-            if size is not None:
-                compressed_archives.append((archive_ptr, size))
-            else:
-                regular_archives.append((archive_ptr, archive_size))
+    rom = map_file(rom_path)
+    for archive_ptr, archive_size in archives:
+        # walks the compressed data in the ROM, without decompressing it
+        sizes = lz77.get_compressed_size(rom, archive_ptr & ~0x8000000)
+        if sizes is not None:
+            compressed_size, decompressed_size = sizes
+            # gbagfx pads compressed files to a multiple of 4 bytes, and so do the archives in the source
+            compressed_archives.append((archive_ptr, (compressed_size + 3) & ~3))
+        else:
+            regular_archives.append((archive_ptr, archive_size))
 
     return compressed_archives, regular_archives
 
 
-def cache_separate_archives_based_on_compression(archive_path, rom_path, archives):
-    # find the compressed and non-compressed archives and cache the result to disk
-    cache_path = os.path.join(definitions.CACHE_DIR, separate_archives_based_on_compression.__name__ + '.' + os.path.basename(archive_path) + '.cache')
-    return cache_to_file(separate_archives_based_on_compression, cache_path,
-                         rom_path, archives)
+def cache_separate_archives_based_on_compression(archive_path, rom_path, archives, recache=False):
+    # find the compressed and non-compressed archives and cache the result to disk.
+    # the result only depends on the ROM and the archives read from :archive_path:
+    return cache.cached(separate_archives_based_on_compression, separate_archives_based_on_compression.__name__,
+                        (cache.hash_file(rom_path), tuple(archives)), rom_path, archives, recache=recache)
 
 
 def process_archives(archive_path) -> List[int]:
@@ -816,115 +1247,28 @@ def read_archives(archives_path):
             }
     return out
 
-def gbagfx_get_compressed_size_at(rom_file, address):
-    decompressed_path = hex(address) + '.compsize.tmp'
-    compressed_path = decompressed_path + '.lz'
-    if gbagfx_decompress_at(rom_file, address, decompressed_path) != 0:
-        return None
-    if gbagfx_compress(decompressed_path, compressed_path) != 0:
-        raise IOError('could not compress file')
-    size = os.path.getsize(compressed_path)
-    os.remove(decompressed_path)
-    os.remove(compressed_path)
-    return size
-
-
-def getLZ77CompressedSize(bin_file, compressed_ea):
+def compress_file(input_path: str, output_lz_path: str) -> bool:
     """
-    Iterates the compressed data, and returns its size
-    :param compressed_ea: the linear address of the compressed data
-    :return: its size in bytes or <0 if this is an invalid format, decompressed size
+    compresses a file in process, to the same output gbagfx would produce. see lz77.compress.
+    an output that is already up to date isn't written, so that make doesn't rebuild what depends on it
+    :return: whether the output was written
     """
-    dataHeader = 0
-    original_addr = bin_file.tell()
-    bin_file.seek(compressed_ea)
-    chars = bin_file.read(4)
-    for i in range(len(chars)):
-        dataHeader |= chars[i] << 8*i
-    decompSize = (dataHeader & ~0xFF) >> 8
-
-    # compression type must match
-    if (dataHeader & 0xF0) >> 4 != 1:
-        return -1
-
-    # iterate, and figure out the number of bytes copied
-    size = 0
-    ea = compressed_ea + 4
-    # iterate the blocks and keep count of the data size
-    while size < decompSize:
-        # parse block flags (compressed or not)
-        bin_file.seek(ea)
-        flags = bin_file.read(1)[0]
-        ea += 1
-
-        # iterate the blocks, MSB first.
-        for i in range(7, -1, -1):
-            if flags & (1<<i):
-                # block i is compressed
-                bin_file.seek(ea)
-                chars = bin_file.read(2)
-                block = chars[0] + (chars[1] << 8)
-                size += ((block & 0xF0) >> 4) + 3
-                ea += 2
-                # check that the displacement doesn't underflow
-                disp = ((block & 0xFF00) >> (16-4)) | block & 0xF
-                if size - disp - 1 < 0:
-                    return -2
-            else:
-                # block i is uncompressed, it's just one byte
-                size += 1
-                ea += 1
-            # we might finish decompressing while processing blocks
-            if size >= decompSize:
-                # ensure that the rest of the flags are 0!
-                # this is a practical restriction. (likely true, not technically part of the specs)
-                for j in range(i, -1, -1):
-                    if flags & (1<<j) != 0:
-                        return -3
-                break
-
-    bin_file.seek(original_addr)
-    return (ea - compressed_ea, decompSize)
-
-
-
-def gbagfx_decompress_at(rom_file, compressed_data_address: int, output_path: str):
-    gbagfx_bin = os.path.join(definitions.ROM_REPO_DIR, 'tools', 'gbagfx', 'gbagfx')
-
-    # write from compressed data address onwards to a file. This is because size is not known, but the LZ77 decompression
-    # can tell
-    slice_file_path = output_path + '.tmp_slice.lz'
-    with open(slice_file_path, 'wb') as slice_file:
-        rom_file.seek(compressed_data_address)
-        slice_file.write(rom_file.read())
-
-    # decompress file
-    # status = os.system('{gbagfx_bin} {slice_file_path} {output_path} 2> /dev/null'.format(**vars()))
-    status = os.system('{gbagfx_bin} {slice_file_path} {output_path}'.format(**vars()))
-
-    if status != 0:
-        raise IOError('error: failed to decompress compressed archive {:07X}'.format(compressed_data_address))
-
-    os.remove(slice_file_path)
-
-
-def gbagfx_decompress(lz_path: str, output_bin_path: str):
-    gbagfx_bin = os.path.join(definitions.ROM_REPO_DIR, 'tools', 'gbagfx', 'gbagfx')
-
-    if not lz_path.endswith('.lz'):
-        raise ValueError('a compressed input file must end with .lz as that is expected by gbagfx')
-
-    return os.system('{gbagfx_bin} {lz_path} {output_bin_path}'.format(**vars()))
-
-
-
-def gbagfx_compress(input_path: str, output_lz_path: str):
-    gbagfx_bin = os.path.join(definitions.ROM_REPO_DIR, 'tools', 'gbagfx', 'gbagfx')
-
     if not output_lz_path.endswith('.lz'):
         raise ValueError('a compressed input file must end with .lz as that is expected by gbagfx')
 
-    return os.system('{gbagfx_bin} {input_path} {output_lz_path} '.format(**vars()))
+    with open(input_path, 'rb') as input_file:
+        data = input_file.read()
+    with profiling.span('compress', len(data)):
+        compressed = lz77.compress(data)
+    try:
+        with open(output_lz_path, 'rb') as output_file:
+            if output_file.read() == compressed:
+                return False
+    except OSError:
+        pass
+    with open(output_lz_path, 'wb') as output_file:
+        output_file.write(compressed)
+    return True
 
 
 # TODO: refactor this out into a module
@@ -1007,10 +1351,9 @@ class DataUnit:
 def write_subfile(input_path, output_path, start_address, size):
     start_address &= ~0x8000000
 
-    with open(input_path, 'rb') as input_file:
-        input_file.seek(start_address)
-        with open(output_path, 'wb') as output_file:
-            output_file.write(input_file.read(size))
+    input_data = map_file(input_path)
+    with open(output_path, 'wb') as output_file:
+        output_file.write(input_data[start_address:start_address + size])
 
 
 def source_relabel(old_label, new_label):
@@ -1024,24 +1367,25 @@ def source_relabel(old_label, new_label):
 
 
 def edit_source_file(s_path, content, replacement):
-    with open(s_path, 'r') as f:
-        file_data = f.read()
+    with profiling.span('source_edit') as span:
+        with open(s_path, 'r') as f:
+            file_data = f.read()
 
-    if content in file_data:
+        if content in file_data:
 
-        print('REPLACE ({s_path}): {replacement}'.format(**vars()))
-        file_data = file_data.replace(content, replacement)
+            print('REPLACE ({s_path}): {replacement}'.format(**vars()))
+            file_data = file_data.replace(content, replacement)
 
-    with open(s_path, 'w') as f:
-        f.write(file_data)
+        with open(s_path, 'w') as f:
+            f.write(file_data)
+        span.size = len(file_data)
 
 def size_scan_archives(bin_file, archives_path):
     archives = read_archives(archives_path)
     for archive_addr in archives.keys():
-        bin_file.seek(bin_file)
         # try to determine decompression size
-        size = getLZ77CompressedSize(archive_addr, bin_file)
-        if size < 0:
+        sizes = lz77.get_compressed_size(dumper.as_buffer(bin_file), archive_addr)
+        if sizes is None:
             # try to parse it as text script and get the size
             scr = dumper.read('./', )
 
@@ -0,0 +1,223 @@
+# long running server answering dump requests, so that editors and build scripts don't pay for a cold start each time
+import sys
+import os
+import stat
+import socket
+import json
+import socketserver
+import threading
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import text_script_dumper as dumper
+import definitions
+from common import map_file
+
+
+class TextScriptServerException(Exception): pass
+
+
+class TextScriptServer:
+    """
+    answers requests to dump archives, one JSON object per line. The compiled command database, the charmap
+    and the memory map of the ROM stay loaded between requests. The command database is loaded again when its ini
+    files change, see CommandDatabase.get, and the ROM is mapped again when it changes, see map_file.
+
+    requests are {"id": any, "cmd": "dump" | "ping", ...}, where the archive is either at "address" (int, or a string
+    like "0x6C580C") in the ROM of the server, or "data", the hex of the bytes of an archive at offset 0.
+    optional: "size" of the archive, "label" to build it with.
+    responses are {"id": id of the request, "ok": true, ...} or {"id": ..., "ok": false, "error": message}:
+    - dump: "text", the built archive, "end", the address after the archive, and "errors", the non critical errors
+    there is no request to serialize a .s back to bytes, since the dumper has no parser for its own output
+    """
+    def __init__(self, rom_path: str=None, ini_dir: str=None, cache_dir: str=definitions.CACHE_DIR):
+        """
+        :param rom_path: file archives are read from by default. defaults to ModuleState.ROM_PATH
+        :param ini_dir: directory of the command database ini files. defaults to ModuleState.INI_DIR
+        :param cache_dir: directory the interpreter hints are saved to
+        """
+        self.rom_path = rom_path if rom_path is not None else dumper.ModuleState.ROM_PATH
+        self.ini_dir = ini_dir
+        self.cache_dir = cache_dir
+        # interpreter hints of the current command database, saved when the database changes and on shutdown
+        self.hints = None
+        self.hints_database = None
+        self.lock = threading.Lock()
+
+    def get_hints(self, command_context: dumper.CommandContext) -> dumper.InterpreterHints:
+        """
+        :return: the interpreter hints of the command database of :command_context:
+        """
+        with self.lock:
+            if self.hints_database is not command_context.database:
+                if self.hints is not None:
+                    self.hints.save()
+                self.hints = dumper.InterpreterHints.load(dumper.InterpreterHints.get_path(command_context, self.cache_dir))
+                self.hints_database = command_context.database
+            return self.hints
+
+    def save(self):
+        with self.lock:
+            if self.hints is not None:
+                self.hints.save()
+
+    @staticmethod
+    def parse_int(value) -> int or None:
+        if value is None or isinstance(value, int):
+            return value
+        return int(value, 0)
+
+    def read(self, request: dict) -> (dumper.DumpSession, dumper.TextScriptArchive):
+        """
+        reads the archive of :request:
+        :return: the session it was read with, and the archive
+        """
+        size = TextScriptServer.parse_int(request.get('size'))
+        if 'data' in request:
+            address = 0
+            buffer = bytes.fromhex(request['data'])
+        elif 'address' in request:
+            address = TextScriptServer.parse_int(request['address'])
+            buffer = map_file(self.rom_path)
+        else:
+            raise TextScriptServerException('expected an address or data')
+
+        command_context = dumper.DumpSession(address, self.ini_dir)
+        # archives sent as data have no address to keep hints for
+        hints = self.get_hints(command_context) if 'data' not in request else None
+        archive = dumper.TextScriptArchive.read_script(command_context, address, buffer, size, hints)
+        return command_context, archive
+
+    def handle(self, request: dict) -> dict:
+        """
+        :param request: a decoded request, see TextScriptServer
+        :return: the response to encode
+        """
+        response = {'id': request.get('id') if isinstance(request, dict) else None}
+        start_time = time.perf_counter()
+        try:
+            if not isinstance(request, dict):
+                raise TextScriptServerException('expected a JSON object')
+            cmd = request.get('cmd')
+            if cmd == 'ping':
+                pass
+            elif cmd == 'dump':
+                command_context, archive = self.read(request)
+                response['text'] = archive.build(request.get('label'))
+                response['end'] = archive.addr + archive.size
+                response['errors'] = command_context.errors
+            else:
+                raise TextScriptServerException('unknown command {0}'.format(cmd))
+            response['ok'] = True
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        response['time'] = time.perf_counter() - start_time
+        return response
+
+    def handle_line(self, line: str) -> str:
+        """
+        same as handle, from and to a line of JSON
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({'id': None, 'ok': False, 'error': 'invalid JSON: {0}'.format(e)})
+        return json.dumps(self.handle(request))
+
+    def serve_stream(self, input_stream, output_stream, num_threads: int=1):
+        """
+        answers the requests read from :input_stream: until it ends. With more than one thread, requests are handled
+        concurrently and responses are written as they complete, to be matched to their request by id
+        :param input_stream: text stream of requests, like stdin
+        :param output_stream: text stream to write the responses to, like stdout
+        :param num_threads: number of requests handled at the same time
+        """
+        output_lock = threading.Lock()
+
+        def respond(line):
+            response = self.handle_line(line)
+            with output_lock:
+                output_stream.write(response + '\n')
+                output_stream.flush()
+
+        with ThreadPoolExecutor(num_threads) as executor:
+            for line in input_stream:
+                if line.strip():
+                    if num_threads <= 1:
+                        respond(line)
+                    else:
+                        executor.submit(respond, line)
+        self.save()
+
+    @staticmethod
+    def remove_stale_socket(socket_path: str):
+        """
+        removes the socket at :socket_path: if no server listens on it anymore
+        :raises TextScriptServerException: if :socket_path: is not a socket, or a server listens on it
+        """
+        try:
+            mode = os.stat(socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise TextScriptServerException('{0} exists and is not a socket'.format(socket_path))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(socket_path)
+            except ConnectionRefusedError:
+                os.remove(socket_path)
+                return
+        raise TextScriptServerException('a server is already listening on {0}'.format(socket_path))
+
+    def serve_socket(self, socket_path: str):
+        """
+        answers requests on a Unix socket at :socket_path: until interrupted. Every connection is handled in its own
+        thread, and its requests are answered in order.
+        a socket left at :socket_path: by a server that is gone is replaced, anything else there is an error
+        """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    line = line.decode('utf-8')
+                    if line.strip():
+                        self.wfile.write((server.handle_line(line) + '\n').encode('utf-8'))
+                        self.wfile.flush()
+
+        TextScriptServer.remove_stale_socket(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as socket_server:
+            socket_server.daemon_threads = True
+            try:
+                socket_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(socket_path)
+                self.save()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Serves TextScript dump requests as JSON lines, see TextScriptServer')
+    parser.add_argument('-f', '--file', help='file to parse from by default, usually the ROM.')
+    parser.add_argument('-i', '--ini_dir', help='directory of command database ini files to use')
+    parser.add_argument('--socket', help='serves on a Unix socket at this path instead of stdin and stdout')
+    parser.add_argument('--threads', type=int, default=1, help='number of stdin requests handled concurrently')
+    args = parser.parse_args(argv[1:])
+
+    server = TextScriptServer(args.file, args.ini_dir)
+    # load the command database and map the ROM before the first request
+    server.get_hints(dumper.DumpSession(0, args.ini_dir))
+    if os.path.exists(server.rom_path):
+        map_file(server.rom_path)
+
+    if args.socket:
+        server.serve_socket(args.socket)
+    else:
+        server.serve_stream(sys.stdin, sys.stdout, args.threads)
+
+
+if __name__ == '__main__':
+    main(sys.argv)